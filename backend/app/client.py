@@ -1,31 +1,106 @@
+import asyncio
 import os
-import google.auth
-from google import genai
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Get credentials and project ID from the environment
-try:
-    credentials, project_id = google.auth.default()
-    if not project_id:
-        project_id = os.getenv("GCLOUD_PROJECT_ID")
-except google.auth.exceptions.DefaultCredentialsError:
-    raise RuntimeError(
-        "Could not find default credentials. Please set up Application Default Credentials."
-        "See https://cloud.google.com/docs/authentication/provide-credentials-adc for more information."
-    )
-
-GCLOUD_LOCATION = os.getenv("GCLOUD_LOCATION")
-if not GCLOUD_LOCATION:
-    raise ValueError("GCLOUD_LOCATION not found in .env file")
-
-# Initialize the Vertex AI client
-# This client can be shared across different services.
-client = genai.Client(project=project_id, location=GCLOUD_LOCATION)
+# Which model backend to use: "gemini" (Vertex AI) or "fake", a local,
+# deterministic stand-in for development, tests and benchmarks.
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "gemini")
+if MODEL_BACKEND not in ("gemini", "fake"):
+    raise ValueError(f"Unknown MODEL_BACKEND: {MODEL_BACKEND}")
 
 # Model for general chat and transcription
 MODEL_NAME = "gemini-2.5-pro"
 
 # Model for text-to-speech. Using a preview model as per documentation.
-TTS_MODEL_NAME = "gemini-2.5-flash-preview-tts" 
\ No newline at end of file
+TTS_MODEL_NAME = "gemini-2.5-flash-preview-tts"
+
+# Seconds after a failed attempt to create the client before another one is
+# made; until then, callers get the failure at once.
+MODEL_CLIENT_RETRY_INTERVAL = float(os.getenv("MODEL_CLIENT_RETRY_INTERVAL", "30"))
+
+_client = None
+# The attempt to create the client in progress, shared by all callers.
+_creating: asyncio.Task | None = None
+_failure: Exception | None = None
+_failed_at = 0.0
+
+
+def _create_client():
+    if MODEL_BACKEND == "fake":
+        from .fake_client import FakeClient
+
+        return FakeClient()
+
+    import google.auth
+    from google import genai
+
+    # Get credentials and project ID from the environment
+    try:
+        credentials, project_id = google.auth.default()
+        if not project_id:
+            project_id = os.getenv("GCLOUD_PROJECT_ID")
+    except google.auth.exceptions.DefaultCredentialsError:
+        raise RuntimeError(
+            "Could not find default credentials. Please set up Application Default Credentials."
+            "See https://cloud.google.com/docs/authentication/provide-credentials-adc for more information."
+        )
+
+    GCLOUD_LOCATION = os.getenv("GCLOUD_LOCATION")
+    if not GCLOUD_LOCATION:
+        raise ValueError("GCLOUD_LOCATION not found in .env file")
+
+    # Initialize the Vertex AI client
+    return genai.Client(project=project_id, location=GCLOUD_LOCATION)
+
+
+async def get_client():
+    """
+    Returns the model client shared by all services, creating it on first
+    use. Nothing is loaded or looked up at import, so a credentials problem
+    fails the requests that need the model (and readiness) rather than the
+    whole process.
+    """
+    if _client is None:
+        await warm_up_client()
+    return _client
+
+
+def is_client_ready() -> bool:
+    return _client is not None
+
+
+async def warm_up_client():
+    """
+    Creates the client off the event loop, since looking up credentials may
+    block on the network (e.g. the metadata server). Concurrent callers wait
+    for the same attempt. After a failure, callers get the error without a
+    new attempt until MODEL_CLIENT_RETRY_INTERVAL has passed.
+    """
+    global _creating
+    if _client is not None:
+        return
+    if _failure is not None and time.monotonic() - _failed_at < MODEL_CLIENT_RETRY_INTERVAL:
+        raise RuntimeError(f"The model client is unavailable: {_failure}")
+    if _creating is None:
+        _creating = asyncio.create_task(_create())
+    try:
+        # Shielded: a caller giving up does not cancel the attempt for the others.
+        await asyncio.shield(_creating)
+    except Exception as e:
+        raise RuntimeError(f"The model client is unavailable: {e}") from e
+
+
+async def _create():
+    global _client, _creating, _failure, _failed_at
+    try:
+        _client = await asyncio.to_thread(_create_client)
+        _failure = None
+    except Exception as e:
+        _failure = e
+        _failed_at = time.monotonic()
+        raise
+    finally:
+        _creating = None
@@ -1,24 +1,107 @@
+import asyncio
 import os
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
 from dotenv import load_dotenv
+from .metrics import mongo_command_seconds
 
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+# "mongodb" or "memory", an in-process stand-in (needs mongomock-motor) for
+# development, tests and benchmarks. Data is lost on restart.
+MONGO_BACKEND = os.getenv("MONGO_BACKEND", "mongodb")
+# Seconds finished background jobs are kept before MongoDB deletes them.
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
 
-client = AsyncIOMotorClient(MONGO_URI)
+
+
+class _CommandTimer(monitoring.CommandListener):
+    """
+    Records the latency of every command the driver sends.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongo_command_seconds.observe(event.duration_micros / 1e6, command=event.command_name, outcome="ok")
+
+    def failed(self, event):
+        mongo_command_seconds.observe(event.duration_micros / 1e6, command=event.command_name, outcome="error")
+
+
+if MONGO_BACKEND == "memory":
+    from mongomock_motor import AsyncMongoMockClient
+
+    client = AsyncMongoMockClient()
+else:
+    # connect=False: no connection (or SRV lookup) is made until first use,
+    # which happens in `connect_to_mongo` during startup.
+    client = AsyncIOMotorClient(MONGO_URI, connect=False, event_listeners=[_CommandTimer()])
 db = client.spec_drafter_db
 projects_collection = db.get_collection("projects")
+conversation_entries_collection = db.get_collection("conversation_entries")
+generated_artifacts_collection = db.get_collection("generated_artifacts")
+phase_summaries_collection = db.get_collection("phase_summaries")
+requirements_versions_collection = db.get_collection("requirements_versions")
+request_profiles_collection = db.get_collection("request_profiles")
+jobs_collection = db.get_collection("jobs")
+# One document per data migration that has finished, keyed by its name.
+migrations_collection = db.get_collection("migrations")
 
 
 async def connect_to_mongo():
     try:
         await client.admin.command("ping")
         print("Pinged your deployment. You successfully connected to MongoDB!")
+        await create_indexes()
     except Exception as e:
         print(e)
 
 
+async def ping_mongo(timeout: float = 2.0) -> bool:
+    """
+    Whether the database answers a ping within `timeout` seconds.
+    """
+    try:
+        await asyncio.wait_for(client.admin.command("ping"), timeout)
+        return True
+    except Exception:
+        return False
+
+
+async def create_indexes():
+    await asyncio.gather(
+        # Supports the project listing, which is sorted newest first and paged
+        # by (updatedAt, _id).
+        projects_collection.create_index([("updatedAt", -1), ("_id", -1)]),
+        conversation_entries_collection.create_index(
+            [("project_id", 1), ("seq", 1)], unique=True
+        ),
+        # Finds whether any entry still refers to a recording.
+        conversation_entries_collection.create_index("data.audio_ref.blob_id", sparse=True),
+        generated_artifacts_collection.create_index(
+            [("project_id", 1), ("kind", 1), ("variant", 1)], unique=True
+        ),
+        phase_summaries_collection.create_index(
+            [("project_id", 1), ("phase", 1)], unique=True
+        ),
+        # Also serves snapshot lookups, which filter on kind within this range.
+        requirements_versions_collection.create_index(
+            [("project_id", 1), ("version", -1)], unique=True
+        ),
+        request_profiles_collection.create_index([("created_at", -1)]),
+        # At most one queued or running job per distinct piece of work.
+        jobs_collection.create_index(
+            [("project_id", 1), ("kind", 1), ("variant", 1), ("key", 1)],
+            unique=True, partialFilterExpression={"active": True},
+        ),
+        jobs_collection.create_index([("project_id", 1), ("created_at", -1)]),
+        jobs_collection.create_index([("finished_at", 1)], expireAfterSeconds=JOB_RETENTION_SECONDS),
+    )
+
+
 async def close_mongo_connection():
     client.close()
     print("MongoDB connection closed.") 
\ No newline at end of file
@@ -0,0 +1,187 @@
+import asyncio
+import hashlib
+import io
+import math
+import os
+import struct
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, List
+from google.genai.types import (
+    Blob,
+    Candidate,
+    Content,
+    File,
+    FileState,
+    GenerateContentResponse,
+    GenerateContentResponseUsageMetadata,
+    Part,
+)
+
+# Words in each reply, and how they are streamed.
+FAKE_MODEL_TOKENS = int(os.getenv("FAKE_MODEL_TOKENS", "60"))
+FAKE_MODEL_THOUGHT_TOKENS = int(os.getenv("FAKE_MODEL_THOUGHT_TOKENS", "20"))
+FAKE_MODEL_TOKENS_PER_CHUNK = int(os.getenv("FAKE_MODEL_TOKENS_PER_CHUNK", "4"))
+# Seconds before the first chunk, and between chunks.
+FAKE_MODEL_FIRST_CHUNK_LATENCY = float(os.getenv("FAKE_MODEL_FIRST_CHUNK_LATENCY", "0.2"))
+FAKE_MODEL_CHUNK_LATENCY = float(os.getenv("FAKE_MODEL_CHUNK_LATENCY", "0.02"))
+# Seconds of speech generated per character of TTS input.
+FAKE_MODEL_SPEECH_SECONDS_PER_CHAR = float(os.getenv("FAKE_MODEL_SPEECH_SECONDS_PER_CHAR", "0.06"))
+# A prompt containing this marker gets a reply ending in [PHASE_COMPLETE].
+FAKE_MODEL_PHASE_COMPLETE_MARKER = "#phase-complete"
+
+_WORDS = (
+    "the system should let users create share and track requirements for each project "
+    "with clear roles secure access fast search offline support and detailed audit history"
+).split()
+_SAMPLE_RATE = 24000
+
+
+def _texts(contents: Any) -> List[str]:
+    """
+    Collects the text of a request's contents, in order.
+    """
+    if isinstance(contents, str):
+        return [contents]
+    if isinstance(contents, Part):
+        return [contents.text] if contents.text else []
+    if isinstance(contents, Content):
+        return [part.text for part in contents.parts or [] if part.text]
+    if isinstance(contents, (list, tuple)):
+        return [text for item in contents for text in _texts(item)]
+    return []
+
+
+def _has_audio(contents: Any) -> bool:
+    if isinstance(contents, File):
+        return True
+    if isinstance(contents, Part):
+        return bool(contents.inline_data and (contents.inline_data.mime_type or "").startswith("audio/"))
+    if isinstance(contents, Content):
+        return any(_has_audio(part) for part in contents.parts or [])
+    if isinstance(contents, (list, tuple)):
+        return any(_has_audio(item) for item in contents)
+    return False
+
+
+def _words(seed: str, count: int) -> List[str]:
+    """
+    Deterministic pseudo-random words derived from `seed`.
+    """
+    words = []
+    digest = b""
+    for i in range(count):
+        if i % 32 == 0:
+            digest = hashlib.sha256(f"{seed}:{i}".encode("utf-8")).digest()
+        words.append(_WORDS[digest[i % 32] % len(_WORDS)])
+    return words
+
+
+def _speech_pcm(text: str) -> bytes:
+    """
+    A quiet tone whose length grows with the text, as 24kHz 16-bit mono PCM.
+    """
+    samples = max(1, int(len(text) * FAKE_MODEL_SPEECH_SECONDS_PER_CHAR * _SAMPLE_RATE))
+    pitch = 200 + int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:2], 16)
+    period = [int(3000 * math.sin(2 * math.pi * pitch * n / _SAMPLE_RATE)) for n in range(_SAMPLE_RATE // 10)]
+    one_period = struct.pack(f"<{len(period)}h", *period)
+    repeats = samples // len(period) + 1
+    return (one_period * repeats)[: samples * 2]
+
+
+def _response(parts: List[Part], output_tokens: int = 0, thought_tokens: int = 0) -> GenerateContentResponse:
+    return GenerateContentResponse(
+        candidates=[Candidate(content=Content(role="model", parts=parts))],
+        usage_metadata=GenerateContentResponseUsageMetadata(
+            candidates_token_count=output_tokens or None,
+            thoughts_token_count=thought_tokens or None,
+        ),
+    )
+
+
+class _FakeModels:
+    def _reply(self, contents: Any, config: Any) -> tuple[List[str], List[str]]:
+        """
+        Returns the thought and answer words for a request.
+        """
+        texts = _texts(contents)
+        seed = "\n".join(texts)
+        if _has_audio(contents):
+            return [], ["Fake", "transcript", "of", "the", "recording."]
+        thoughts = []
+        config_thinking = getattr(config, "thinking_config", None)
+        if config_thinking and config_thinking.include_thoughts:
+            thoughts = _words(f"thought:{seed}", FAKE_MODEL_THOUGHT_TOKENS)
+        answer = _words(seed, FAKE_MODEL_TOKENS)
+        latest = contents[-1] if isinstance(contents, (list, tuple)) and contents else contents
+        if any(FAKE_MODEL_PHASE_COMPLETE_MARKER in text for text in _texts(latest)):
+            answer.append("[PHASE_COMPLETE]")
+        return thoughts, answer
+
+    async def generate_content(self, model: str, contents: Any, config: Any = None) -> GenerateContentResponse:
+        await asyncio.sleep(FAKE_MODEL_FIRST_CHUNK_LATENCY)
+        if config is not None and "AUDIO" in (config.response_modalities or []):
+            pcm = _speech_pcm("\n".join(_texts(contents)))
+            return _response([Part(inline_data=Blob(data=pcm, mime_type=f"audio/L16;rate={_SAMPLE_RATE}"))])
+        if config is not None and config.response_mime_type == "application/json":
+            return _response([Part(text="[0]")], 1)
+        thoughts, answer = self._reply(contents, config)
+        parts = [Part(text=" ".join(answer))]
+        if thoughts:
+            parts.insert(0, Part(text=" ".join(thoughts), thought=True))
+        return _response(parts, len(answer), len(thoughts))
+
+    async def generate_content_stream(self, model: str, contents: Any, config: Any = None) -> AsyncIterator[GenerateContentResponse]:
+        thoughts, answer = self._reply(contents, config)
+
+        async def stream():
+            await asyncio.sleep(FAKE_MODEL_FIRST_CHUNK_LATENCY)
+            for words, thought in ((thoughts, True), (answer, False)):
+                for start in range(0, len(words), FAKE_MODEL_TOKENS_PER_CHUNK):
+                    text = " ".join(words[start:start + FAKE_MODEL_TOKENS_PER_CHUNK]) + " "
+                    last = not thought and start + FAKE_MODEL_TOKENS_PER_CHUNK >= len(words)
+                    yield _response(
+                        [Part(text=text, thought=thought or None)],
+                        len(answer) if last else 0,
+                    )
+                    await asyncio.sleep(FAKE_MODEL_CHUNK_LATENCY)
+
+        return stream()
+
+
+class _FakeFiles:
+    def __init__(self):
+        self._files: dict[str, File] = {}
+
+    async def upload(self, file: Any, config: Any = None) -> File:
+        if isinstance(file, (str, os.PathLike)):
+            size = os.path.getsize(file)
+        elif isinstance(file, io.IOBase):
+            size = len(file.read())
+        else:
+            size = 0
+        mime_type = (config or {}).get("mime_type") if isinstance(config, dict) else None
+        name = f"files/fake-{len(self._files)}"
+        uploaded = File(name=name, mime_type=mime_type, size_bytes=size, state=FileState.ACTIVE)
+        self._files[name] = uploaded
+        return uploaded
+
+    async def get(self, name: str) -> File:
+        return self._files[name]
+
+    async def delete(self, name: str):
+        self._files.pop(name, None)
+
+
+class FakeClient:
+    """
+    Deterministic stand-in for `genai.Client`, selected with
+    MODEL_BACKEND=fake. It needs no credentials or network: replies are
+    pseudo-random words derived from the prompt, streamed with configurable
+    size and latency, with thoughts when requested; TTS returns a tone as
+    PCM, and audio prompts get a fixed transcript.
+    """
+
+    def __init__(self):
+        models = _FakeModels()
+        files = _FakeFiles()
+        self.aio = SimpleNamespace(models=models, files=files)
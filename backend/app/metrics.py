@@ -0,0 +1,223 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+# Set to "false" to turn off OpenTelemetry spans even when the SDK is installed.
+OTEL_SPANS_ENABLED = os.getenv("OTEL_SPANS_ENABLED", "true").lower() != "false"
+
+_tracer = trace.get_tracer("specdrafter") if trace is not None and OTEL_SPANS_ENABLED else None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        # Metrics are also updated from driver and executor threads.
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = list(self._values.items())
+        lines.extend(f"{self.name}{_label_text(self.label_names, key)} {value}" for key, value in items)
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels: str):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels: str) -> Iterator[None]:
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+        # Per label set: [count per bucket (the last is +Inf), sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                bucket_labels = _label_text(self.label_names, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            cumulative += counts[-1]
+            bucket_labels = _label_text(self.label_names, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.label_names, key)} {total}")
+            lines.append(f"{self.name}_count{_label_text(self.label_names, key)} {cumulative}")
+        return lines
+
+
+registry: List[_Metric] = []
+
+
+def render_metrics() -> str:
+    """
+    Renders every metric in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[None]:
+    """
+    Wraps a block in an OpenTelemetry span when the SDK is installed and
+    enabled; otherwise does nothing.
+
+    The span is not made current, so it is safe around the `yield` of an
+    async generator, which may be resumed or closed from another context.
+    """
+    if _tracer is None:
+        yield
+        return
+    current = _tracer.start_span(name, attributes=attributes)
+    try:
+        yield
+    except Exception as e:
+        current.record_exception(e)
+        raise
+    finally:
+        current.end()
+
+
+model_first_chunk_seconds = Histogram(
+    "specdrafter_model_first_chunk_seconds",
+    "Time from sending a model request to receiving its first chunk.",
+    ("endpoint", "model"),
+)
+model_call_seconds = Histogram(
+    "specdrafter_model_call_seconds",
+    "Total duration of a model call, including streaming.",
+    ("endpoint", "model", "outcome"),
+)
+model_queue_seconds = Histogram(
+    "specdrafter_model_queue_seconds",
+    "Time a model call waited for a concurrency slot.",
+    ("endpoint",),
+)
+model_retries_total = Counter(
+    "specdrafter_model_retries_total",
+    "Model calls retried after a rate-limit or server error.",
+    ("endpoint", "code"),
+)
+model_calls_in_flight = Gauge(
+    "specdrafter_model_calls_in_flight",
+    "Model calls currently running.",
+    ("endpoint",),
+)
+files_api_seconds = Histogram(
+    "specdrafter_files_api_seconds",
+    "Duration of Files API operations.",
+    ("operation",),
+)
+audio_conversion_seconds = Histogram(
+    "specdrafter_audio_conversion_seconds",
+    "Time spent decoding and converting audio in the worker pool.",
+    ("mode",),
+)
+mongo_command_seconds = Histogram(
+    "specdrafter_mongo_command_seconds",
+    "MongoDB command latency.",
+    ("command", "outcome"),
+)
+sse_stream_bytes = Histogram(
+    "specdrafter_sse_stream_bytes",
+    "Bytes sent per server-sent event stream.",
+    ("stream",),
+    SIZE_BUCKETS,
+)
+sse_stream_events = Histogram(
+    "specdrafter_sse_stream_events",
+    "Events sent per server-sent event stream.",
+    ("stream",),
+    COUNT_BUCKETS,
+)
+sse_streams_in_flight = Gauge(
+    "specdrafter_sse_streams_in_flight",
+    "Server-sent event streams currently open.",
+    ("stream",),
+)
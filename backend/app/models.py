@@ -19,9 +19,14 @@ class SpecPhase(str, Enum):
     COMPLETED = "Completed"
 
 class ConversationEntry(BaseModel):
+    seq: Optional[int] = None
     role: str
     content: str
     data: Optional[dict] = None
+    # The specification phase the project was in when the entry was written.
+    phase: Optional[SpecPhase] = None
+    # Size of `content` in model tokens (exact for replies, estimated otherwise).
+    token_count: Optional[int] = None
     timestamp: datetime = Field(default_factory=datetime.now)
 
     @field_validator('timestamp', mode='before')
@@ -39,7 +44,7 @@ class ConversationEntry(BaseModel):
         return v
 
 class RequirementsVersion(BaseModel):
-    version: str = "1.0"
+    version: int
     content: str
     created_at: datetime = Field(default_factory=datetime.now)
 
@@ -55,12 +60,27 @@ class RequirementsVersion(BaseModel):
                 raise ValueError(f"Unable to parse created_at string: {v}")
         return v
 
+class RequirementsVersionSummary(BaseModel):
+    version: int
+    # "snapshot" (stored in full) or "delta" (stored as changes to the previous version).
+    kind: str
+    # Stored size in characters.
+    size: int
+    created_at: datetime
+
 
 class Project(BaseModel):
     id: PyObjectId = Field(default_factory=ObjectId, alias="_id")
     name: str = "New Project"
     description: str = ""
+    # Entries live in the conversation_entries collection; this list is only
+    # populated when the full history is explicitly requested.
     conversation_history: List[ConversationEntry] = []
+    # Next sequence number to hand out. Reserved numbers that were never used
+    # leave gaps, so this is an upper bound on the number of entries.
+    conversation_length: int = 0
+    # Bumped by every write to the project, so its version tag always changes.
+    revision: int = 0
     current_phase: SpecPhase = SpecPhase.FOUNDATION
     requirements: dict = Field(default_factory=dict)
     createdAt: datetime = Field(default_factory=datetime.now)
@@ -84,6 +104,36 @@ class Project(BaseModel):
         json_encoders={ObjectId: str},
     )
 
+class RequestProfileSummary(BaseModel):
+    request_id: str
+    method: str
+    path: str
+    status_code: Optional[int] = None
+    duration_seconds: float
+    # "pyinstrument" or "cprofile", which decides the download formats.
+    profiler: str
+    created_at: datetime
+
+
+class ProjectSummary(BaseModel):
+    """
+    The fields needed to list projects. Kept separate from `Project` so that
+    listing only reads and validates a handful of fields per document.
+    """
+    id: PyObjectId = Field(alias="_id")
+    name: str = "New Project"
+    current_phase: SpecPhase = SpecPhase.FOUNDATION
+    createdAt: datetime
+    updatedAt: datetime
+
+    model_config = ConfigDict(populate_by_name=True)
+
+class ConversationPage(BaseModel):
+    entries: List[ConversationEntry]
+    has_more: bool = False
+    # Pass as `before` (or `after` when paging forward) to fetch the next page.
+    next_cursor: Optional[int] = None
+
 class ChatRequest(BaseModel):
     content: Optional[str] = None
     data: Optional[dict] = None
@@ -93,6 +143,36 @@ class EditRequest(BaseModel):
 
 class GeneratePrdRequest(BaseModel):
     target: str = "Cursor"
+    # Build the PRD from cached summaries of finished phases instead of the
+    # full transcript.
+    incremental: bool = False
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+class Job(BaseModel):
+    """
+    A background PRD generation or review.
+    """
+    id: PyObjectId = Field(alias="_id")
+    project_id: PyObjectId
+    # "prd" or "review"
+    kind: str
+    variant: str
+    status: JobStatus
+    # The output so far; from `output_offset` on when polling with an offset.
+    output: str = ""
+    output_offset: int = 0
+    output_length: int = 0
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    model_config = ConfigDict(populate_by_name=True)
 
 class TextToSpeechRequest(BaseModel):
     text: str
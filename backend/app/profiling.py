@@ -0,0 +1,141 @@
+import asyncio
+import cProfile
+import hmac
+import json
+import marshal
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from .services.profiles import save_profile
+
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+# Requests carrying this token in the X-Profile-Token header are profiled,
+# and the token is needed to download profiles. Unset disables both.
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+# Fraction of all requests to profile, e.g. 0.001.
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Seconds between pyinstrument samples.
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))
+# The middleware is only installed when profiling can happen at all.
+PROFILING_ENABLED = bool(PROFILE_ADMIN_TOKEN) or PROFILE_SAMPLE_RATE > 0
+
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+# cProfile hooks the whole thread, so only one request is profiled with it at a time.
+_cprofile_lock = threading.Lock()
+_pending_saves: set[asyncio.Task] = set()
+
+
+def is_admin_token(token: str | None) -> bool:
+    return bool(PROFILE_ADMIN_TOKEN) and token is not None and hmac.compare_digest(token.encode(), PROFILE_ADMIN_TOKEN.encode())
+
+
+class _RequestProfiler:
+    """
+    Profiles one request with pyinstrument when it is installed, otherwise
+    with cProfile.
+
+    pyinstrument's async mode attributes time to the request's own task and
+    the tasks it starts (such as a chat turn's producer), including time
+    spent inside streaming response generators. cProfile sees everything on
+    the event loop thread while the request runs, so concurrent requests
+    show up in its profiles too.
+    """
+
+    def __init__(self):
+        self.kind = None
+        self._profiler = None
+
+    def start(self) -> bool:
+        if Profiler is not None:
+            self.kind = "pyinstrument"
+            self._profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+            self._profiler.start()
+            return True
+        if not _cprofile_lock.acquire(blocking=False):
+            return False
+        self.kind = "cprofile"
+        self._profiler = cProfile.Profile()
+        self._profiler.enable()
+        return True
+
+    def stop(self):
+        if self.kind == "pyinstrument":
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+            _cprofile_lock.release()
+
+    def dump(self) -> bytes:
+        if self.kind == "pyinstrument":
+            return json.dumps(self._profiler.last_session.to_json()).encode("utf-8")
+        self._profiler.create_stats()
+        return marshal.dumps(self._profiler.stats)
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that profiles requests sent with a valid X-Profile-Token
+    header, and a PROFILE_SAMPLE_RATE fraction of the rest. The whole
+    response is profiled, streamed bodies included. Profiled responses carry
+    an X-Profile-Id header naming the stored profile: the request's
+    X-Request-ID if it sent a usable one, otherwise a new id.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # Downloading profiles is not itself worth profiling.
+        if scope["type"] != "http" or scope["path"].startswith("/profiles"):
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        token = headers.get(b"x-profile-token")
+        requested = token is not None and is_admin_token(token.decode("latin-1"))
+        if not requested and not (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE):
+            await self.app(scope, receive, send)
+            return
+
+        profiler = _RequestProfiler()
+        if not profiler.start():
+            await self.app(scope, receive, send)
+            return
+
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")
+        if not _REQUEST_ID.match(request_id):
+            request_id = uuid.uuid4().hex
+        status_code = None
+
+        async def send_with_profile_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", request_id.encode())]}
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profiler.stop()
+            duration = time.perf_counter() - started
+            # Saved in the background, so a cancelled request still keeps its profile.
+            task = asyncio.create_task(_save(profiler, request_id, scope["method"], scope["path"], status_code, duration))
+            _pending_saves.add(task)
+            task.add_done_callback(_pending_saves.discard)
+
+
+async def _save(profiler: _RequestProfiler, request_id: str, method: str, path: str, status_code: int | None, duration: float):
+    try:
+        data = await asyncio.to_thread(profiler.dump)
+        await save_profile(request_id, method, path, status_code, duration, profiler.kind, data)
+        print(f"Saved {profiler.kind} profile {request_id} for {method} {path} ({duration:.3f}s)")
+    except Exception as e:
+        print(f"Error saving profile {request_id}: {e}")
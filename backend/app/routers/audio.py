@@ -1,10 +1,20 @@
-from fastapi import APIRouter, HTTPException, Depends
+from typing import AsyncGenerator
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import Response, StreamingResponse
 from ..models import (
     TextToSpeechRequest,
     TextToSpeechResponse,
     TranscribeRequest,
 )
-from ..services.audio import generate_speech_audio, process_audio_input
+from ..services.audio import (
+    generate_speech_audio,
+    process_audio_input,
+    read_audio_upload,
+    stream_speech_audio,
+    transcribe_audio_bytes,
+)
+from ..services.tts_cache import tts_cache
+from ..services.blob_store import blob_store
 
 router = APIRouter(
     prefix="/audio",
@@ -17,7 +27,21 @@ async def transcribe_audio(request: TranscribeRequest):
     Transcribes audio and returns the text.
     """
     try:
-        transcript = process_audio_input(request.audio, request.mime_type)
+        transcript = await process_audio_input(request.audio, request.mime_type)
+        return {"transcript": transcript}
+    except Exception as e:
+        print(f"Error in transcribe endpoint: {e}")
+        raise HTTPException(status_code=500, detail="Failed to transcribe audio.")
+
+@router.post("/transcribe/upload")
+async def transcribe_audio_upload(request: Request):
+    """
+    Transcribes audio sent as the raw request body, with its mime type as the
+    Content-Type (e.g. audio/webm), and returns the text.
+    """
+    audio_bytes, mime_type = await read_audio_upload(request)
+    try:
+        transcript = await transcribe_audio_bytes(audio_bytes, mime_type)
         return {"transcript": transcript}
     except Exception as e:
         print(f"Error in transcribe endpoint: {e}")
@@ -29,9 +53,62 @@ async def text_to_speech(request: TextToSpeechRequest):
     Synthesizes speech from text and returns it as a base64 encoded audio string.
     """
     try:
-        audio_content = generate_speech_audio(request.text)
+        audio_content = await generate_speech_audio(request.text)
         return TextToSpeechResponse(audio_content=audio_content)
     except Exception as e:
         # Log the exception for debugging
         print(f"Error in text-to-speech endpoint: {e}")
-        raise HTTPException(status_code=500, detail="Failed to synthesize speech.") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Failed to synthesize speech.") 
+
+@router.post("/text-to-speech/stream")
+async def text_to_speech_stream(request: TextToSpeechRequest):
+    """
+    Synthesizes speech from text and streams it back as binary audio/wav.
+    Audio for the first sentence is sent as soon as it is ready, while the
+    rest of the text is still being synthesized.
+    """
+    if not request.text.strip():
+        raise HTTPException(status_code=400, detail="Text is empty.")
+    audio = stream_speech_audio(request.text)
+    # Wait for the first sentence before responding, so that if synthesis
+    # fails outright the client gets an error status instead of empty audio.
+    try:
+        first = await anext(audio)
+    except Exception as e:
+        await audio.aclose()
+        print(f"Error in text-to-speech stream endpoint: {e}")
+        raise HTTPException(status_code=500, detail="Failed to synthesize speech.")
+    return StreamingResponse(
+        _prepend(first, audio),
+        media_type="audio/wav",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _prepend(first: bytes, rest: AsyncGenerator[bytes, None]) -> AsyncGenerator[bytes, None]:
+    yield first
+    async for data in rest:
+        yield data
+
+@router.get("/text-to-speech/cache")
+async def text_to_speech_cache_stats():
+    """
+    Returns hit/miss counters and size of the text-to-speech cache.
+    """
+    return tts_cache.stats()
+
+
+@router.get("/recordings/{blob_id}")
+async def get_recording(blob_id: str):
+    """
+    Returns a stored voice recording referenced by a conversation entry's
+    `audio_ref.blob_id`.
+    """
+    try:
+        blob = await blob_store.get(blob_id)
+    except ValueError:
+        blob = None
+    if blob is None:
+        raise HTTPException(status_code=404, detail="Recording not found")
+    data, content_type = blob
+    return Response(content=data, media_type=content_type, headers={"Cache-Control": "private, max-age=31536000, immutable"})
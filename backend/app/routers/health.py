@@ -0,0 +1,32 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from ..client import is_client_ready
+from ..database import ping_mongo
+
+router = APIRouter(
+    prefix="/health",
+    tags=["health"],
+)
+
+
+@router.get("/live")
+def liveness():
+    """
+    The process is up and serving requests.
+    """
+    return {"status": "ok"}
+
+
+@router.get("/ready")
+async def readiness():
+    """
+    The database answers and the model client is set up. The client is not
+    created here; a failed warm-up is retried in the background.
+    """
+    database = await ping_mongo()
+    model = is_client_ready()
+    status_code = 200 if database and model else 503
+    return JSONResponse(
+        status_code=status_code,
+        content={"status": "ok" if status_code == 200 else "unavailable", "database": database, "model": model},
+    )
@@ -0,0 +1,44 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import Response
+from typing import List, Optional
+from ..models import RequestProfileSummary
+from ..profiling import PROFILE_ADMIN_TOKEN, is_admin_token
+from ..services import profiles
+
+router = APIRouter(
+    prefix="/profiles",
+    tags=["profiles"],
+)
+
+
+def require_admin_token(x_profile_token: Optional[str] = Header(None)):
+    if not PROFILE_ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Profiling is not enabled.")
+    if not is_admin_token(x_profile_token):
+        raise HTTPException(status_code=403, detail="A valid X-Profile-Token header is required.")
+
+
+@router.get("/", response_model=List[RequestProfileSummary], dependencies=[Depends(require_admin_token)])
+async def list_profiles(limit: int = 50):
+    """
+    Lists stored request profiles, newest first.
+    """
+    return await profiles.list_profiles(max(1, min(limit, 200)))
+
+
+@router.get("/{request_id}", dependencies=[Depends(require_admin_token)])
+async def download_profile(request_id: str, format: Optional[str] = None):
+    """
+    Downloads a request's profile. pyinstrument profiles are served as
+    speedscope JSON (open at https://www.speedscope.app) or as HTML
+    (`format=html`); cProfile ones as pstats (`format=pstats`, for snakeviz
+    or flameprof) or as text (`format=text`).
+    """
+    try:
+        profile = await profiles.get_profile(request_id, format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    data, media_type, filename = profile
+    return Response(content=data, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
@@ -1,11 +1,15 @@
 import re
 import json
 import asyncio
-from fastapi import APIRouter, HTTPException, Depends, Request, status
-from fastapi.responses import StreamingResponse, JSONResponse
-from typing import List
-from ..services import project_service, assistant
-from ..models import Project, ConversationEntry, RequirementsVersion, SpecPhase, EditRequest, GeneratePrdRequest
+from fastapi import APIRouter, HTTPException, Depends, Header, Request, Response, status
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from typing import List, Optional
+from datetime import datetime
+from bson import ObjectId
+from ..services import project_service, assistant, artifacts, context_cache, jobs, requirements_editor, requirements_versions, sse
+from ..services.unit_of_work import ChatTurn
+from ..services.audio import read_audio_upload
+from ..models import Project, ProjectSummary, ConversationEntry, ConversationPage, RequirementsVersion, RequirementsVersionSummary, SpecPhase, ChatRequest, EditRequest, GeneratePrdRequest, Job
 from pydantic import BaseModel
 
 router = APIRouter(
@@ -19,7 +23,8 @@ async def create_new_project():
     # Add initial welcome message to conversation history
     welcome_message = ConversationEntry(
         role="assistant",
-        content="Welcome to SpecDrafter! I'm here to help you draft your project requirements. Let's start with the first phase: **Foundation**. What is the core purpose of your application? Who are the target users?"
+        content="Welcome to SpecDrafter! I'm here to help you draft your project requirements. Let's start with the first phase: **Foundation**. What is the core purpose of your application? Who are the target users?",
+        phase=SpecPhase.FOUNDATION
     )
     new_project.conversation_history.append(welcome_message)
     
@@ -28,23 +33,59 @@ async def create_new_project():
         raise HTTPException(status_code=500, detail="Failed to create project")
     return created_project
 
-@router.get("/", response_model=List[Project], response_model_by_alias=True)
-async def list_projects():
+@router.get("/", response_model=List[ProjectSummary], response_model_by_alias=True)
+async def list_projects(limit: Optional[int] = None, before: Optional[datetime] = None, before_id: Optional[str] = None):
     """
-    Retrieve all projects.
+    List projects, most recently updated first. Only summary fields are returned.
+
+    To page, pass `limit`, then the last project's `updatedAt` and `_id` as
+    `before` and `before_id` for the next page.
     """
-    return await project_service.get_projects()
+    return await project_service.get_projects(limit=limit, before=before, before_id=before_id)
 
 @router.get("/{project_id}", response_model=Project, response_model_by_alias=True)
-async def get_project_details(project_id: str):
+async def get_project_details(project_id: str, response: Response, include_history: bool = False, if_none_match: Optional[str] = Header(None)):
     """
-    Retrieve a single project by its ID.
+    Retrieve a single project by its ID. The conversation history is only
+    included when requested; use the conversation endpoint to page through it.
+
+    The response carries an ETag; send it back as If-None-Match to get a 304
+    when nothing has changed.
     """
-    project = await project_service.get_project(project_id)
+    project = await project_service.get_project(project_id, include_history=include_history)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
+    etag = f'"{project_service.project_version(project.updatedAt, project.conversation_length, project.revision)}"'
+    if if_none_match == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
     return project
 
+@router.get("/{project_id}/version")
+async def get_project_version(project_id: str, response: Response):
+    """
+    Return the project's current version tag without loading the project.
+    Compare it with the `version` of the last project_update event to decide
+    whether a full refetch is needed.
+    """
+    version = await project_service.get_project_version(project_id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    response.headers["ETag"] = f'"{version}"'
+    return {"version": version}
+
+@router.get("/{project_id}/conversation", response_model=ConversationPage)
+async def get_conversation(project_id: str, limit: int = 50, before: Optional[int] = None, after: Optional[int] = None):
+    """
+    Page through a project's conversation. Without a cursor the latest entries
+    are returned; pass `next_cursor` back as `before` to load older entries, or
+    use `after` to page forward from a known sequence number.
+    """
+    project = await project_service.get_project(project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return await project_service.get_conversation_page(project_id, limit, before=before, after=after)
+
 @router.patch("/{project_id}", response_model=Project, response_model_by_alias=True)
 async def update_project_details(project_id: str, updates: dict):
     """
@@ -56,49 +97,102 @@ async def update_project_details(project_id: str, updates: dict):
     return updated_project
 
 @router.post("/{project_id}/chat")
-async def stream_chat(project_id: str, request: Request):
-    try:
-        body = await request.json()
-        messages = body.get("messages", [])
-
-        if not messages:
-            raise HTTPException(status_code=400, detail="No messages provided")
-
-        # The last message is the user's current message.
-        user_message = messages[-1]
-
-        # Ensure the project exists before doing anything else.
-        project = await project_service.get_project(project_id)
-        if not project:
-            raise HTTPException(status_code=404, detail="Project not found")
+async def stream_chat(project_id: str, message: ChatRequest):
+    """
+    Sends the user's new turn to the assistant and streams the response.
 
-        # Create a ConversationEntry to save to the database.
-        entry_content = user_message.get("content")
-        entry_data = user_message.get("data")
+    Only the new message is sent by the client; the model context is built
+    from the conversation history stored with the project.
+    """
+    try:
+        # Create a ConversationEntry to save to the database. Raw audio is
+        # never stored in the entry; the assistant moves it to the blob store.
+        entry_content = message.content
+        entry_data = message.data
+        if entry_data and "audio" in entry_data:
+            entry_data = {k: v for k, v in entry_data.items() if k != "audio"}
 
         # If there's no text content, it's an audio-only message.
-        if entry_content is None and entry_data and "audio" in entry_data:
+        if entry_content is None and message.data and "audio" in message.data:
             entry_content = "[audio input]"
         elif entry_content is None:
             # This case should ideally not happen if validation is correct on the client
             raise HTTPException(status_code=400, detail="Message content is missing.")
 
+        # Load the project once for the whole turn. The user's entry is queued
+        # on the turn and written together with the reply when the stream ends.
+        turn = await ChatTurn.begin(project_id)
+        if not turn:
+            raise HTTPException(status_code=404, detail="Project not found")
+
         user_entry = ConversationEntry(
             role="user",
             content=entry_content,
             data=entry_data
         )
-        await project_service.update_project_conversation(project_id, user_entry)
+        turn.add_entry(user_entry)
 
-        # The `messages` from the request body already contains the full history
-        # needed for the assistant, which expects a list of dictionaries.
         return StreamingResponse(
-            assistant.stream_chat_response(project_id, messages),
+            sse.metered("chat", assistant.stream_chat_response(turn, message)),
             media_type="text/event-stream"
         )
 
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=400, detail="Invalid JSON in request body.")
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error during chat streaming: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal Server Error during chat: {e}")
+
+
+@router.get("/{project_id}/chat/stream")
+async def resume_chat_stream(project_id: str, last_event_id: str = Header(...)):
+    """
+    Resumes a chat turn's event stream after a disconnect. Send the id of
+    the last event received as the Last-Event-ID header; the events after it
+    are replayed and the turn is then followed live. Turns can be resumed
+    for a short while after they finish.
+    """
+    try:
+        frames = assistant.resume_chat_stream(project_id, last_event_id)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Chat stream not found")
+    except sse.ResumeUnavailable as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return StreamingResponse(sse.metered("chat_resume", frames), media_type="text/event-stream")
+
+
+@router.post("/{project_id}/chat/audio")
+async def stream_audio_chat(project_id: str, request: Request, content: Optional[str] = None):
+    """
+    Sends a voice turn to the assistant and streams the response.
+
+    The recording is the raw request body, with its mime type as the
+    Content-Type (e.g. audio/webm). Optional text can be passed as the
+    `content` query parameter.
+    """
+    try:
+        audio_bytes, mime_type = await read_audio_upload(request)
+
+        turn = await ChatTurn.begin(project_id)
+        if not turn:
+            raise HTTPException(status_code=404, detail="Project not found")
+
+        user_entry = ConversationEntry(
+            role="user",
+            content=content if content is not None else "[audio input]",
+            data={"mimeType": mime_type}
+        )
+        turn.add_entry(user_entry)
+
+        return StreamingResponse(
+            sse.metered("chat", assistant.stream_chat_response(
+                turn, ChatRequest(content=content), audio_bytes=audio_bytes, audio_mime_type=mime_type
+            )),
+            media_type="text/event-stream"
+        )
+
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error during chat streaming: {e}")
         raise HTTPException(status_code=500, detail=f"Internal Server Error during chat: {e}")
@@ -107,9 +201,18 @@ async def stream_chat(project_id: str, request: Request):
 @router.delete("/{project_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_project_by_id(project_id: str):
     await project_service.delete_project(project_id)
+    context_cache.invalidate(project_id)
 
 @router.post("/{project_id}/edit-requirements")
 async def edit_requirements(project_id: str, req: EditRequest):
+    """
+    Applies an edit instruction to the project's requirements document.
+
+    Streams server-sent events: one `section` event per changed section
+    (`op` is replace, insert or delete, against the original section
+    numbering of `requirements_editor.split_sections`), then `done` once the
+    edited document is saved, or `error` if it changed during the edit.
+    """
     project = await project_service.get_project(project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
@@ -119,28 +222,105 @@ async def edit_requirements(project_id: str, req: EditRequest):
     current_requirements = project.requirements.get("content", "")
 
     return StreamingResponse(
-        assistant.get_edit_stream(current_requirements, req.content),
-        media_type="text/plain"
+        sse.metered("edit_requirements", requirements_editor.edit_requirements_stream(project_id, current_requirements, req.content)),
+        media_type="text/event-stream"
     )
 
+@router.get("/{project_id}/requirements/versions", response_model=List[RequirementsVersionSummary])
+async def list_requirements_versions(project_id: str, limit: int = 50, before: Optional[int] = None):
+    """
+    Lists the saved versions of the project's requirements, newest first.
+    Pass the last version number as `before` to load older ones.
+    """
+    return await requirements_versions.list_versions(project_id, limit, before)
+
+@router.get("/{project_id}/requirements/versions/{version}", response_model=RequirementsVersion)
+async def get_requirements_version(project_id: str, version: int):
+    requirements_version = await requirements_versions.get_version(project_id, version)
+    if not requirements_version:
+        raise HTTPException(status_code=404, detail="Version not found")
+    return requirements_version
+
+@router.get("/{project_id}/requirements/diff", response_class=PlainTextResponse)
+async def diff_requirements_versions(project_id: str, from_version: int, to_version: int):
+    """
+    Returns a unified diff between two versions of the project's requirements.
+    """
+    diff = await requirements_versions.diff_versions(project_id, from_version, to_version)
+    if diff is None:
+        raise HTTPException(status_code=404, detail="Version not found")
+    return diff
+
 @router.post("/{project_id}/generate-prd")
 async def generate_prd(project_id: str, req: GeneratePrdRequest):
-    project = await project_service.get_project(project_id)
+    project = await project_service.get_project(project_id, include_history=True)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
 
     return StreamingResponse(
-        assistant.get_prd_stream(project.conversation_history, req.target),
+        artifacts.prd_stream(project, req.target, req.incremental),
         media_type="text/plain"
     )
 
 @router.post("/{project_id}/review")
-async def review_requirements(project_id: str):
-    project = await project_service.get_project(project_id)
+async def review_requirements(project_id: str, incremental: bool = False):
+    project = await project_service.get_project(project_id, include_history=True)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
     return StreamingResponse(
-        assistant.get_review_stream(project.conversation_history),
+        artifacts.review_stream(project, incremental),
         media_type="text/plain"
-    ) 
\ No newline at end of file
+    )
+
+@router.post("/{project_id}/jobs/prd", response_model=Job, status_code=status.HTTP_202_ACCEPTED)
+async def submit_prd_job(project_id: str, req: GeneratePrdRequest):
+    """
+    Generates a PRD in the background and returns the job at once. Poll
+    `GET /{project_id}/jobs/{job_id}` or follow `/events` for its output.
+    """
+    project = await project_service.get_project(project_id, include_history=True)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return await _submit_job(artifacts.prd_spec(project, req.target, req.incremental))
+
+@router.post("/{project_id}/jobs/review", response_model=Job, status_code=status.HTTP_202_ACCEPTED)
+async def submit_review_job(project_id: str, incremental: bool = False):
+    """
+    Reviews the requirements in the background and returns the job at once.
+    """
+    project = await project_service.get_project(project_id, include_history=True)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return await _submit_job(artifacts.review_spec(project, incremental))
+
+async def _submit_job(spec: artifacts.ArtifactSpec) -> Job:
+    try:
+        return await jobs.submit(spec)
+    except jobs.JobQueueFull:
+        raise HTTPException(status_code=503, detail="Too many jobs are waiting. Please try again later.")
+
+@router.get("/{project_id}/jobs", response_model=List[Job])
+async def list_jobs(project_id: str, limit: int = 20):
+    return await jobs.list_jobs(project_id, max(1, min(limit, 100)))
+
+@router.get("/{project_id}/jobs/{job_id}", response_model=Job)
+async def get_job(project_id: str, job_id: str, offset: int = 0):
+    """
+    Returns a job's status and its output from `offset` on. Pass the
+    previous `output_length` as `offset` to fetch only new output.
+    """
+    job = await jobs.get_job(project_id, job_id, max(0, offset)) if ObjectId.is_valid(job_id) else None
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/{project_id}/jobs/{job_id}/events")
+async def follow_job(project_id: str, job_id: str):
+    """
+    Streams a job's output as server-sent events, ending with a "done"
+    event. Disconnecting does not affect the job.
+    """
+    if not ObjectId.is_valid(job_id) or not await jobs.get_job(project_id, job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(sse.metered("job", jobs.job_events(project_id, job_id)), media_type="text/event-stream")
@@ -0,0 +1,188 @@
+import asyncio
+import hashlib
+from datetime import datetime
+from typing import AsyncGenerator, Callable, Dict, List, NamedTuple
+from bson import ObjectId
+from ..database import generated_artifacts_collection, phase_summaries_collection
+from ..models import Project, ConversationEntry, SpecPhase
+from . import assistant
+
+# Size of the chunks a cached artifact is replayed in.
+ARTIFACT_REPLAY_CHUNK_CHARS = 2048
+
+
+def history_hash(entries: List[ConversationEntry]) -> str:
+    """
+    Hashes the parts of a conversation that generated documents depend on.
+    """
+    digest = hashlib.sha256()
+    for entry in entries:
+        digest.update(entry.role.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(entry.content.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def artifact_key(prompt_version: str, variant: str, entries: List[ConversationEntry]) -> str:
+    return f"{prompt_version}:{variant}:{history_hash(entries)}"
+
+
+async def cached_artifact_stream(
+    project_id: str,
+    kind: str,
+    variant: str,
+    key: str,
+    generate: Callable[[], AsyncGenerator[str, None]],
+) -> AsyncGenerator[str, None]:
+    """
+    Streams a generated document, reusing the stored copy when `key` matches.
+
+    Only one document is kept per (project, kind, variant). A fresh document
+    is stored once its stream has finished, so an interrupted generation is
+    never cached.
+    """
+    selector = {"project_id": ObjectId(project_id), "kind": kind, "variant": variant}
+    cached = await generated_artifacts_collection.find_one({**selector, "key": key}, projection={"content": 1})
+    if cached:
+        content = cached["content"]
+        for start in range(0, len(content), ARTIFACT_REPLAY_CHUNK_CHARS):
+            yield content[start:start + ARTIFACT_REPLAY_CHUNK_CHARS]
+        return
+
+    chunks = []
+    async for chunk in generate():
+        chunks.append(chunk)
+        yield chunk
+
+    await generated_artifacts_collection.update_one(
+        selector,
+        {"$set": {"key": key, "content": "".join(chunks), "created_at": datetime.now()}},
+        upsert=True,
+    )
+
+
+async def get_phase_summaries(project: Project) -> Dict[SpecPhase, str]:
+    """
+    Returns summaries of the phases the project has finished, generating
+    only those whose entries changed since they were last summarized.
+    """
+    phases = list(SpecPhase)
+    finished = phases[:phases.index(project.current_phase)]
+    grouped: Dict[SpecPhase, List[ConversationEntry]] = {}
+    for entry in project.conversation_history:
+        if entry.phase in finished:
+            grouped.setdefault(entry.phase, []).append(entry)
+    return await summarize_phases(str(project.id), grouped)
+
+
+async def summarize_phases(project_id: str, grouped: Dict[SpecPhase | None, List[ConversationEntry]]) -> Dict[SpecPhase | None, str]:
+    """
+    Returns a summary for each phase in `grouped`, which maps a phase to all
+    of its entries. The None phase stands for the entries that predate phase
+    tracking. Stored summaries are reused while the entries they were made
+    from are unchanged; the rest are generated concurrently and stored.
+    """
+    if not grouped:
+        return {}
+
+    project_id = ObjectId(project_id)
+    hashes = {phase: history_hash(entries) for phase, entries in grouped.items()}
+    keys = {phase: phase.value if phase else None for phase in grouped}
+    stored = {
+        document.get("phase"): document
+        async for document in phase_summaries_collection.find(
+            {"project_id": project_id, "phase": {"$in": list(keys.values())}}
+        )
+    }
+
+    summaries = {}
+    stale = []
+    for phase in grouped:
+        document = stored.get(keys[phase])
+        if (
+            document
+            and document.get("history_hash") == hashes[phase]
+            and document.get("prompt_version") == assistant.PHASE_SUMMARY_PROMPT_VERSION
+        ):
+            summaries[phase] = document["summary"]
+        else:
+            stale.append(phase)
+
+    results = await asyncio.gather(*(assistant.summarize_phase(phase, grouped[phase]) for phase in stale))
+    for phase, summary in zip(stale, results):
+        summaries[phase] = summary
+        await phase_summaries_collection.update_one(
+            {"project_id": project_id, "phase": keys[phase]},
+            {"$set": {
+                "history_hash": hashes[phase],
+                "prompt_version": assistant.PHASE_SUMMARY_PROMPT_VERSION,
+                "summary": summary,
+                "created_at": datetime.now(),
+            }},
+            upsert=True,
+        )
+    return summaries
+
+
+class ArtifactSpec(NamedTuple):
+    """
+    What identifies a generated document, and how to generate it.
+    """
+    project_id: str
+    kind: str
+    variant: str
+    key: str
+    generate: Callable[[], AsyncGenerator[str, None]]
+
+
+def prd_spec(project: Project, target: str, incremental: bool = False) -> ArtifactSpec:
+    """
+    Describes the PRD for a project loaded with its conversation history.
+    """
+    variant = f"{target}:incremental" if incremental else target
+
+    async def generate():
+        phase_summaries = await get_phase_summaries(project) if incremental else None
+        async for chunk in assistant.get_prd_stream(project.conversation_history, target, phase_summaries):
+            yield chunk
+
+    key = artifact_key(assistant.PRD_PROMPT_VERSION, variant, project.conversation_history)
+    return ArtifactSpec(str(project.id), "prd", variant, key, generate)
+
+
+def review_spec(project: Project, incremental: bool = False) -> ArtifactSpec:
+    """
+    Describes the requirements review for a project loaded with its
+    conversation history.
+    """
+    variant = "incremental" if incremental else "full"
+
+    async def generate():
+        phase_summaries = await get_phase_summaries(project) if incremental else None
+        async for chunk in assistant.get_review_stream(project.conversation_history, phase_summaries):
+            yield chunk
+
+    key = artifact_key(assistant.REVIEW_PROMPT_VERSION, variant, project.conversation_history)
+    return ArtifactSpec(str(project.id), "review", variant, key, generate)
+
+
+def artifact_stream(spec: ArtifactSpec) -> AsyncGenerator[str, None]:
+    """
+    Streams the document `spec` describes, from the cache when possible.
+    """
+    return cached_artifact_stream(spec.project_id, spec.kind, spec.variant, spec.key, spec.generate)
+
+
+def prd_stream(project: Project, target: str, incremental: bool = False) -> AsyncGenerator[str, None]:
+    """
+    Streams a PRD for a project loaded with its conversation history.
+    """
+    return artifact_stream(prd_spec(project, target, incremental))
+
+
+def review_stream(project: Project, incremental: bool = False) -> AsyncGenerator[str, None]:
+    """
+    Streams a requirements review for a project loaded with its conversation history.
+    """
+    return artifact_stream(review_spec(project, incremental))
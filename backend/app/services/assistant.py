@@ -1,15 +1,19 @@
 import os
 import json
 import asyncio
-from typing import List, Dict, Any, Generator
-from ..models import ConversationEntry, SpecPhase
+from typing import List, Dict, Any, AsyncGenerator
+from ..models import ConversationEntry, SpecPhase, ChatRequest
 from fastapi import HTTPException
 from google.genai.types import Content, Part, Blob, GenerationConfig, GenerateContentConfig, ThinkingConfig
 from datetime import datetime
 import base64
-from .audio import process_audio_input
-from . import project_service
-from ..client import client, MODEL_NAME
+from .audio import transcribe_audio_bytes
+from . import context_cache, sse, chat_streams
+from .unit_of_work import ChatTurn
+from .blob_store import store_audio
+from .control_tokens import ControlTokenScanner
+from ..client import MODEL_NAME
+from .model_scheduler import scheduler
 import re
 
 SYSTEM_PROMPT = """
@@ -29,170 +33,319 @@ You must guide the user one phase at a time. Ask clarifying questions to get all
 If the user wants to rename the project, you MUST end your response with the exact token: `[RENAME_PROJECT: "The New Project Name"]`.
 """
 
-async def advance_project_phase(project_id: str):
+async def stream_chat_response(turn: ChatTurn, message: ChatRequest, audio_bytes: bytes | None = None, audio_mime_type: str | None = None) -> AsyncGenerator[bytes, None]:
     """
-    Advances the project to the next specification phase.
+    Returns a generator for the Gemini model response stream, as encoded
+    server-sent events.
+    Handles both text and audio input. Audio arrives either base64 encoded in
+    `message.data` or as raw `audio_bytes` from a binary upload.
+
+    The model is read by a separate task that feeds an `sse.EventBuffer`, so
+    small parts are coalesced and a slow client gets fewer, larger writes
+    instead of holding up the model stream.
+
+    If the client goes away, CHAT_DISCONNECT_MODE decides what happens to
+    the turn: with "cancel" the producer is cancelled, which stops the model
+    call; with "detach" it runs to completion, and the client can pick the
+    stream up again with `resume_chat_stream`. Either way the turn is saved,
+    including when it is cancelled before the reply starts (e.g. during
+    transcription).
     """
+    events = sse.EventBuffer(stream_id=str(turn.history_length))
+    producer = asyncio.create_task(_run_chat_turn(turn, message, audio_bytes, audio_mime_type, events))
+    detach = chat_streams.CHAT_DISCONNECT_MODE == "detach"
+    if detach:
+        chat_streams.register(turn.project_id, events, producer)
     try:
-        project = await project_service.get_project(project_id)
-        if not project:
-            return
+        async for data in events.frames():
+            yield data
+    finally:
+        if not producer.done() and not detach:
+            producer.cancel()
 
-        current_phase = project.current_phase
-        phases = list(SpecPhase)
-        
-        try:
-            current_index = phases.index(current_phase)
-            if current_index < len(phases) - 1:
-                next_phase = phases[current_index + 1]
-                await project_service.update_project_phase(project_id, next_phase)
-                print(f"Advanced project {project_id} from {current_phase.value} to {next_phase.value}")
-        except ValueError:
-            print(f"Project {project_id} has an unknown phase: {current_phase}")
 
-    except Exception as e:
-        print(f"Error advancing project phase for {project_id}: {e}")
+def resume_chat_stream(project_id: str, last_event_id: str) -> AsyncGenerator[bytes, None]:
+    """
+    Returns the rest of a chat turn's event stream after `last_event_id`,
+    replaying buffered events and then following the turn live. Raises
+    LookupError or `sse.ResumeUnavailable` if it cannot be resumed.
+    """
+    return chat_streams.find(project_id, last_event_id).frames(last_event_id)
 
 
-async def stream_chat_response(project_id: str, history: list[dict]):
+async def _run_chat_turn(turn: ChatTurn, message: ChatRequest, audio_bytes: bytes | None, audio_mime_type: str | None, events: sse.EventBuffer):
     """
-    Returns a generator for the Gemini model response stream.
-    Handles both text and audio input.
+    Runs one chat turn, sending its events to `events`.
+
+    The model context is built from the project's stored conversation history
+    (prebuilt Content objects are cached per project) plus the new message.
+    The user's message, the reply and any phase change are recorded on
+    `turn` and committed once the turn ends, however it ends. A failure is
+    sent to the client as an "error" event.
     """
-    system_message = [
-        Content(role="user", parts=[Part(text=SYSTEM_PROMPT)]),
-        Content(role="model", parts=[Part(text="Understood. I am SpecDrafter, and I will follow these instructions to help create a Product Requirements Document. I will start by focusing on the Foundation phase. Let's begin.")] )
-    ]
+    try:
+        await _chat_turn_events(turn, message, audio_bytes, audio_mime_type, events)
+    except asyncio.CancelledError:
+        events.close()
+        raise
+    except Exception as e:
+        # The response has already started, so the failure is reported as
+        # an event rather than by cutting the stream off.
+        print(f"Error during chat turn for project {turn.project_id}: {e}")
+        await events.send_event({"type": "error", "detail": str(e)})
+        events.close()
+    else:
+        events.close()
+
+
+async def _chat_turn_events(turn: ChatTurn, message: ChatRequest, audio_bytes: bytes | None, audio_mime_type: str | None, events: sse.EventBuffer):
+    project = turn.project
+    project_id = turn.project_id
+
+    response_parts = []
+    thought_parts = []
+    reply_tokens = None
+    completed = False
+
+    # Everything from here on is covered by the commit below, so the user's
+    # message is saved even if transcription or the model call fails, or the
+    # turn is cancelled before the reply starts.
+    try:
+        history_for_model = await context_cache.get_history_contents(project_id, turn.history_length, project.current_phase)
+
+        prompt_parts = []
+        transcribed_text = ""
+
+        # Check for audio data in the new message. It is decoded once, and the
+        # same bytes are transcribed and stored.
+        if message.data and 'audio' in message.data:
+            audio_mime_type = message.data.get('mimeType', 'audio/webm') # Defaulting to webm
+            audio_bytes = await asyncio.to_thread(base64.b64decode, message.data['audio'])
+        if audio_bytes:
+            transcribed_text = await transcribe_audio_bytes(audio_bytes, audio_mime_type)
+
+        if audio_bytes:
+            # The recording goes to the blob store; the user's entry (queued by
+            # the router) keeps only a reference to it and the transcript.
+            user_entry = turn.entries[0]
+            audio_ref = await store_audio(audio_bytes, audio_mime_type)
+            user_entry.data = {**(user_entry.data or {}), "audio_ref": audio_ref, "transcript": transcribed_text}
+            if not message.content and transcribed_text:
+                user_entry.content = transcribed_text
+
+        # Add text content if it exists
+        if message.content:
+            prompt_parts.append(Part(text=message.content))
+
+        # Add transcribed text if it exists
+        if transcribed_text:
+            prompt_parts.append(Part(text=f"\n\n[USER'S VOICE TRANSCRIPT]: {transcribed_text}"))
+
+        # Add the phase prompt
+        current_phase = project.current_phase
+        phase_prompt = f"\n\n[SYSTEM] We are currently in the **{current_phase.value}** phase. Please continue gathering information for this phase."
+        prompt_parts.append(Part(text=phase_prompt))
+
+        # Create the full prompt with history
+        contents = history_for_model + [Content(role="user", parts=prompt_parts)]
+
+        # Enable the "thinking" feature as per the latest Gemini API docs. The
+        # system prompt goes in the config, ahead of an unchanging history prefix,
+        # which lets the API reuse its implicit prompt cache between turns.
+        config = GenerateContentConfig(
+            system_instruction=SYSTEM_PROMPT,
+            thinking_config=ThinkingConfig(
+                include_thoughts=True
+            )
+        )
 
-    # Reconstruct history for the model
-    history_for_model = []
-    for message in history[:-1]:  # Process all but the last message
-        role = "user" if message["role"] == "user" else "model"
-        history_for_model.append(Content(role=role, parts=[Part(text=message["content"])]))
-
-    # The last message from the user is the prompt
-    last_message = history[-1]
-    prompt_parts = []
-    transcribed_text = ""
-
-    # Check for audio data in the last message
-    if 'data' in last_message and 'audio' in last_message['data']:
-        audio_base64 = last_message['data']['audio']
-        mime_type = last_message['data'].get('mimeType', 'audio/webm') # Defaulting to webm
-        transcribed_text = process_audio_input(audio_base64, mime_type)
-
-    # Add text content if it exists
-    if last_message['content']:
-        prompt_parts.append(Part(text=last_message['content']))
-
-    # Add transcribed text if it exists
-    if transcribed_text:
-        prompt_parts.append(Part(text=f"\n\n[USER'S VOICE TRANSCRIPT]: {transcribed_text}"))
-
-    # Add the phase prompt
-    project = await project_service.get_project(project_id)
-    current_phase = project.current_phase if project else SpecPhase.FOUNDATION
-    phase_prompt = f"\n\n[SYSTEM] We are currently in the **{current_phase.value}** phase. Please continue gathering information for this phase."
-    prompt_parts.append(Part(text=phase_prompt))
-
-    # Create the full prompt with history
-    contents = system_message + history_for_model + [Content(role="user", parts=prompt_parts)]
-
-    # Enable the "thinking" feature as per the latest Gemini API docs
-    config = GenerateContentConfig(
-        thinking_config=ThinkingConfig(
-            include_thoughts=True
+        # The scheduler uses the SDK's async client, so waiting on the next chunk
+        # yields control back to the event loop instead of blocking the worker.
+        response_stream = scheduler.generate_content_stream(
+            "chat",
+            model=MODEL_NAME,
+            contents=contents,
+            config=config
         )
-    )
 
-    response_stream = client.models.generate_content_stream(
+        scanner = ControlTokenScanner()
+        async for chunk in response_stream:
+            usage = getattr(chunk, "usage_metadata", None)
+            if usage and usage.candidates_token_count:
+                reply_tokens = usage.candidates_token_count
+            if not chunk.candidates or not chunk.candidates[0].content or not chunk.candidates[0].content.parts:
+                continue
+            # According to the doc, iterate through parts and check the `thought` attribute.
+            for part in chunk.candidates[0].content.parts:
+                if not part.text:
+                    continue
+
+                if hasattr(part, 'thought') and part.thought:
+                    thought_parts.append(part.text)
+                    await events.send_part("thought", part.text)
+                else: # This is a regular text part
+                    await _send_reply_segments(turn, scanner.feed(part.text), response_parts, events)
+
+        await _send_reply_segments(turn, scanner.finish(), response_parts, events)
+        completed = True
+    finally:
+        if turn.entries:
+            turn.entries[0].token_count = context_cache.estimate_tokens(turn.entries[0].content)
+        if response_parts:
+            full_thoughts = "".join(thought_parts).strip()
+            data = {"thoughts": full_thoughts} if full_thoughts else {}
+            if not completed:
+                # Cut off by an error or a cancelled stream.
+                data["interrupted"] = True
+            assistant_entry = ConversationEntry(
+                role="assistant",
+                content="".join(response_parts).strip(),
+                data=data,
+                token_count=reply_tokens
+            )
+            turn.add_entry(assistant_entry)
+        # Persist the user's message (and the reply, if any, complete or
+        # not) even if the turn fails part-way. Shielded, so that a cancelled
+        # turn still finishes writing.
+        await asyncio.shield(turn.commit())
+        context_cache.extend(project_id, turn.history_length, turn.end_seq, turn.entries)
+
+    # Finish with a compact description of what the turn changed. Clients
+    # that fall out of sync can compare versions and refetch the project.
+    delta = turn.delta()
+    await events.send_event({"type": "project_update", **delta})
+
+
+async def _send_reply_segments(turn: ChatTurn, segments: list, response_parts: List[str], events: sse.EventBuffer):
+    """
+    Sends reply text to the client and acts on the control tokens found in it.
+    """
+    for segment in segments:
+        if isinstance(segment, str):
+            response_parts.append(segment)
+            await events.send_part("text", segment)
+        elif segment.kind == "phase_complete":
+            print(f"Phase complete signal received for project {turn.project_id}")
+            turn.advance_phase()
+            # Also send the phase complete signal to the client
+            await events.send_event({"type": "phase_complete"})
+        elif segment.kind == "rename":
+            print(f"Rename signal received for project {turn.project_id}: {segment.value}")
+            turn.rename(segment.value)
+
+
+async def select_sections_to_edit(document_outline: str, edit_instruction: str) -> List[int]:
+    """
+    Asks the model which sections of a requirements document an edit touches.
+    """
+    system_instruction = (
+        "You are an expert technical writer. You will be given the outline of a software requirements document, "
+        "with each section numbered in square brackets, and an instruction for what to change. "
+        "Return the numbers of every section whose text must be read or rewritten to apply the instruction."
+    )
+    response = await scheduler.generate_content(
+        "edit",
         model=MODEL_NAME,
-        contents=contents,
-        config=config
+        contents=[Content(role="user", parts=[
+            Part(text=f"Outline:\n{document_outline}\n\nInstruction: {edit_instruction}")
+        ])],
+        config=GenerateContentConfig(
+            system_instruction=system_instruction,
+            response_mime_type="application/json",
+            response_schema=list[int],
+        ),
     )
-
-    full_response_text = ""
-    full_thoughts = ""
-
-    for chunk in response_stream:
-        if not chunk.candidates or not chunk.candidates[0].content or not chunk.candidates[0].content.parts:
-            continue
-        # According to the doc, iterate through parts and check the `thought` attribute.
-        for part in chunk.candidates[0].content.parts:
-            if not part.text:
-                continue
-            
-            if hasattr(part, 'thought') and part.thought:
-                thought_text = part.text
-                if thought_text:
-                    full_thoughts += thought_text
-                    data = {"type": "thought", "content": thought_text}
-                    yield f'data: {json.dumps(data)}\n\n'
-            else: # This is a regular text part
-                text_to_send = part.text
-                if "[PHASE_COMPLETE]" in text_to_send:
-                    print(f"Phase complete signal received for project {project_id}")
-                    text_to_send = text_to_send.replace("[PHASE_COMPLETE]", "")
-                    await advance_project_phase(project_id)
-                    # Also yield the phase complete signal to the client
-                    yield f'data: {json.dumps({"type": "phase_complete"})}\n\n'
-
-                if text_to_send:
-                    full_response_text += text_to_send
-                    data = {"type": "text", "content": text_to_send}
-                    yield f'data: {json.dumps(data)}\n\n'
-        
-        await asyncio.sleep(0.01)
-        
-    if full_response_text:
-        assistant_entry = ConversationEntry(
-            role="assistant", 
-            content=full_response_text.strip(),
-            data={"thoughts": full_thoughts.strip()} if full_thoughts else {}
-        )
-        await project_service.update_project_conversation(project_id, assistant_entry)
-
-    # After saving, get the latest project state and send it to the client
-    # as the final event in the stream.
-    updated_project = await project_service.get_project(project_id)
-    if updated_project:
-        project_dict = updated_project.model_dump(by_alias=True)
-        yield f'data: {json.dumps({"type": "project_update", "project": project_dict}, default=str)}\n\n'
+    try:
+        return [int(index) for index in json.loads(response.text or "[]")]
+    except (ValueError, TypeError):
+        print(f"Could not parse section selection: {response.text}")
+        return []
 
 
-def get_edit_stream(current_requirements: str, edit_instruction: str) -> Generator[str, None, None]:
+async def get_section_edit_stream(document_outline: str, sections: List[Any], edit_instruction: str) -> AsyncGenerator[str, None]:
     """
-    Generates a stream of an edited requirements document.
+    Generates a stream of section edits for a requirements document, in the
+    block format parsed by `requirements_editor.parse_edits`.
     """
     system_instruction = (
         "You are an expert technical writer. Your task is to revise a software requirements document based on a user's instruction. "
-        "You will be given the current document in Markdown format and an instruction for what to change. "
-        "Your goal is to apply the change seamlessly and return the ENTIRE, updated document. "
-        "Ensure the output is only the Markdown document, with no additional conversational text, introductions, or apologies."
+        "You will be given the outline of the document, with each section numbered in square brackets, the full Markdown of the sections relevant to the edit, and the instruction. "
+        "Do NOT return the whole document. Output only the changes, as a sequence of blocks in exactly this format:\n"
+        "<<<REPLACE n>>>\n(the complete new Markdown of section n, including its heading)\n<<<END>>>\n"
+        "<<<INSERT AFTER n>>>\n(the Markdown of a new section to add after section n; use -1 for the start of the document)\n<<<END>>>\n"
+        "<<<DELETE n>>>\n"
+        "Only replace or delete sections whose full text you were given. Keep unchanged sections out of the output. "
+        "Output nothing but these blocks, with no additional conversational text, introductions, or apologies."
     )
-
-    system_message = [
-        Content(role="user", parts=[Part(text=system_instruction)]),
-        Content(role="model", parts=[Part(text="Understood. I will revise the document according to the user's instructions and return only the complete, updated Markdown.")])
-    ]
-
-    contents = system_message + [
+    section_text = "\n\n".join(f"[{section.index}]\n{section.text}" for section in sections)
+    contents = [
         Content(role="user", parts=[
-            Part(text=f"Here is the current document:\n\n---\n\n{current_requirements}\n\n---\n\nPlease apply this instruction: {edit_instruction}")
+            Part(text=f"Outline:\n{document_outline}\n\n---\n\nRelevant sections:\n\n{section_text}\n\n---\n\nPlease apply this instruction: {edit_instruction}")
         ])
     ]
 
-    response_stream = client.models.generate_content_stream(
+    response_stream = scheduler.generate_content_stream(
+        "edit",
         model=MODEL_NAME,
         contents=contents,
+        config=GenerateContentConfig(system_instruction=system_instruction),
     )
-    for response in response_stream:
-        yield response.text
+    async for response in response_stream:
+        if response.text:
+            yield response.text
 
 
-def get_prd_stream(conversation_history: List[ConversationEntry], target: str) -> Generator[str, None, None]:
+# Bump these when the corresponding prompt changes, so cached output
+# produced by the old prompt is regenerated.
+PRD_PROMPT_VERSION = "2"
+REVIEW_PROMPT_VERSION = "2"
+PHASE_SUMMARY_PROMPT_VERSION = "2"
+
+
+def _conversation_blocks(conversation_history: List[ConversationEntry], entry_format: str, phase_summaries: Dict[SpecPhase, str] | None = None) -> List[str]:
+    """
+    Formats conversation entries for a prompt. Entries from phases that have a
+    summary in `phase_summaries` are replaced by that summary, once.
     """
-    Generates a stream of a full PRD in Markdown.
+    phase_summaries = phase_summaries or {}
+    blocks = []
+    summarized = set()
+    for entry in conversation_history:
+        if entry.phase in phase_summaries:
+            if entry.phase not in summarized:
+                summarized.add(entry.phase)
+                blocks.append(f"[Summary of the {entry.phase.value} phase]\n{phase_summaries[entry.phase]}")
+            continue
+        blocks.append(entry_format.format(role=entry.role, Role=entry.role.capitalize(), content=entry.content))
+    return blocks
+
+
+async def summarize_phase(phase: SpecPhase | None, entries: List[ConversationEntry]) -> str:
+    """
+    Summarizes the requirements gathered during one specification phase, or
+    the entries that predate phase tracking when `phase` is None.
+    """
+    covers = f"It covers the **{phase.value}** phase. " if phase else "It covers the start of the conversation. "
+    system_instruction = (
+        "You are an expert business analyst. Summarize the following part of a requirements gathering conversation. "
+        f"{covers}Capture every requirement, decision, constraint and open question in detail, "
+        "as Markdown bullet points. Do not add any conversational text."
+    )
+    conversation_text = "\n\n".join(_conversation_blocks(entries, "{role}: {content}"))
+    response = await scheduler.generate_content(
+        "summary",
+        dedupe=True,
+        model=MODEL_NAME,
+        contents=[Content(role="user", parts=[Part(text=conversation_text)])],
+        config=GenerateContentConfig(system_instruction=system_instruction),
+    )
+    return response.text or ""
+
+
+async def get_prd_stream(conversation_history: List[ConversationEntry], target: str, phase_summaries: Dict[SpecPhase, str] | None = None) -> AsyncGenerator[str, None]:
+    """
+    Generates a stream of a full PRD in Markdown. Phases with an entry in
+    `phase_summaries` are given to the model as that summary.
     """
     current_date = datetime.now().strftime("%B %d, %Y")
 
@@ -205,27 +358,28 @@ def get_prd_stream(conversation_history: List[ConversationEntry], target: str) -
         "Ensure all requirements discussed in the conversation are captured accurately and in detail. "
         "It is critical that you only output the Markdown for the PRD, without any additional conversational text, introductions, or explanations. The response should start directly with the first line of the Markdown document (e.g., '# Product Requirements Document: ...')."
     )
-    system_message = [
-        Content(role="user", parts=[Part(text=system_instruction)]),
-        Content(role="model", parts=[Part(text="Understood. I will analyze the conversation and generate a complete, developer-ready PRD in Markdown with the specified sections, starting directly with the document's content.")])
-    ]
 
-    history_text = "\n\n".join([f"{entry.role}: {entry.content}" for entry in conversation_history])
+    history_text = "\n\n".join(_conversation_blocks(conversation_history, "{role}: {content}", phase_summaries))
     prompt = f"**Date:** {current_date}\n\n**Conversation History:**\n{history_text}"
 
-    contents = system_message + [Content(role="user", parts=[Part(text=prompt)])]
+    contents = [Content(role="user", parts=[Part(text=prompt)])]
 
-    response_stream = client.models.generate_content_stream(
+    response_stream = scheduler.generate_content_stream(
+        "prd",
+        dedupe=True,
         model=MODEL_NAME,
         contents=contents,
+        config=GenerateContentConfig(system_instruction=system_instruction),
     )
-    for response in response_stream:
-        yield response.text
+    async for response in response_stream:
+        if response.text:
+            yield response.text
 
 
-def get_review_stream(conversation_history: List[ConversationEntry]) -> Generator[str, None, None]:
+async def get_review_stream(conversation_history: List[ConversationEntry], phase_summaries: Dict[SpecPhase, str] | None = None) -> AsyncGenerator[str, None]:
     """
-    Generates a stream of text reviewing the project requirements.
+    Generates a stream of text reviewing the project requirements. Phases with
+    an entry in `phase_summaries` are given to the model as that summary.
     """
     system_instruction = (
         "You are an expert system analyst. Your task is to review the following conversation history between an AI assistant and a user who is defining software requirements. "
@@ -233,20 +387,20 @@ def get_review_stream(conversation_history: List[ConversationEntry]) -> Generato
         "Organize the summary into logical sections (e.g., Overview, User Personas, Key Features, Technical Stack). "
         "The output should be in Markdown format. Do not add any conversational fluff or introductory sentences. Begin the response directly with the Markdown summary."
     )
-    system_message = [
-        Content(role="user", parts=[Part(text=system_instruction)]),
-        Content(role="model", parts=[Part(text="Understood. I will review the conversation and generate a concise, well-structured summary of the project's requirements in Markdown format, starting directly with the summary.")])
-    ]
     conversation_text = "\n\n---\n\n".join(
-        [f"**{entry.role.capitalize()}**: {entry.content}" for entry in conversation_history]
+        _conversation_blocks(conversation_history, "**{Role}**: {content}", phase_summaries)
     )
     prompt = f"Here is the conversation history:\n\n{conversation_text}"
 
-    contents = system_message + [Content(role="user", parts=[Part(text=prompt)])]
+    contents = [Content(role="user", parts=[Part(text=prompt)])]
 
-    response_stream = client.models.generate_content_stream(
+    response_stream = scheduler.generate_content_stream(
+        "review",
+        dedupe=True,
         model=MODEL_NAME,
         contents=contents,
+        config=GenerateContentConfig(system_instruction=system_instruction),
     )
-    for response in response_stream:
-        yield response.text 
\ No newline at end of file
+    async for response in response_stream:
+        if response.text:
+            yield response.text 
\ No newline at end of file
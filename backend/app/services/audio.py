@@ -1,6 +1,6 @@
-from fastapi import HTTPException
+from fastapi import HTTPException, Request
 import base64
-from ..client import client, MODEL_NAME, TTS_MODEL_NAME
+from ..client import get_client, MODEL_NAME, TTS_MODEL_NAME
 from google.genai.types import (
     Part,
     File,
@@ -9,132 +9,407 @@ from google.genai.types import (
     VoiceConfig,
     PrebuiltVoiceConfig,
 )
+import asyncio
 import tempfile
 import os
 import io
-import wave
-from pydub import AudioSegment
+import re
+import struct
+from collections import deque
+from typing import AsyncGenerator
+from concurrent.futures import ProcessPoolExecutor
+from .tts_cache import tts_cache
+from .model_scheduler import scheduler
+from ..metrics import audio_conversion_seconds, files_api_seconds
 
+TTS_VOICE_NAME = os.getenv("TTS_VOICE_NAME", "Puck")
+# Format of the PCM returned by the TTS model.
+TTS_SAMPLE_RATE = 24000
+TTS_SAMPLE_WIDTH = 2
+# Streaming synthesis: how many text chunks are synthesized ahead of the one
+# being sent, and roughly how long each chunk after the first may be.
+TTS_PIPELINE_DEPTH = int(os.getenv("TTS_PIPELINE_DEPTH", "2"))
+TTS_CHUNK_CHARS = int(os.getenv("TTS_CHUNK_CHARS", "400"))
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n{2,}")
 
-def process_audio_input(audio_base64: str, mime_type: str) -> str:
+# Formats the model accepts as-is; anything else is converted to WAV first.
+SUPPORTED_AUDIO_MIME_TYPES = ["audio/wav", "audio/mp3", "audio/flac", "audio/aac", "audio/ogg"]
+
+# Upper bound on transcriptions running at once. Extra requests wait their turn
+# instead of piling more conversions and uploads onto the server.
+TRANSCRIPTION_MAX_CONCURRENCY = int(os.getenv("TRANSCRIPTION_MAX_CONCURRENCY", "4"))
+# Worker processes used for base64 decoding and ffmpeg conversion.
+AUDIO_PROCESS_POOL_SIZE = int(os.getenv("AUDIO_PROCESS_POOL_SIZE", "2"))
+# Backoff used while waiting for an uploaded file to become ACTIVE.
+FILE_POLL_INITIAL_DELAY = float(os.getenv("FILE_POLL_INITIAL_DELAY", "0.25"))
+FILE_POLL_MAX_DELAY = float(os.getenv("FILE_POLL_MAX_DELAY", "4.0"))
+FILE_POLL_TIMEOUT = float(os.getenv("FILE_POLL_TIMEOUT", "120.0"))
+# Clips up to this size (after conversion) are sent inline with the request
+# instead of going through the Files API.
+AUDIO_INLINE_MAX_BYTES = int(os.getenv("AUDIO_INLINE_MAX_BYTES", str(8 * 1024 * 1024)))
+# Clips above this size are spooled through temporary files rather than being
+# decoded and converted in memory.
+AUDIO_TEMP_FILE_THRESHOLD_BYTES = int(os.getenv("AUDIO_TEMP_FILE_THRESHOLD_BYTES", str(32 * 1024 * 1024)))
+# Largest raw audio upload accepted by the binary upload endpoints.
+AUDIO_UPLOAD_MAX_BYTES = int(os.getenv("AUDIO_UPLOAD_MAX_BYTES", str(25 * 1024 * 1024)))
+
+_transcription_semaphore = asyncio.Semaphore(TRANSCRIPTION_MAX_CONCURRENCY)
+_process_pool: ProcessPoolExecutor | None = None
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=AUDIO_PROCESS_POOL_SIZE)
+    return _process_pool
+
+
+def shutdown_audio_pool():
     """
-    Processes base64 encoded audio. If it's not in a format supported by Gemini,
-    it converts it to WAV, then uploads it and gets a transcript.
+    Shuts down the audio worker processes. Called when the application stops.
     """
-    audio_bytes = base64.b64decode(audio_base64)
-    
-    source_path = None
-    converted_path = None
-    audio_file = None
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
 
-    try:
-        # Save the original audio to a temporary file
-        source_suffix = mime_type.split("/")[-1]
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{source_suffix}") as tmp_file:
-            source_path = tmp_file.name
-            tmp_file.write(audio_bytes)
-
-        upload_path = source_path
-        upload_mime_type = mime_type
-        
-        # Convert to WAV if the original format is not directly supported
-        if mime_type.lower() not in ["audio/wav", "audio/mp3", "audio/flac", "audio/aac", "audio/ogg"]:
-            print(f"Unsupported format '{mime_type}', converting to WAV.")
-            audio = AudioSegment.from_file(source_path)
-            
-            # Create a new temporary file for the WAV audio
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as converted_file:
-                converted_path = converted_file.name
-                audio.export(converted_path, format="wav")
-            
-            upload_path = converted_path
-            upload_mime_type = "audio/wav"
-
-
-        # Upload the (potentially converted) file
-        print(f"Uploading file for transcription: {upload_path}")
-        audio_file = client.files.upload(file=upload_path)
-        print(f"Completed file upload: {audio_file.name}, State: {audio_file.state}")
-
-        # Wait for the file to be ready
-        while audio_file.state.name != "ACTIVE":
-            if audio_file.state.name == "FAILED":
-                raise Exception(f"Audio file processing failed on the server. Details: {audio_file.state_reason}")
-            audio_file = client.files.get(name=audio_file.name)
-
-        # Transcribe the audio
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=[
-                "Transcribe this audio. If there is no speech, return an empty string.",
-                audio_file,
-            ],
-        )
 
-        return response.text
+def _decode_audio(audio: str | bytes) -> bytes:
+    return base64.b64decode(audio) if isinstance(audio, str) else audio
 
-    except Exception as e:
-        print(f"Error processing audio: {e}")
-        raise HTTPException(
-            status_code=500, detail=f"Failed to process audio file: {e}"
-        )
-    finally:
-        # Clean up all temporary files and cloud resources
-        if audio_file:
-            try:
-                client.files.delete(name=audio_file.name)
-            except Exception as cleanup_e:
-                print(f"Error during cloud file cleanup: {cleanup_e}")
-        if source_path and os.path.exists(source_path):
-            os.remove(source_path)
-        if converted_path and os.path.exists(converted_path):
-            os.remove(converted_path)
+
+def _prepare_audio_bytes(audio: str | bytes, mime_type: str) -> tuple[bytes, str]:
+    """
+    Decodes base64 audio (if given as a string) in memory, converting it to
+    WAV if the format is not supported by Gemini. Runs in a worker process.
+
+    Returns the audio bytes and their mime type.
+    """
+    audio_bytes = _decode_audio(audio)
+    if mime_type.lower() in SUPPORTED_AUDIO_MIME_TYPES:
+        return audio_bytes, mime_type
+
+    print(f"Unsupported format '{mime_type}', converting to WAV.")
+    # Imported here so that only the worker processes load pydub.
+    from pydub import AudioSegment
+
+    audio = AudioSegment.from_file(io.BytesIO(audio_bytes))
+    wav_buffer = io.BytesIO()
+    audio.export(wav_buffer, format="wav")
+    return wav_buffer.getvalue(), "audio/wav"
 
 
-def generate_speech_audio(text: str) -> str:
+def _prepare_audio_file(audio: str | bytes, mime_type: str) -> tuple[str, str, list[str]]:
     """
-    Generates speech from text using Gemini TTS and returns it as a base64 encoded string.
-    The audio is raw PCM, which we encode into a WAV format before base64 encoding.
+    Writes audio (decoding it first if given as base64) into a temporary file, converting it to WAV if the
+    format is not supported by Gemini. Used for clips too large to handle in
+    memory. Runs in a worker process.
+
+    Returns the path to upload, its mime type, and every temporary path created.
     """
+    audio_bytes = _decode_audio(audio)
+    temp_paths = []
+
+    source_suffix = mime_type.split("/")[-1]
+    with tempfile.NamedTemporaryFile(delete=False, suffix=f".{source_suffix}") as tmp_file:
+        temp_paths.append(tmp_file.name)
+        tmp_file.write(audio_bytes)
+    del audio_bytes
+
+    if mime_type.lower() in SUPPORTED_AUDIO_MIME_TYPES:
+        return temp_paths[0], mime_type, temp_paths
+
+    print(f"Unsupported format '{mime_type}', converting to WAV.")
+    from pydub import AudioSegment
+
     try:
-        response = client.models.generate_content(
-            model=TTS_MODEL_NAME,
-            contents=text,
-            config=GenerateContentConfig(
-                response_modalities=["AUDIO"],
-                speech_config=SpeechConfig(
-                    voice_config=VoiceConfig(
-                        prebuilt_voice_config=PrebuiltVoiceConfig(
-                            voice_name="Puck",
+        audio = AudioSegment.from_file(temp_paths[0])
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as converted_file:
+            temp_paths.append(converted_file.name)
+        audio.export(temp_paths[-1], format="wav")
+    except Exception:
+        _remove_files(temp_paths)
+        raise
+    return temp_paths[-1], "audio/wav", temp_paths
+
+
+def _remove_files(paths: list[str]):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+async def _wait_for_file_active(audio_file: File) -> File:
+    """
+    Polls the Files API with exponential backoff until the file is ACTIVE.
+    """
+    delay = FILE_POLL_INITIAL_DELAY
+    deadline = asyncio.get_running_loop().time() + FILE_POLL_TIMEOUT
+    while audio_file.state.name != "ACTIVE":
+        if audio_file.state.name == "FAILED":
+            raise Exception(f"Audio file processing failed on the server. Details: {audio_file.error}")
+        if asyncio.get_running_loop().time() + delay > deadline:
+            raise Exception(f"Timed out waiting for audio file {audio_file.name} to become active.")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, FILE_POLL_MAX_DELAY)
+        client = await get_client()
+        with files_api_seconds.time(operation="get"):
+            audio_file = await client.aio.files.get(name=audio_file.name)
+    return audio_file
+
+
+async def read_audio_upload(request: Request) -> tuple[bytes, str]:
+    """
+    Reads a raw audio request body (Content-Type: audio/*) into a single
+    buffer. The AUDIO_UPLOAD_MAX_BYTES limit is enforced while the body
+    streams in, so oversized uploads are rejected without being buffered.
+
+    Returns the audio bytes and their mime type.
+    """
+    mime_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if not mime_type.startswith("audio/"):
+        raise HTTPException(status_code=415, detail="Expected an audio/* request body.")
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > AUDIO_UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Audio upload is too large.")
+
+    buffer = bytearray()
+    async for chunk in request.stream():
+        if len(buffer) + len(chunk) > AUDIO_UPLOAD_MAX_BYTES:
+            raise HTTPException(status_code=413, detail="Audio upload is too large.")
+        buffer += chunk
+
+    if not buffer:
+        raise HTTPException(status_code=400, detail="Audio upload is empty.")
+    return bytes(buffer), mime_type
+
+
+async def process_audio_input(audio_base64: str, mime_type: str) -> str:
+    """
+    Processes base64 encoded audio and returns its transcript.
+    """
+    return await _transcribe(audio_base64, len(audio_base64) * 3 // 4, mime_type)
+
+
+async def transcribe_audio_bytes(audio_bytes: bytes, mime_type: str) -> str:
+    """
+    Processes raw audio bytes and returns their transcript.
+    """
+    return await _transcribe(audio_bytes, len(audio_bytes), mime_type)
+
+
+async def _transcribe(audio: str | bytes, audio_size: int, mime_type: str) -> str:
+    """
+    Transcribes audio given either as base64 or as raw bytes. If it's not in
+    a format supported by Gemini, it is converted to WAV first.
+
+    Audio is decoded and converted in memory and sent inline when small enough.
+    Larger clips are uploaded through the Files API, and only clips above
+    AUDIO_TEMP_FILE_THRESHOLD_BYTES touch the disk. Decoding and conversion
+    run in a process pool (raw bytes in a supported format skip it entirely),
+    remote calls use the async client, and at most TRANSCRIPTION_MAX_CONCURRENCY
+    jobs run at once.
+    """
+    temp_paths = []
+    audio_file = None
+
+    async with _transcription_semaphore:
+        try:
+            loop = asyncio.get_running_loop()
+            audio_part = None
+
+            if audio_size > AUDIO_TEMP_FILE_THRESHOLD_BYTES:
+                with audio_conversion_seconds.time(mode="file"):
+                    upload_source, upload_mime_type, temp_paths = await loop.run_in_executor(
+                        _get_process_pool(), _prepare_audio_file, audio, mime_type
+                    )
+            else:
+                if isinstance(audio, bytes) and mime_type.lower() in SUPPORTED_AUDIO_MIME_TYPES:
+                    audio_bytes, upload_mime_type = audio, mime_type
+                else:
+                    with audio_conversion_seconds.time(mode="memory"):
+                        audio_bytes, upload_mime_type = await loop.run_in_executor(
+                            _get_process_pool(), _prepare_audio_bytes, audio, mime_type
                         )
+                if len(audio_bytes) <= AUDIO_INLINE_MAX_BYTES:
+                    audio_part = Part.from_bytes(data=audio_bytes, mime_type=upload_mime_type)
+                else:
+                    upload_source = io.BytesIO(audio_bytes)
+
+            if audio_part is None:
+                # Upload the (potentially converted) audio through the Files API
+                client = await get_client()
+                with files_api_seconds.time(operation="upload"):
+                    audio_file = await client.aio.files.upload(
+                        file=upload_source, config={"mime_type": upload_mime_type}
                     )
-                ),
-            ),
-        )
+                print(f"Completed file upload: {audio_file.name}, State: {audio_file.state}")
+                with files_api_seconds.time(operation="wait_active"):
+                    audio_file = await _wait_for_file_active(audio_file)
+                audio_part = audio_file
 
-        raw_audio_data = response.candidates[0].content.parts[0].inline_data.data
+            # Transcribe the audio
+            response = await scheduler.generate_content(
+                "transcribe",
+                model=MODEL_NAME,
+                contents=[
+                    "Transcribe this audio. If there is no speech, return an empty string.",
+                    audio_part,
+                ],
+            )
+
+            return response.text
 
-        if not raw_audio_data:
+        except Exception as e:
+            print(f"Error processing audio: {e}")
             raise HTTPException(
-                status_code=500,
-                detail="Speech synthesis failed, no audio content received.",
+                status_code=500, detail=f"Failed to process audio file: {e}"
             )
+        finally:
+            # Clean up all temporary files and cloud resources
+            if audio_file:
+                try:
+                    client = await get_client()
+                    with files_api_seconds.time(operation="delete"):
+                        await client.aio.files.delete(name=audio_file.name)
+                except Exception as cleanup_e:
+                    print(f"Error during cloud file cleanup: {cleanup_e}")
+            _remove_files(temp_paths)
+
+
+def _split_for_speech(text: str) -> list[str]:
+    """
+    Splits text into chunks for pipelined synthesis. The first chunk is a
+    single sentence so audio can start quickly; later chunks group sentences
+    up to TTS_CHUNK_CHARS to keep the number of model calls down.
+    """
+    sentences = [s.strip() for s in _SENTENCE_BOUNDARY.split(text) if s.strip()]
+    if not sentences:
+        return []
+    chunks = [sentences[0]]
+    current = ""
+    for sentence in sentences[1:]:
+        if current and len(current) + len(sentence) + 1 > TTS_CHUNK_CHARS:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _wav_header(pcm_length: int = 0xFFFFFFFF) -> bytes:
+    """
+    Builds a 44-byte WAV header for 24kHz 16-bit mono PCM. The default length
+    marks the data as unbounded, which players treat as "read until EOF".
+    """
+    riff_length = min(pcm_length + 36, 0xFFFFFFFF)
+    byte_rate = TTS_SAMPLE_RATE * TTS_SAMPLE_WIDTH
+    return (
+        b"RIFF" + struct.pack("<I", riff_length) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, TTS_SAMPLE_RATE, byte_rate, TTS_SAMPLE_WIDTH, TTS_SAMPLE_WIDTH * 8)
+        + b"data" + struct.pack("<I", pcm_length)
+    )
+
+
+async def synthesize_pcm(text: str) -> bytes:
+    """
+    Generates speech from text using Gemini TTS and returns the raw PCM
+    (24kHz, 16-bit, mono).
+
+    Results are cached by (text, voice, model), so replaying a message does
+    not call the model again.
+    """
+    cache_key = tts_cache.key(text, TTS_VOICE_NAME, TTS_MODEL_NAME)
+    cached_audio = await tts_cache.get(cache_key)
+    if cached_audio is not None:
+        return cached_audio
+
+    response = await scheduler.generate_content(
+        "tts",
+        dedupe=True,
+        model=TTS_MODEL_NAME,
+        contents=text,
+        config=GenerateContentConfig(
+            response_modalities=["AUDIO"],
+            speech_config=SpeechConfig(
+                voice_config=VoiceConfig(
+                    prebuilt_voice_config=PrebuiltVoiceConfig(
+                        voice_name=TTS_VOICE_NAME,
+                    )
+                )
+            ),
+        ),
+    )
+
+    raw_audio_data = response.candidates[0].content.parts[0].inline_data.data
+
+    if not raw_audio_data:
+        raise HTTPException(
+            status_code=500,
+            detail="Speech synthesis failed, no audio content received.",
+        )
+
+    await tts_cache.put(cache_key, raw_audio_data)
+    return raw_audio_data
+
+
+async def synthesize_speech(text: str) -> bytes:
+    """
+    Generates speech from text and returns it as a complete WAV file.
+    """
+    raw_audio_data = await synthesize_pcm(text)
+    return _wav_header(len(raw_audio_data)) + raw_audio_data
 
-        # The API returns raw PCM data. We must package it into a WAV container
-        # before sending to the browser, which expects a proper audio file format.
-        wav_buffer = io.BytesIO()
-        with wave.open(wav_buffer, "wb") as wf:
-            wf.setnchannels(1)  # Mono channel
-            wf.setsampwidth(2)  # 16-bit samples
-            wf.setframerate(24000)  # 24kHz sample rate
-            wf.writeframes(raw_audio_data)
 
-        wav_data = wav_buffer.getvalue()
+async def stream_speech_audio(text: str) -> AsyncGenerator[bytes, None]:
+    """
+    Streams speech for `text` as a WAV file. The text is split into sentences
+    which are synthesized up to TTS_PIPELINE_DEPTH chunks ahead of playback,
+    and each chunk's PCM is sent as soon as it and everything before it is
+    ready.
+
+    The first item is the WAV header together with the first sentence's
+    audio, so a failure there can still be reported before anything is sent
+    (see `text_to_speech_stream`). A later failure is raised, which aborts
+    the response rather than ending it as if the audio were complete.
+    """
+    chunks = _split_for_speech(text)
+    pending: deque[asyncio.Task] = deque()
+    next_chunk = 0
+
+    def schedule():
+        nonlocal next_chunk
+        while next_chunk < len(chunks) and len(pending) < TTS_PIPELINE_DEPTH:
+            pending.append(asyncio.create_task(synthesize_pcm(chunks[next_chunk])))
+            next_chunk += 1
+
+    try:
+        schedule()
+        header = _wav_header()
+        while pending:
+            pcm = await pending.popleft()
+            schedule()
+            yield header + pcm
+            header = b""
+    finally:
+        for task in pending:
+            task.cancel()
+
 
+async def generate_speech_audio(text: str) -> str:
+    """
+    Generates speech from text using Gemini TTS and returns it as a base64 encoded
+    WAV string.
+    """
+    try:
+        wav_data = await synthesize_speech(text)
         return base64.b64encode(wav_data).decode("utf-8")
 
     except Exception as e:
         print(f"An error occurred during speech synthesis: {e}")
         raise HTTPException(
             status_code=500, detail=f"Failed to synthesize speech: {str(e)}"
-        ) 
\ No newline at end of file
+        )
@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import os
+import uuid
+from abc import ABC, abstractmethod
+from typing import Iterable
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from ..database import db, conversation_entries_collection, MONGO_BACKEND
+
+# Which backend stores binary payloads such as voice recordings: "gridfs"
+# (the default, uses the existing MongoDB) or "local" (a directory). The
+# in-memory database has no GridFS, so it defaults to "local".
+BLOB_STORE = os.getenv("BLOB_STORE", "local" if MONGO_BACKEND == "memory" else "gridfs")
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "blobs")
+
+
+class BlobStore(ABC):
+    """
+    Content-addressed storage for binary payloads kept out of MongoDB documents.
+
+    Blobs are identified by the SHA-256 of their content, so storing the same
+    recording twice keeps a single copy.
+    """
+
+    @abstractmethod
+    async def put(self, data: bytes, content_type: str) -> str:
+        """
+        Stores `data` and returns its blob id.
+        """
+
+    @abstractmethod
+    async def get(self, blob_id: str) -> tuple[bytes, str] | None:
+        """
+        Returns the blob's bytes and content type, or None if it is missing.
+        """
+
+    @abstractmethod
+    async def delete(self, blob_id: str):
+        """
+        Deletes the blob; a missing blob is not an error.
+        """
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, blob_id: str) -> str:
+        if len(blob_id) != 64 or not all(c in "0123456789abcdef" for c in blob_id):
+            raise ValueError(f"Invalid blob id: {blob_id}")
+        return os.path.join(self.directory, blob_id[:2], blob_id)
+
+    def _write(self, blob_id: str, data: bytes, content_type: str):
+        path = self._path(blob_id)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Unique per write, since the same recording may be stored twice at once.
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            with open(f"{path}.type", "w") as f:
+                f.write(content_type)
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _read(self, blob_id: str) -> tuple[bytes, str] | None:
+        path = self._path(blob_id)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            with open(f"{path}.type") as f:
+                content_type = f.read().strip()
+        except FileNotFoundError:
+            content_type = "application/octet-stream"
+        return data, content_type
+
+    def _remove(self, blob_id: str):
+        path = self._path(blob_id)
+        for p in (path, f"{path}.type"):
+            if os.path.exists(p):
+                os.remove(p)
+
+    async def put(self, data: bytes, content_type: str) -> str:
+        blob_id = await asyncio.to_thread(_sha256, data)
+        await asyncio.to_thread(self._write, blob_id, data, content_type)
+        return blob_id
+
+    async def get(self, blob_id: str) -> tuple[bytes, str] | None:
+        return await asyncio.to_thread(self._read, blob_id)
+
+    async def delete(self, blob_id: str):
+        await asyncio.to_thread(self._remove, blob_id)
+
+
+class GridFSBlobStore(BlobStore):
+    def __init__(self, database, bucket_name: str = "blobs"):
+        self.bucket = AsyncIOMotorGridFSBucket(database, bucket_name=bucket_name)
+        self.files = database.get_collection(f"{bucket_name}.files")
+
+    async def put(self, data: bytes, content_type: str) -> str:
+        blob_id = await asyncio.to_thread(_sha256, data)
+        if not await self.files.find_one({"filename": blob_id}, projection={"_id": 1}):
+            await self.bucket.upload_from_stream(
+                blob_id, data, metadata={"contentType": content_type}
+            )
+        return blob_id
+
+    async def get(self, blob_id: str) -> tuple[bytes, str] | None:
+        document = await self.files.find_one({"filename": blob_id})
+        if not document:
+            return None
+        stream = await self.bucket.open_download_stream(document["_id"])
+        data = await stream.read()
+        return data, (document.get("metadata") or {}).get("contentType", "application/octet-stream")
+
+    async def delete(self, blob_id: str):
+        async for document in self.files.find({"filename": blob_id}, projection={"_id": 1}):
+            await self.bucket.delete(document["_id"])
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _create_blob_store(bucket_name: str = "blobs") -> BlobStore:
+    if BLOB_STORE == "local":
+        # Recordings sit at the top of the directory, other buckets below it.
+        directory = BLOB_STORE_DIR if bucket_name == "blobs" else os.path.join(BLOB_STORE_DIR, bucket_name)
+        return LocalBlobStore(directory)
+    if BLOB_STORE == "gridfs":
+        return GridFSBlobStore(db, bucket_name)
+    raise ValueError(f"Unknown BLOB_STORE: {BLOB_STORE}")
+
+
+# Voice recordings, served by the /audio/recordings route.
+blob_store = _create_blob_store()
+# Request profiles, kept apart so that the recordings route cannot serve them.
+profile_blob_store = _create_blob_store("profiles")
+
+
+async def store_audio(audio_bytes: bytes, mime_type: str) -> dict:
+    """
+    Stores a recording and returns the reference kept in a conversation entry.
+    """
+    blob_id = await blob_store.put(audio_bytes, mime_type)
+    return {"blob_id": blob_id, "sha256": blob_id, "mimeType": mime_type, "size": len(audio_bytes)}
+
+
+async def release_audio(blob_ids: Iterable[str]):
+    """
+    Deletes the recordings in `blob_ids` that no conversation entry refers to
+    any more. Called after a project's entries are deleted; a recording also
+    sent in another project is kept for that project.
+    """
+    for blob_id in blob_ids:
+        if not await conversation_entries_collection.find_one({"data.audio_ref.blob_id": blob_id}, projection={"_id": 1}):
+            await blob_store.delete(blob_id)
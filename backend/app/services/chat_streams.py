@@ -0,0 +1,46 @@
+import asyncio
+import os
+from typing import Dict
+from .sse import EventBuffer
+
+# What happens to a chat turn when its client disconnects: "detach" keeps
+# generating into the turn's event buffer, so the client can reconnect and
+# resume; "cancel" stops the model call at once (the partial reply is saved).
+CHAT_DISCONNECT_MODE = os.getenv("CHAT_DISCONNECT_MODE", "detach")
+# Seconds a finished turn's events stay available for resuming.
+CHAT_STREAM_RETENTION_SECONDS = float(os.getenv("CHAT_STREAM_RETENTION_SECONDS", "120"))
+
+# Event buffers of running and recently finished chat turns, by project and
+# stream id. Detached producers are kept alive by their entry here.
+_streams: Dict[tuple[str, str], tuple[EventBuffer, asyncio.Task]] = {}
+
+
+def register(project_id: str, events: EventBuffer, producer: asyncio.Task):
+    """
+    Makes a turn's events resumable until CHAT_STREAM_RETENTION_SECONDS after
+    its producer finishes.
+    """
+    key = (project_id, events.stream_id)
+    _streams[key] = (events, producer)
+
+    def expire():
+        if key in _streams and _streams[key][1] is producer:
+            del _streams[key]
+
+    producer.add_done_callback(lambda _: asyncio.get_running_loop().call_later(CHAT_STREAM_RETENTION_SECONDS, expire))
+
+
+def find(project_id: str, last_event_id: str) -> EventBuffer:
+    """
+    Returns the event buffer a Last-Event-ID belongs to, after checking that
+    the events following it are still there. Raises LookupError if the
+    stream is unknown (or expired) and ResumeUnavailable if it can no longer
+    be resumed from that event.
+    """
+    stream_id = last_event_id.rpartition(".")[0]
+    stream = _streams.get((project_id, stream_id))
+    if stream is None:
+        raise LookupError(f"No chat stream for event {last_event_id}.")
+    events = stream[0]
+    events.check_resume(last_event_id)
+    return events
@@ -0,0 +1,164 @@
+import os
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List
+from google.genai.types import Content, Part
+from ..models import ConversationEntry, SpecPhase
+from . import project_service, artifacts
+
+# Number of projects whose prebuilt model history is kept in memory.
+CONTEXT_CACHE_MAX_PROJECTS = int(os.getenv("CONTEXT_CACHE_MAX_PROJECTS", "256"))
+# History size, in tokens, above which finished phases are sent as summaries.
+CHAT_CONTEXT_MAX_TOKENS = int(os.getenv("CHAT_CONTEXT_MAX_TOKENS", "24000"))
+# Number of most recent turns (a message and its reply) always sent verbatim.
+CHAT_CONTEXT_RECENT_TURNS = int(os.getenv("CHAT_CONTEXT_RECENT_TURNS", "6"))
+
+
+@dataclass
+class _CachedEntry:
+    entry: ConversationEntry
+    content: Content
+    tokens: int
+
+
+@dataclass
+class _PhaseSummary:
+    # Number of entries the summary was made from.
+    entry_count: int
+    content: Content
+
+
+@dataclass
+class _CachedHistory:
+    entry_count: int = 0
+    entries: List[_CachedEntry] = field(default_factory=list)
+    tokens: int = 0
+    # Keyed by phase; None holds the entries that predate phase tracking.
+    summaries: Dict[SpecPhase | None, _PhaseSummary] = field(default_factory=dict)
+
+    def append(self, entry: ConversationEntry):
+        content = entry_to_content(entry)
+        if content is None:
+            return
+        tokens = entry.token_count or estimate_tokens(entry.content)
+        self.entries.append(_CachedEntry(entry, content, tokens))
+        self.tokens += tokens
+
+
+_cache: "OrderedDict[str, _CachedHistory]" = OrderedDict()
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Approximates the number of model tokens in `text` (about four characters each).
+    """
+    return len(text) // 4 + 1
+
+
+def entry_to_content(entry: ConversationEntry) -> Content | None:
+    """
+    Converts a stored conversation entry into a model Content object.
+    """
+    if not entry.content:
+        return None
+    role = "user" if entry.role == "user" else "model"
+    return Content(role=role, parts=[Part(text=entry.content)])
+
+
+async def get_history_contents(project_id: str, conversation_length: int, current_phase: SpecPhase) -> List[Content]:
+    """
+    Returns the model Content list for the first `conversation_length` entries
+    of a project's stored conversation.
+
+    Entries are cached per project, so only entries added since the previous
+    call are read from the database and converted. While the history fits in
+    CHAT_CONTEXT_MAX_TOKENS it is returned verbatim; beyond that, see
+    `_compact`. The returned list is a copy and may be extended freely.
+    """
+    cached = _cache.get(project_id)
+    if cached is None or cached.entry_count > conversation_length:
+        # Unknown project, or the history shrank underneath us: start over.
+        cached = _CachedHistory()
+
+    if cached.entry_count < conversation_length:
+        entries = await project_service.get_conversation_entries(
+            project_id, start_seq=cached.entry_count, end_seq=conversation_length
+        )
+        for entry in entries:
+            cached.append(entry)
+        if entries:
+            cached.entry_count = entries[-1].seq + 1
+
+    _cache[project_id] = cached
+    _cache.move_to_end(project_id)
+    while len(_cache) > CONTEXT_CACHE_MAX_PROJECTS:
+        _cache.popitem(last=False)
+
+    if cached.tokens <= CHAT_CONTEXT_MAX_TOKENS:
+        return [cached_entry.content for cached_entry in cached.entries]
+    return await _compact(project_id, cached, current_phase)
+
+
+async def _compact(project_id: str, cached: _CachedHistory, current_phase: SpecPhase) -> List[Content]:
+    """
+    Replaces the entries of finished phases with one summary per phase, and
+    the entries that predate phase tracking with one more. The last
+    CHAT_CONTEXT_RECENT_TURNS turns and the current phase are always sent
+    verbatim; a phase with entries among the recent turns is not summarized yet.
+    """
+    recent_start = max(0, len(cached.entries) - 2 * CHAT_CONTEXT_RECENT_TURNS)
+    phases = list(SpecPhase)
+    finished = {None, *phases[:phases.index(current_phase)]}
+    finished -= {cached_entry.entry.phase for cached_entry in cached.entries[recent_start:]}
+
+    grouped: Dict[SpecPhase | None, List[ConversationEntry]] = {}
+    for cached_entry in cached.entries[:recent_start]:
+        if cached_entry.entry.phase in finished:
+            grouped.setdefault(cached_entry.entry.phase, []).append(cached_entry.entry)
+    if not grouped:
+        return [cached_entry.content for cached_entry in cached.entries]
+
+    stale = {
+        phase: entries for phase, entries in grouped.items()
+        if phase not in cached.summaries or cached.summaries[phase].entry_count != len(entries)
+    }
+    if stale:
+        summaries = await artifacts.summarize_phases(project_id, stale)
+        for phase, summary in summaries.items():
+            title = f"the {phase.value} phase" if phase else "the start of the conversation"
+            content = Content(role="user", parts=[Part(text=f"[Summary of {title}]\n{summary}")])
+            cached.summaries[phase] = _PhaseSummary(len(stale[phase]), content)
+
+    # In sequence order, with each summary where its phase's first entry was.
+    contents = []
+    summarized = set()
+    for cached_entry in cached.entries:
+        phase = cached_entry.entry.phase
+        if phase in grouped:
+            if phase not in summarized:
+                summarized.add(phase)
+                contents.append(cached.summaries[phase].content)
+            continue
+        contents.append(cached_entry.content)
+    return contents
+
+
+def extend(project_id: str, start_seq: int, end_seq: int, entries: List[ConversationEntry]):
+    """
+    Records entries just written with sequence numbers in [start_seq, end_seq)
+    so the next turn does not have to read them back. Does nothing unless the
+    cached history ends exactly at `start_seq`.
+    """
+    cached = _cache.get(project_id)
+    if cached is None or cached.entry_count != start_seq:
+        return
+    for entry in entries:
+        cached.append(entry)
+    cached.entry_count = end_seq
+
+
+def invalidate(project_id: str):
+    """
+    Drops the cached history for a project.
+    """
+    _cache.pop(project_id, None)
@@ -0,0 +1,97 @@
+import re
+from dataclasses import dataclass
+from typing import List, Union
+
+PHASE_COMPLETE_TOKEN = "[PHASE_COMPLETE]"
+RENAME_PROJECT_PREFIX = "[RENAME_PROJECT:"
+# Longest project name accepted from a rename token.
+MAX_PROJECT_NAME_CHARS = 200
+
+_RENAME = re.compile(r'\[RENAME_PROJECT:[ \t]*"([^"\n]{1,%d})"[ \t]*\]' % MAX_PROJECT_NAME_CHARS)
+# A rename token that has started but may still be completed by more text.
+_RENAME_PARTIAL = re.compile(r'\[RENAME_PROJECT:[ \t]*(?:"[^"\n]{0,%d}(?:"[ \t]*)?)?\Z' % MAX_PROJECT_NAME_CHARS)
+
+
+@dataclass
+class ControlToken:
+    kind: str  # "phase_complete" or "rename"
+    value: str | None = None
+
+
+class ControlTokenScanner:
+    """
+    Strips the assistant's control tokens out of streamed reply text.
+
+    Text is fed in as it arrives and comes back as a list of plain text
+    segments and ControlTokens, in order. Only text from a "[" that could
+    still begin a token is held back until the next chunk decides it, so
+    tokens split across chunks are found and ordinary text is never delayed
+    by more than one chunk. Held text is bounded by the longest token, and
+    text already passed through is never scanned again.
+    """
+
+    def __init__(self):
+        self._pending = ""
+
+    def feed(self, text: str) -> List[Union[str, ControlToken]]:
+        buffer = self._pending + text
+        self._pending = ""
+        segments: List[Union[str, ControlToken]] = []
+        start = 0
+        position = 0
+        while True:
+            bracket = buffer.find("[", position)
+            if bracket < 0:
+                break
+            status, end, token = self._match(buffer, bracket)
+            if status == "partial":
+                self._pending = buffer[bracket:]
+                buffer = buffer[:bracket]
+                break
+            if status == "match":
+                if bracket > start:
+                    segments.append(buffer[start:bracket])
+                if token is not None:
+                    segments.append(token)
+                start = position = end
+            else:
+                position = bracket + 1
+        if start < len(buffer):
+            segments.append(buffer[start:])
+        return segments
+
+    def finish(self) -> List[Union[str, ControlToken]]:
+        """
+        Flushes held text at the end of the stream. An unfinished token is
+        returned as plain text.
+        """
+        pending, self._pending = self._pending, ""
+        return [pending] if pending else []
+
+    @staticmethod
+    def _match(buffer: str, start: int) -> tuple[str, int, ControlToken | None]:
+        """
+        Classifies the text at `start` (a "[") as a complete token ("match"),
+        a possible token cut off by the end of the buffer ("partial"), or
+        ordinary text ("none"). A rename to a blank name matches, so it is
+        removed from the text, but carries no token.
+        """
+        rest = len(buffer) - start
+        if buffer.startswith(PHASE_COMPLETE_TOKEN, start):
+            return "match", start + len(PHASE_COMPLETE_TOKEN), ControlToken("phase_complete")
+        if rest < len(PHASE_COMPLETE_TOKEN) and PHASE_COMPLETE_TOKEN.startswith(buffer[start:]):
+            return "partial", 0, None
+
+        if rest < len(RENAME_PROJECT_PREFIX):
+            if RENAME_PROJECT_PREFIX.startswith(buffer[start:]):
+                return "partial", 0, None
+            return "none", 0, None
+        if not buffer.startswith(RENAME_PROJECT_PREFIX, start):
+            return "none", 0, None
+        rename = _RENAME.match(buffer, start)
+        if rename:
+            name = rename.group(1).strip()
+            return "match", rename.end(), ControlToken("rename", name) if name else None
+        if _RENAME_PARTIAL.match(buffer, start):
+            return "partial", 0, None
+        return "none", 0, None
@@ -0,0 +1,273 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from typing import AsyncGenerator, Dict, List
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from ..database import jobs_collection
+from ..models import Job, JobStatus
+from . import sse
+from .artifacts import ArtifactSpec, artifact_stream
+
+# Jobs run at once in this process; further jobs wait in the queue.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Jobs allowed to wait; submitting more fails with JobQueueFull.
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "100"))
+# Seconds between writes of a running job's output to the database.
+JOB_FLUSH_INTERVAL = float(os.getenv("JOB_FLUSH_INTERVAL", "1.0"))
+# A job not written to for this many seconds (e.g. its process died) no
+# longer counts as running, so an identical job can be submitted again.
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "600"))
+# Seconds between heartbeats that keep this process's queued and running
+# jobs from going stale. Must be well below JOB_STALE_SECONDS.
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "30"))
+# Seconds between database polls when following a job run by another process.
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class _JobRun:
+    """
+    A job queued or running in this process, with its output so far for
+    subscribers.
+    """
+
+    def __init__(self, job_id: str, spec: ArtifactSpec):
+        self.job_id = job_id
+        self.spec = spec
+        self.chunks: List[str] = []
+        self.done = False
+        self._changed = asyncio.Event()
+
+    def notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait(self):
+        await self._changed.wait()
+
+
+_queue: asyncio.Queue | None = None
+_workers: List[asyncio.Task] = []
+_heartbeat: asyncio.Task | None = None
+# Jobs queued or running in this process, by job id.
+_runs: Dict[str, _JobRun] = {}
+_submit_lock = asyncio.Lock()
+
+
+def start_workers():
+    """
+    Starts the worker pool. Called when the application starts.
+    """
+    global _queue, _heartbeat
+    _queue = asyncio.Queue(maxsize=JOB_MAX_QUEUED)
+    _workers.extend(asyncio.create_task(_worker()) for _ in range(JOB_WORKERS))
+    _heartbeat = asyncio.create_task(_beat())
+
+
+async def stop_workers():
+    """
+    Stops the worker pool; running and queued jobs are recorded as failed.
+    """
+    global _heartbeat
+    if _heartbeat is not None:
+        _heartbeat.cancel()
+        _heartbeat = None
+    for worker in _workers:
+        worker.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+    queued = []
+    while _queue is not None and not _queue.empty():
+        queued.append(_queue.get_nowait())
+    if queued:
+        now = datetime.now()
+        await jobs_collection.update_many(
+            {"_id": {"$in": [ObjectId(run.job_id) for run in queued]}, "active": True},
+            {"$set": {"status": JobStatus.FAILED.value, "error": "The server stopped before the job ran.", "finished_at": now, "updated_at": now},
+             "$unset": {"active": ""}},
+        )
+    for run in queued:
+        _finish(run)
+
+
+async def _beat():
+    """
+    Marks this process's queued and running jobs as alive, so that waiting
+    in a long queue does not make them look stale.
+    """
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+        if not _runs:
+            continue
+        try:
+            await jobs_collection.update_many(
+                {"_id": {"$in": [ObjectId(job_id) for job_id in _runs]}, "active": True},
+                {"$set": {"updated_at": datetime.now()}},
+            )
+        except Exception as e:
+            print(f"Error recording job heartbeat: {e}")
+
+
+def _finish(run: _JobRun):
+    run.done = True
+    run.notify()
+    _runs.pop(run.job_id, None)
+
+
+def _job(document: dict, offset: int = 0) -> Job:
+    output = document.get("output") or ""
+    return Job(**{**document, "output": output[offset:], "output_offset": offset, "output_length": len(output)})
+
+
+async def submit(spec: ArtifactSpec) -> Job:
+    """
+    Queues the generation of `spec`'s document and returns the job.
+
+    An identical job (same project, kind, variant and history) that is
+    still queued or running is returned instead of starting another one.
+    """
+    selector = {"project_id": ObjectId(spec.project_id), "kind": spec.kind, "variant": spec.variant, "key": spec.key}
+    async with _submit_lock:
+        await jobs_collection.update_many(
+            {**selector, "active": True, "updated_at": {"$lt": datetime.now() - timedelta(seconds=JOB_STALE_SECONDS)}},
+            {"$set": {"status": JobStatus.FAILED.value, "error": "The job stopped responding.", "finished_at": datetime.now()},
+             "$unset": {"active": ""}},
+        )
+        existing = await jobs_collection.find_one({**selector, "active": True})
+        if existing:
+            return _job(existing)
+        if _queue is None or _queue.full():
+            raise JobQueueFull()
+
+        now = datetime.now()
+        document = {
+            **selector,
+            "status": JobStatus.QUEUED.value,
+            "active": True,
+            "output": "",
+            "created_at": now,
+            "updated_at": now,
+        }
+        try:
+            result = await jobs_collection.insert_one(document)
+        except DuplicateKeyError:
+            # Submitted by another process just now.
+            return _job(await jobs_collection.find_one({**selector, "active": True}))
+        document["_id"] = result.inserted_id
+
+        run = _JobRun(str(result.inserted_id), spec)
+        _runs[run.job_id] = run
+        _queue.put_nowait(run)
+    return _job(document)
+
+
+async def _worker():
+    while True:
+        run = await _queue.get()
+        try:
+            await _run(run)
+        except Exception as e:
+            print(f"Error running job {run.job_id}: {e}")
+        finally:
+            _queue.task_done()
+
+
+async def _run(run: _JobRun):
+    job_id = ObjectId(run.job_id)
+    # Only a job that is still active is run; one given up as stale while it
+    # waited has been failed already, and an identical job may have replaced it.
+    result = await jobs_collection.update_one(
+        {"_id": job_id, "active": True},
+        {"$set": {"status": JobStatus.RUNNING.value, "started_at": datetime.now(), "updated_at": datetime.now()}},
+    )
+    if result.matched_count == 0:
+        _finish(run)
+        return
+    # Replaced below; anything else that ends the job (a BaseException the
+    # handlers let through) still leaves it failed rather than running.
+    update = {"status": JobStatus.FAILED.value, "error": "The job stopped unexpectedly."}
+    try:
+        flushed_at = time.monotonic()
+        async for chunk in artifact_stream(run.spec):
+            run.chunks.append(chunk)
+            run.notify()
+            if time.monotonic() - flushed_at >= JOB_FLUSH_INTERVAL:
+                flushed_at = time.monotonic()
+                await jobs_collection.update_one(
+                    {"_id": job_id, "active": True},
+                    {"$set": {"output": "".join(run.chunks), "updated_at": datetime.now()}},
+                )
+        update = {"status": JobStatus.SUCCEEDED.value}
+    except asyncio.CancelledError:
+        update = {"status": JobStatus.FAILED.value, "error": "The server stopped while the job was running."}
+        raise
+    except Exception as e:
+        print(f"Job {run.job_id} failed: {e}")
+        update = {"status": JobStatus.FAILED.value, "error": str(e)}
+    finally:
+        now = datetime.now()
+        await asyncio.shield(jobs_collection.update_one(
+            {"_id": job_id, "active": True},
+            {"$set": {**update, "output": "".join(run.chunks), "finished_at": now, "updated_at": now},
+             "$unset": {"active": ""}},
+        ))
+        _finish(run)
+
+
+async def get_job(project_id: str, job_id: str, offset: int = 0) -> Job | None:
+    """
+    Returns a job with its output from `offset` on, so pollers can fetch
+    only what is new.
+    """
+    document = await jobs_collection.find_one({"_id": ObjectId(job_id), "project_id": ObjectId(project_id)})
+    return _job(document, offset) if document else None
+
+
+async def list_jobs(project_id: str, limit: int = 20) -> List[Job]:
+    """
+    Lists a project's jobs, newest first, without their output.
+    """
+    cursor = jobs_collection.find(
+        {"project_id": ObjectId(project_id)}, projection={"output": 0}
+    ).sort("created_at", -1).limit(limit)
+    return [_job(document) async for document in cursor]
+
+
+async def job_events(project_id: str, job_id: str) -> AsyncGenerator[bytes, None]:
+    """
+    Follows a job as server-sent events: its output so far, then new output
+    as it is generated, then a final "done" event with the job's status.
+    Jobs running in this process are followed live; others by polling.
+    """
+    run = _runs.get(job_id)
+    if run is not None and run.spec.project_id == project_id:
+        position = 0
+        while True:
+            if position < len(run.chunks):
+                content = "".join(run.chunks[position:])
+                position = len(run.chunks)
+                yield sse.encode_event({"type": "output", "content": content})
+            elif run.done:
+                break
+            else:
+                await run.wait()
+
+    offset = 0 if run is None else len("".join(run.chunks))
+    while True:
+        job = await get_job(project_id, job_id, offset)
+        if job is None:
+            yield sse.encode_event({"type": "error", "detail": "Job not found"})
+            return
+        if job.output:
+            offset = job.output_length
+            yield sse.encode_event({"type": "output", "content": job.output})
+        if job.status in (JobStatus.SUCCEEDED, JobStatus.FAILED):
+            yield sse.encode_event({"type": "done", "status": job.status.value, "error": job.error})
+            return
+        await asyncio.sleep(JOB_POLL_INTERVAL)
@@ -0,0 +1,285 @@
+import asyncio
+import copy
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import random
+import time
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Dict, List
+from google.genai import errors
+from pydantic import BaseModel
+from ..client import get_client
+from ..metrics import (
+    model_call_seconds,
+    model_calls_in_flight,
+    model_first_chunk_seconds,
+    model_queue_seconds,
+    model_retries_total,
+    span,
+)
+
+# Upper bound on model calls in flight across the whole backend.
+MODEL_MAX_CONCURRENCY = int(os.getenv("MODEL_MAX_CONCURRENCY", "32"))
+# Per-endpoint limits, overridable as e.g. MODEL_ENDPOINT_CONCURRENCY="prd=2,review=2".
+DEFAULT_ENDPOINT_CONCURRENCY = {
+    "chat": 24,
+    "transcribe": 8,
+    "tts": 8,
+    "edit": 4,
+    "prd": 4,
+    "review": 4,
+    "summary": 4,
+}
+# Interactive endpoints are served first when callers queue for a slot.
+INTERACTIVE_ENDPOINTS = {"chat", "transcribe", "tts", "edit"}
+# Retries for rate limiting (429) and server errors (5xx), with full jitter.
+MODEL_RETRY_ATTEMPTS = int(os.getenv("MODEL_RETRY_ATTEMPTS", "4"))
+MODEL_RETRY_BASE_DELAY = float(os.getenv("MODEL_RETRY_BASE_DELAY", "0.5"))
+MODEL_RETRY_MAX_DELAY = float(os.getenv("MODEL_RETRY_MAX_DELAY", "8.0"))
+
+
+def _endpoint_limits() -> Dict[str, int]:
+    limits = dict(DEFAULT_ENDPOINT_CONCURRENCY)
+    for item in os.getenv("MODEL_ENDPOINT_CONCURRENCY", "").split(","):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            limits[name.strip()] = int(value)
+    return limits
+
+
+def is_retryable(error: Exception) -> bool:
+    return isinstance(error, errors.APIError) and (error.code == 429 or (error.code or 0) >= 500)
+
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json", exclude_none=True)
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
+
+
+def request_key(endpoint: str, model: str, contents: Any, config: Any) -> str:
+    payload = json.dumps([endpoint, model, _plain(contents), _plain(config)], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PrioritySemaphore:
+    """
+    A semaphore whose waiters are woken lowest priority value first, then in
+    arrival order.
+    """
+
+    def __init__(self, value: int):
+        self._value = value
+        self._waiters: List[tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+
+    async def acquire(self, priority: int):
+        if self._value > 0 and not self._waiters:
+            self._value -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Woken and cancelled at the same time: pass the slot on.
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._value += 1
+
+
+class _Flight:
+    """
+    One upstream call shared by every identical request made while it runs.
+    Items are recorded so that late subscribers replay them from the start.
+
+    When the last subscriber leaves before the call finishes, the flight is
+    abandoned: it is forgotten at once (so an identical request starts a new
+    call rather than joining a dying one) and its task is cancelled.
+    """
+
+    def __init__(self, source: Callable[[], AsyncIterator[Any]], on_done: Callable[[], None]):
+        self.items: List[Any] = []
+        self.error: BaseException | None = None
+        self.done = False
+        self.abandoned = False
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._on_done = on_done
+        self._task = asyncio.create_task(self._run(source))
+
+    async def _run(self, source):
+        try:
+            async for item in source():
+                self.items.append(item)
+                self._changed.set()
+        except asyncio.CancelledError:
+            self.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._changed.set()
+            self._on_done()
+
+    async def subscribe(self) -> AsyncGenerator[Any, None]:
+        self.subscribers += 1
+        position = 0
+        try:
+            while True:
+                while position < len(self.items):
+                    yield self.items[position]
+                    position += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self._subscriber_error() from self.error
+                    return
+                self._changed.clear()
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done and not self.abandoned:
+                # Nobody is listening any more.
+                self.abandoned = True
+                self._on_done()
+                self._task.cancel()
+
+    def _subscriber_error(self) -> BaseException:
+        """
+        A separate copy of the call's error for each subscriber, so raising
+        it in one task does not alter the traceback another one sees.
+        """
+        if isinstance(self.error, asyncio.CancelledError):
+            # The subscriber itself was not cancelled.
+            return RuntimeError("The shared model call was cancelled.")
+        return copy.copy(self.error)
+
+
+class ModelScheduler:
+    """
+    Front door for model calls.
+
+    Every call names the endpoint it serves. Calls are limited per endpoint
+    and overall, with interactive endpoints ahead of batch ones in the queue
+    for a slot. Rate-limit and server errors are retried with jittered
+    exponential backoff; a stream is only retried if it failed before its
+    first chunk. With `dedupe`, identical calls made while one is in flight
+    share its result.
+    """
+
+    def __init__(self, genai_client=None, max_concurrency: int = MODEL_MAX_CONCURRENCY, endpoint_limits: Dict[str, int] | None = None):
+        self._client = genai_client
+        self._slots = PrioritySemaphore(max_concurrency)
+        self._endpoint_limits = endpoint_limits or _endpoint_limits()
+        self._endpoint_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._flights: Dict[str, _Flight] = {}
+
+    async def _get_client(self):
+        # The shared client unless one was given, created on first use.
+        if self._client is None:
+            self._client = await get_client()
+        return self._client
+
+    def _endpoint_semaphore(self, endpoint: str) -> asyncio.Semaphore:
+        semaphore = self._endpoint_semaphores.get(endpoint)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self._endpoint_limits.get(endpoint, MODEL_MAX_CONCURRENCY))
+            self._endpoint_semaphores[endpoint] = semaphore
+        return semaphore
+
+    async def _with_slot(self, endpoint: str, model: str, call: Callable[[], AsyncIterator[Any]]) -> AsyncGenerator[Any, None]:
+        """
+        Runs `call` holding an endpoint slot and a global slot, retrying it
+        while it fails retryably before producing anything. Each attempt's
+        queue wait, time to first chunk and duration are recorded.
+        """
+        priority = 0 if endpoint in INTERACTIVE_ENDPOINTS else 1
+        attempt = 0
+        while True:
+            started = False
+            queued_at = time.perf_counter()
+            async with self._endpoint_semaphore(endpoint):
+                await self._slots.acquire(priority)
+                sent_at = time.perf_counter()
+                model_queue_seconds.observe(sent_at - queued_at, endpoint=endpoint)
+                outcome = "cancelled"
+                try:
+                    with span(f"model.{endpoint}", model=model, attempt=attempt), model_calls_in_flight.track(endpoint=endpoint):
+                        async for item in call():
+                            if not started:
+                                started = True
+                                model_first_chunk_seconds.observe(time.perf_counter() - sent_at, endpoint=endpoint, model=model)
+                            yield item
+                    outcome = "ok"
+                    return
+                except Exception as e:
+                    outcome = "error"
+                    attempt += 1
+                    if started or attempt >= MODEL_RETRY_ATTEMPTS or not is_retryable(e):
+                        raise
+                    model_retries_total.inc(endpoint=endpoint, code=e.code)
+                    delay = random.uniform(0, min(MODEL_RETRY_MAX_DELAY, MODEL_RETRY_BASE_DELAY * 2 ** attempt))
+                    print(f"Model call for {endpoint} failed ({e.code}); retrying in {delay:.2f}s")
+                finally:
+                    model_call_seconds.observe(time.perf_counter() - sent_at, endpoint=endpoint, model=model, outcome=outcome)
+                    self._slots.release()
+            await asyncio.sleep(delay)
+
+    def _shared(self, key: str | None, source: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        if key is None:
+            return source()
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(source, lambda: self._forget(key, flight))
+            self._flights[key] = flight
+        return flight.subscribe()
+
+    def _forget(self, key: str, flight: _Flight):
+        # A flight abandoned earlier may finish after a new one took its key.
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def generate_content(self, endpoint: str, *, model: str, contents: Any, config: Any = None, dedupe: bool = False):
+        """
+        Scheduled `client.aio.models.generate_content`.
+        """
+        async def call():
+            client = await self._get_client()
+            yield await client.aio.models.generate_content(model=model, contents=contents, config=config)
+
+        key = request_key(endpoint, model, contents, config) if dedupe else None
+        response = None
+        async for response in self._shared(key, lambda: self._with_slot(endpoint, model, call)):
+            pass
+        return response
+
+    async def generate_content_stream(self, endpoint: str, *, model: str, contents: Any, config: Any = None, dedupe: bool = False) -> AsyncGenerator[Any, None]:
+        """
+        Scheduled `client.aio.models.generate_content_stream`. The endpoint's
+        slot is held until the stream is exhausted or closed.
+        """
+        async def call():
+            client = await self._get_client()
+            response_stream = await client.aio.models.generate_content_stream(model=model, contents=contents, config=config)
+            async for chunk in response_stream:
+                yield chunk
+
+        key = request_key(endpoint, model, contents, config) if dedupe else None
+        async for chunk in self._shared(key, lambda: self._with_slot(endpoint, model, call)):
+            yield chunk
+
+
+scheduler = ModelScheduler()
@@ -0,0 +1,125 @@
+import asyncio
+import io
+import json
+import marshal
+import os
+import pstats
+from datetime import datetime
+from typing import List
+from pymongo import ReturnDocument
+from ..database import request_profiles_collection
+from ..models import RequestProfileSummary
+from .blob_store import profile_blob_store
+
+try:
+    from pyinstrument.renderers import HTMLRenderer, SpeedscopeRenderer
+    from pyinstrument.session import Session
+except ImportError:
+    Session = None
+
+# How many profiles are kept; older ones are deleted as new ones arrive.
+PROFILE_MAX_STORED = int(os.getenv("PROFILE_MAX_STORED", "200"))
+
+# Download formats per profiler: media type and file extension.
+PROFILE_FORMATS = {
+    "pyinstrument": {
+        "speedscope": ("application/json", "speedscope.json"),
+        "html": ("text/html", "html"),
+    },
+    "cprofile": {
+        "pstats": ("application/octet-stream", "prof"),
+        "text": ("text/plain", "txt"),
+    },
+}
+
+
+async def save_profile(request_id: str, method: str, path: str, status_code: int | None, duration: float, profiler: str, data: bytes):
+    """
+    Stores a request's raw profile (a pyinstrument session as JSON, or
+    marshalled cProfile stats) and drops the oldest beyond PROFILE_MAX_STORED.
+    A profile saved again under the same request id replaces the old one.
+    """
+    blob_id = await profile_blob_store.put(data, "application/octet-stream")
+    previous = await request_profiles_collection.find_one_and_replace(
+        {"_id": request_id},
+        {
+            "method": method,
+            "path": path,
+            "status_code": status_code,
+            "duration_seconds": duration,
+            "profiler": profiler,
+            "blob_id": blob_id,
+            "created_at": datetime.now(),
+        },
+        projection={"blob_id": 1},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE,
+    )
+    if previous and previous["blob_id"] != blob_id:
+        await _release_blob(previous["blob_id"])
+    stale = request_profiles_collection.find({}, projection={"blob_id": 1}).sort("created_at", -1).skip(PROFILE_MAX_STORED)
+    async for document in stale:
+        await request_profiles_collection.delete_one({"_id": document["_id"]})
+        await _release_blob(document["blob_id"])
+
+
+async def _release_blob(blob_id: str):
+    # Blobs are content-addressed, so two identical profiles share one.
+    if not await request_profiles_collection.find_one({"blob_id": blob_id}, projection={"_id": 1}):
+        await profile_blob_store.delete(blob_id)
+
+
+async def list_profiles(limit: int = 50) -> List[RequestProfileSummary]:
+    """
+    Lists stored profiles, newest first.
+    """
+    cursor = request_profiles_collection.find({}, projection={"blob_id": 0}).sort("created_at", -1).limit(limit)
+    return [RequestProfileSummary(request_id=document.pop("_id"), **document) async for document in cursor]
+
+
+class _MarshalledStats:
+    """
+    Lets `pstats.Stats` load marshalled stats from memory rather than a file.
+    """
+
+    def __init__(self, data: bytes):
+        self.stats = marshal.loads(data)
+
+    def create_stats(self):
+        pass
+
+
+def _render(profiler: str, data: bytes, profile_format: str) -> bytes:
+    if profiler == "pyinstrument":
+        if Session is None:
+            raise RuntimeError("pyinstrument is needed to render this profile.")
+        session = Session.from_json(json.loads(data))
+        renderer = SpeedscopeRenderer() if profile_format == "speedscope" else HTMLRenderer()
+        return renderer.render(session).encode("utf-8")
+    if profile_format == "pstats":
+        return data
+    output = io.StringIO()
+    pstats.Stats(_MarshalledStats(data), stream=output).sort_stats("cumulative").print_stats(100)
+    return output.getvalue().encode("utf-8")
+
+
+async def get_profile(request_id: str, profile_format: str | None = None) -> tuple[bytes, str, str] | None:
+    """
+    Returns a stored profile rendered in `profile_format` (the profiler's
+    first format by default), with its media type and file name. Returns
+    None if there is no such profile, and raises ValueError for a format the
+    profile's profiler does not support.
+    """
+    document = await request_profiles_collection.find_one({"_id": request_id})
+    if not document:
+        return None
+    formats = PROFILE_FORMATS[document["profiler"]]
+    profile_format = profile_format or next(iter(formats))
+    if profile_format not in formats:
+        raise ValueError(f"Profiles from {document['profiler']} can be downloaded as: {', '.join(formats)}.")
+    blob = await profile_blob_store.get(document["blob_id"])
+    if blob is None:
+        return None
+    data = await asyncio.to_thread(_render, document["profiler"], blob[0], profile_format)
+    media_type, extension = formats[profile_format]
+    return data, media_type, f"{request_id}.{extension}"
@@ -1,28 +1,168 @@
+import asyncio
+import base64
 from typing import List
+from datetime import datetime
 from bson import ObjectId
-from ..database import projects_collection
-from ..models import Project, ConversationEntry, SpecPhase
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import BulkWriteError
+from ..database import (
+    projects_collection,
+    conversation_entries_collection,
+    generated_artifacts_collection,
+    phase_summaries_collection,
+    requirements_versions_collection,
+    jobs_collection,
+    migrations_collection,
+)
+from .blob_store import release_audio, store_audio
+from .requirements_versions import record_version
+from ..models import Project, ProjectSummary, ConversationEntry, ConversationPage, SpecPhase
 
-async def get_projects() -> List[Project]:
-    projects_cursor = projects_collection.find().sort("updatedAt", -1)
-    return [Project(**project) async for project in projects_cursor]
+# Largest page the conversation endpoints will return.
+MAX_CONVERSATION_PAGE_SIZE = 500
+# Largest page the project listing will return.
+MAX_PROJECT_PAGE_SIZE = 500
+PROJECT_SUMMARY_FIELDS = {"name": 1, "current_phase": 1, "createdAt": 1, "updatedAt": 1}
 
-async def get_project(project_id: str) -> Project | None:
+
+def entry_document(project_id: ObjectId, seq: int, entry: ConversationEntry) -> dict:
+    document = entry.model_dump(by_alias=True, exclude={"seq"})
+    if entry.phase is not None:
+        document["phase"] = entry.phase.value
+    document["project_id"] = project_id
+    document["seq"] = seq
+    return document
+
+
+async def get_projects(limit: int | None = None, before: datetime | None = None, before_id: str | None = None) -> List[ProjectSummary]:
+    """
+    Lists projects, most recently updated first, reading only the summary fields.
+
+    Pages are keyed on (updatedAt, _id): pass the last project's `updatedAt`
+    and id as `before` / `before_id` to fetch the next page.
+    """
+    query = {}
+    if before is not None:
+        if before_id is not None:
+            query["$or"] = [
+                {"updatedAt": {"$lt": before}},
+                {"updatedAt": before, "_id": {"$lt": ObjectId(before_id)}},
+            ]
+        else:
+            query["updatedAt"] = {"$lt": before}
+
+    projects_cursor = projects_collection.find(query, projection=PROJECT_SUMMARY_FIELDS).sort(
+        [("updatedAt", DESCENDING), ("_id", DESCENDING)]
+    )
+    if limit:
+        projects_cursor = projects_cursor.limit(min(limit, MAX_PROJECT_PAGE_SIZE))
+    return [ProjectSummary(**project) async for project in projects_cursor]
+
+def project_version(updated_at: datetime, conversation_length: int, revision: int = 0) -> str:
+    """
+    Returns an opaque version tag for a project's state. Every write to a
+    project bumps `revision` (and `updatedAt`), and every new entry bumps
+    `conversation_length`.
+    """
+    return f"{int(updated_at.timestamp() * 1000)}-{conversation_length}-{revision}"
+
+async def get_project_version(project_id: str) -> str | None:
+    """
+    Reads just enough of a project to compute its version tag.
+    """
+    project = await projects_collection.find_one(
+        {"_id": ObjectId(project_id)},
+        projection={"updatedAt": 1, "conversation_length": 1, "revision": 1},
+    )
+    if not project:
+        return None
+    return project_version(project["updatedAt"], project.get("conversation_length", 0), project.get("revision", 0))
+
+async def get_project(project_id: str, include_history: bool = False) -> Project | None:
+    """
+    Fetches a project's metadata. The conversation history is stored separately
+    and is only loaded when `include_history` is set.
+    """
     project = await projects_collection.find_one({"_id": ObjectId(project_id)})
-    if project:
-        return Project(**project)
-    return None
+    if not project:
+        return None
+    project = Project(**project)
+    if include_history:
+        project.conversation_history = await get_conversation_entries(project_id)
+    return project
 
 async def create_project(project: Project) -> Project:
-    result = await projects_collection.insert_one(project.model_dump(by_alias=True))
-    created_project = await projects_collection.find_one({"_id": result.inserted_id})
-    return Project(**created_project)
+    document = project.model_dump(by_alias=True, exclude={"conversation_history"})
+    document["conversation_length"] = len(project.conversation_history)
+    result = await projects_collection.insert_one(document)
+    for seq, entry in enumerate(project.conversation_history):
+        entry.seq = seq
+    if project.conversation_history:
+        await conversation_entries_collection.insert_many([
+            entry_document(result.inserted_id, entry.seq, entry)
+            for entry in project.conversation_history
+        ])
+    # The inserted document is exactly what we built, so there is no need to read it back.
+    return project.model_copy(update={"id": str(result.inserted_id), "conversation_length": len(project.conversation_history)})
 
-async def update_project_conversation(project_id: str, conversation_entry: ConversationEntry):
-    await projects_collection.update_one(
+async def update_project_conversation(project_id: str, conversation_entry: ConversationEntry) -> int:
+    """
+    Appends an entry to a project's conversation and returns its sequence number.
+    """
+    project = await projects_collection.find_one_and_update(
         {"_id": ObjectId(project_id)},
-        {"$push": {"conversation_history": conversation_entry.model_dump(by_alias=True)}}
+        {"$inc": {"conversation_length": 1, "revision": 1}, "$set": {"updatedAt": datetime.now()}},
+        projection={"conversation_length": 1},
+        return_document=ReturnDocument.AFTER,
     )
+    if not project:
+        raise ValueError(f"Project {project_id} not found")
+    seq = project["conversation_length"] - 1
+    await conversation_entries_collection.insert_one(
+        entry_document(ObjectId(project_id), seq, conversation_entry)
+    )
+    return seq
+
+async def get_conversation_entries(project_id: str, start_seq: int = 0, end_seq: int | None = None) -> List[ConversationEntry]:
+    """
+    Returns a project's conversation entries with `start_seq <= seq < end_seq`, in order.
+    """
+    seq_filter = {"$gte": start_seq}
+    if end_seq is not None:
+        seq_filter["$lt"] = end_seq
+    cursor = conversation_entries_collection.find(
+        {"project_id": ObjectId(project_id), "seq": seq_filter}
+    ).sort("seq", ASCENDING)
+    return [ConversationEntry(**entry) async for entry in cursor]
+
+async def get_conversation_page(project_id: str, limit: int, before: int | None = None, after: int | None = None) -> ConversationPage:
+    """
+    Returns one page of a project's conversation, oldest entry first.
+
+    With `after`, pages forward from that sequence number. Otherwise pages
+    backward from `before` (or from the latest entry).
+    """
+    limit = max(1, min(limit, MAX_CONVERSATION_PAGE_SIZE))
+    query = {"project_id": ObjectId(project_id)}
+    if after is not None:
+        query["seq"] = {"$gt": after}
+        order = ASCENDING
+    else:
+        if before is not None:
+            query["seq"] = {"$lt": before}
+        order = DESCENDING
+
+    cursor = conversation_entries_collection.find(query).sort("seq", order).limit(limit + 1)
+    entries = [ConversationEntry(**entry) async for entry in cursor]
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    if order == DESCENDING:
+        entries.reverse()
+
+    next_cursor = None
+    if has_more:
+        next_cursor = entries[-1].seq if order == ASCENDING else entries[0].seq
+    return ConversationPage(entries=entries, has_more=has_more, next_cursor=next_cursor)
 
 async def update_project_phase(project_id: str, new_phase: SpecPhase):
     """
@@ -30,21 +170,122 @@ async def update_project_phase(project_id: str, new_phase: SpecPhase):
     """
     await projects_collection.update_one(
         {"_id": ObjectId(project_id)},
-        {"$set": {"current_phase": new_phase.value}}
+        {"$set": {"current_phase": new_phase.value, "updatedAt": datetime.now()}, "$inc": {"revision": 1}}
     )
 
 async def delete_project(project_id: str):
     result = await projects_collection.delete_one({"_id": ObjectId(project_id)})
+    # Recordings are shared between identical uploads, so they are released
+    # once the entries referring to them are gone.
+    audio_blob_ids = await conversation_entries_collection.distinct(
+        "data.audio_ref.blob_id", {"project_id": ObjectId(project_id)}
+    )
+    await conversation_entries_collection.delete_many({"project_id": ObjectId(project_id)})
+    await release_audio(audio_blob_ids)
+    await generated_artifacts_collection.delete_many({"project_id": ObjectId(project_id)})
+    await phase_summaries_collection.delete_many({"project_id": ObjectId(project_id)})
+    await requirements_versions_collection.delete_many({"project_id": ObjectId(project_id)})
+    await jobs_collection.delete_many({"project_id": ObjectId(project_id)})
     if result.deleted_count == 0:
         # This could be logged or handled as needed
         print(f"Warning: Project with ID {project_id} not found for deletion.")
 
 async def update_project(project_id: str, updates: dict) -> Project | None:
-    await projects_collection.update_one(
+    updated_project = await projects_collection.find_one_and_update(
         {"_id": ObjectId(project_id)},
-        {"$set": updates}
+        {"$set": {**{k: v for k, v in updates.items() if k != "revision"}, "updatedAt": datetime.now()}, "$inc": {"revision": 1}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if not updated_project:
+        return None
+    project = Project(**updated_project)
+    if "requirements" in updates:
+        await record_version(project_id, project.requirements.get("content") or "")
+    return project
+
+async def replace_requirements_content(project_id: str, expected: str, content: str) -> datetime | None:
+    """
+    Replaces a project's requirements document, but only if it still reads
+    `expected`. Returns the new `updatedAt`, or None if the document changed
+    (or the project is gone) in the meantime.
+    """
+    query = {"_id": ObjectId(project_id)}
+    # Projects created before requirements were edited have no content field.
+    query["requirements.content"] = expected if expected else {"$in": [None, ""]}
+    now = datetime.now()
+    result = await projects_collection.update_one(query, {"$set": {"requirements.content": content, "updatedAt": now}, "$inc": {"revision": 1}})
+    if result.matched_count == 0:
+        return None
+    await record_version(project_id, content, previous=expected)
+    return now
+
+async def run_migrations():
+    """
+    Runs the data migrations that have not finished yet, in order. Each one is
+    recorded once it completes, so later startups skip the collection scans.
+    """
+    for name, migration in MIGRATIONS:
+        if await migrations_collection.find_one({"_id": name}, projection={"_id": 1}):
+            continue
+        await migration()
+        await migrations_collection.update_one(
+            {"_id": name}, {"$set": {"finished_at": datetime.now()}}, upsert=True
+        )
+
+async def migrate_embedded_conversations():
+    """
+    Moves conversation histories still embedded in project documents into the
+    conversation_entries collection. Safe to run repeatedly.
+    """
+    migrated = 0
+    cursor = projects_collection.find(
+        {"conversation_history": {"$exists": True}},
+        projection={"conversation_history": 1},
+    )
+    async for project in cursor:
+        history = project.get("conversation_history") or []
+        if history:
+            documents = [
+                entry_document(project["_id"], seq, ConversationEntry(**entry))
+                for seq, entry in enumerate(history)
+            ]
+            try:
+                await conversation_entries_collection.insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                # Entries already copied by an earlier, interrupted run.
+                if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                    raise
+        await projects_collection.update_one(
+            {"_id": project["_id"]},
+            {"$unset": {"conversation_history": ""}, "$set": {"conversation_length": len(history)}},
+        )
+        migrated += 1
+    if migrated:
+        print(f"Migrated conversation history for {migrated} projects.")
+
+async def offload_inline_audio():
+    """
+    Moves base64 audio still stored inside conversation entries into the blob
+    store, leaving a reference in its place. Safe to run repeatedly.
+    """
+    offloaded = 0
+    cursor = conversation_entries_collection.find(
+        {"data.audio": {"$exists": True}},
+        projection={"data": 1},
     )
-    updated_project = await projects_collection.find_one({"_id": ObjectId(project_id)})
-    if updated_project:
-        return Project(**updated_project)
-    return None 
\ No newline at end of file
+    async for entry in cursor:
+        data = entry["data"]
+        audio_bytes = await asyncio.to_thread(base64.b64decode, data["audio"])
+        audio_ref = await store_audio(audio_bytes, data.get("mimeType", "audio/webm"))
+        await conversation_entries_collection.update_one(
+            {"_id": entry["_id"]},
+            {"$set": {"data.audio_ref": audio_ref}, "$unset": {"data.audio": ""}},
+        )
+        offloaded += 1
+    if offloaded:
+        print(f"Moved audio from {offloaded} conversation entries to the blob store.")
+
+MIGRATIONS = [
+    ("embedded_conversations", migrate_embedded_conversations),
+    ("inline_audio", offload_inline_audio),
+]
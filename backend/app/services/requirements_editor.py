@@ -0,0 +1,175 @@
+import os
+import re
+from dataclasses import dataclass
+from typing import AsyncGenerator, Dict, List
+from . import assistant, project_service, sse
+
+# Documents at most this long are edited with every section in the prompt;
+# longer ones first ask the model which sections the edit touches.
+EDIT_SELECTION_MIN_CHARS = int(os.getenv("EDIT_SELECTION_MIN_CHARS", "8000"))
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_FENCE = re.compile(r"^\s*(```|~~~)")
+_OPERATION = re.compile(r"^<<<(REPLACE|INSERT AFTER|DELETE) (-?\d+)>>>[ \t]*$", re.MULTILINE)
+_END = re.compile(r"^<<<END>>>[ \t]*$", re.MULTILINE)
+
+
+@dataclass
+class Section:
+    index: int
+    # Heading level (1-6), or 0 for text before the first heading.
+    level: int
+    title: str
+    # The heading line and everything up to the next heading.
+    text: str
+
+
+@dataclass
+class SectionEdit:
+    op: str  # "replace", "insert", or "delete"
+    index: int
+    content: str = ""
+
+
+def split_sections(markdown: str) -> List[Section]:
+    """
+    Splits a Markdown document at its headings. Headings inside fenced code
+    blocks are ignored. Joining the sections' text gives back the document.
+    """
+    sections: List[Section] = []
+    lines: List[str] = []
+    level, title = 0, ""
+    in_fence = False
+    for line in markdown.splitlines(keepends=True):
+        if _FENCE.match(line):
+            in_fence = not in_fence
+        heading = None if in_fence else _HEADING.match(line.rstrip("\n"))
+        if heading:
+            if lines:
+                sections.append(Section(len(sections), level, title, "".join(lines)))
+            level, title, lines = len(heading.group(1)), heading.group(2), []
+        lines.append(line)
+    if lines:
+        sections.append(Section(len(sections), level, title, "".join(lines)))
+    return sections
+
+
+def outline(sections: List[Section]) -> str:
+    """
+    Describes the document's structure in one line per section.
+    """
+    lines = []
+    for section in sections:
+        title = f"{'#' * section.level} {section.title}" if section.level else "(text before the first heading)"
+        lines.append(f"[{section.index}] {title} ({len(section.text.splitlines())} lines)")
+    return "\n".join(lines)
+
+
+def parse_edits(buffer: str) -> tuple[List[SectionEdit], str]:
+    """
+    Extracts the complete edit blocks from the start of `buffer`. Returns
+    them with whatever text remains after the last complete block.
+    """
+    edits = []
+    while True:
+        operation = _OPERATION.search(buffer)
+        if not operation:
+            return edits, buffer
+        kind, index = operation.group(1), int(operation.group(2))
+        if kind == "DELETE":
+            edits.append(SectionEdit("delete", index))
+            buffer = buffer[operation.end():]
+            continue
+        end = _END.search(buffer, operation.end())
+        if not end:
+            return edits, buffer[operation.start():]
+        content = buffer[operation.end():end.start()].lstrip("\n")
+        if content and not content.endswith("\n"):
+            content += "\n"
+        edits.append(SectionEdit("replace" if kind == "REPLACE" else "insert", index, content))
+        buffer = buffer[end.end():]
+
+
+def apply_edits(sections: List[Section], edits: List[SectionEdit]) -> str:
+    """
+    Applies section edits, all given against the original section numbers,
+    and returns the new document.
+    """
+    replaced: Dict[int, str] = {}
+    deleted = set()
+    inserted: Dict[int, List[str]] = {}
+    for edit in edits:
+        if edit.op == "replace":
+            replaced[edit.index] = edit.content
+        elif edit.op == "delete":
+            deleted.add(edit.index)
+        else:
+            inserted.setdefault(edit.index, []).append(edit.content)
+
+    parts: List[str] = []
+
+    def add(text: str):
+        if not text:
+            return
+        if parts and not parts[-1].endswith("\n"):
+            parts[-1] += "\n"
+        parts.append(text)
+
+    for text in inserted.get(-1, []):
+        add(text)
+    for section in sections:
+        if section.index not in deleted:
+            add(replaced.get(section.index, section.text))
+        for text in inserted.get(section.index, []):
+            add(text)
+    return "".join(parts)
+
+
+def _event(data: dict) -> bytes:
+    return sse.encode_event(data)
+
+
+async def edit_requirements_stream(project_id: str, current_requirements: str, instruction: str) -> AsyncGenerator[bytes, None]:
+    """
+    Edits a requirements document section by section and streams each edit as
+    a server-sent event as soon as the model has finished writing it.
+
+    Only the outline and the sections the edit is likely to touch are sent to
+    the model. Once the model is done, the edits are applied and the new
+    document is saved, unless the document changed in the meantime.
+    """
+    sections = split_sections(current_requirements)
+    if len(current_requirements) > EDIT_SELECTION_MIN_CHARS:
+        selected = await assistant.select_sections_to_edit(outline(sections), instruction)
+        selected = sorted({index for index in selected if 0 <= index < len(sections)})
+    else:
+        selected = [section.index for section in sections]
+
+    editable = set(selected)
+    edits: List[SectionEdit] = []
+    buffer = ""
+    response_stream = assistant.get_section_edit_stream(
+        outline(sections), [sections[index] for index in selected], instruction
+    )
+    async for text in response_stream:
+        buffer += text
+        complete, buffer = parse_edits(buffer)
+        for edit in complete:
+            # Sections the model was not shown may only have sections inserted after them.
+            valid = -1 <= edit.index < len(sections) if edit.op == "insert" else edit.index in editable
+            if not valid:
+                print(f"Ignoring {edit.op} of section {edit.index} for project {project_id}")
+                continue
+            edits.append(edit)
+            yield _event({"type": "section", "op": edit.op, "index": edit.index, "content": edit.content})
+
+    if not edits:
+        yield _event({"type": "done", "changed": 0})
+        return
+
+    new_requirements = apply_edits(sections, edits)
+    updated_at = await project_service.replace_requirements_content(project_id, current_requirements, new_requirements)
+    if updated_at is None:
+        yield _event({"type": "error", "detail": "The requirements changed while this edit was being made. Please try again."})
+        return
+    yield _event({"type": "done", "changed": len(edits), "updatedAt": updated_at.isoformat()})
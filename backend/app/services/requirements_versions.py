@@ -0,0 +1,221 @@
+import difflib
+import os
+from datetime import datetime
+from typing import List
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError
+from ..database import requirements_versions_collection
+from ..models import RequirementsVersion, RequirementsVersionSummary
+
+# Longest run of deltas between two full snapshots. Bounds the number of
+# documents read to rebuild any version.
+REQUIREMENTS_MAX_DELTA_CHAIN = int(os.getenv("REQUIREMENTS_MAX_DELTA_CHAIN", "32"))
+# Number of versions kept per project; older ones are dropped. 0 keeps all.
+REQUIREMENTS_MAX_VERSIONS = int(os.getenv("REQUIREMENTS_MAX_VERSIONS", "200"))
+# Largest page the version listing will return.
+MAX_VERSION_PAGE_SIZE = 200
+# Attempts to claim a version number when edits race.
+_RECORD_ATTEMPTS = 3
+
+# Versions are stored as either a full "snapshot" of the document or a
+# "delta" against the previous version. A delta is a list of
+# [start, end, lines]: replace lines[start:end] of the previous version
+# (split with keepends) with `lines`.
+
+
+def compute_delta(old: str, new: str) -> list:
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    return [
+        [i1, i2, new_lines[j1:j2]]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+
+
+def apply_delta(old: str, delta: list) -> str:
+    lines = old.splitlines(keepends=True)
+    # Apply from the end so earlier offsets stay valid.
+    for start, end, replacement in reversed(delta):
+        lines[start:end] = replacement
+    return "".join(lines)
+
+
+def _delta_size(delta: list) -> int:
+    return sum(len(line) for _, _, replacement in delta for line in replacement) + 16 * len(delta)
+
+
+async def _latest(project_id: ObjectId) -> dict | None:
+    return await requirements_versions_collection.find_one(
+        {"project_id": project_id},
+        projection={"content": 0, "delta": 0},
+        sort=[("version", DESCENDING)],
+    )
+
+
+async def get_version_content(project_id: str, version: int) -> str | None:
+    """
+    Rebuilds a version from the nearest snapshot at or before it, reading at
+    most REQUIREMENTS_MAX_DELTA_CHAIN deltas. Returns None if it does not exist.
+    """
+    project_id = ObjectId(project_id)
+    snapshot = await requirements_versions_collection.find_one(
+        {"project_id": project_id, "kind": "snapshot", "version": {"$lte": version}},
+        sort=[("version", DESCENDING)],
+    )
+    if not snapshot:
+        return None
+    content = snapshot["content"]
+    if snapshot["version"] == version:
+        return content
+
+    expected = snapshot["version"] + 1
+    cursor = requirements_versions_collection.find(
+        {"project_id": project_id, "version": {"$gt": snapshot["version"], "$lte": version}}
+    ).sort("version", ASCENDING)
+    async for document in cursor:
+        if document["version"] != expected:
+            return None
+        content = document["content"] if document["kind"] == "snapshot" else apply_delta(content, document["delta"])
+        expected += 1
+    return content if expected == version + 1 else None
+
+
+async def record_version(project_id: str, content: str, previous: str | None = None) -> int | None:
+    """
+    Stores `content` as the project's next requirements version and returns
+    its number, or None if it matches the latest version.
+
+    `previous` is the content the change was made against, if known. It is
+    recorded as the first version when the project has no history yet.
+    """
+    project_id = ObjectId(project_id)
+    for _ in range(_RECORD_ATTEMPTS):
+        latest = await _latest(project_id)
+        now = datetime.now()
+        if latest is None:
+            documents = []
+            if previous and previous != content:
+                documents.append(_snapshot(project_id, 1, previous, now))
+            documents.append(_snapshot(project_id, len(documents) + 1, content, now))
+        else:
+            latest_content = await get_version_content(str(project_id), latest["version"])
+            if latest_content == content:
+                return None
+            documents = [_next_version(project_id, latest, latest_content, content, now)]
+        try:
+            await requirements_versions_collection.insert_many(documents)
+        except BulkWriteError as e:
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+            # Another edit claimed this version number first; diff against it instead.
+            continue
+        version = documents[-1]["version"]
+        if REQUIREMENTS_MAX_VERSIONS and version > REQUIREMENTS_MAX_VERSIONS:
+            await prune_versions(str(project_id), version - REQUIREMENTS_MAX_VERSIONS + 1)
+        return version
+    print(f"Warning: could not record a requirements version for project {project_id}")
+    return None
+
+
+def _snapshot(project_id: ObjectId, version: int, content: str, now: datetime) -> dict:
+    return {
+        "project_id": project_id,
+        "version": version,
+        "kind": "snapshot",
+        "content": content,
+        "size": len(content),
+        "chain_length": 0,
+        "chain_size": 0,
+        "created_at": now,
+    }
+
+
+def _next_version(project_id: ObjectId, latest: dict, latest_content: str, content: str, now: datetime) -> dict:
+    """
+    Builds a delta against the latest version, or a snapshot once the delta
+    chain is long enough, or the deltas since the last snapshot add up to
+    more than the document itself. Snapshots are thus paid for by at least
+    as much change, keeping storage linear in the amount of change.
+    """
+    delta = compute_delta(latest_content, content)
+    size = _delta_size(delta)
+    chain_length = latest["chain_length"] + 1
+    chain_size = latest["chain_size"] + size
+    if chain_length > REQUIREMENTS_MAX_DELTA_CHAIN or chain_size >= len(content):
+        return _snapshot(project_id, latest["version"] + 1, content, now)
+    return {
+        "project_id": project_id,
+        "version": latest["version"] + 1,
+        "kind": "delta",
+        "delta": delta,
+        "size": size,
+        "chain_length": chain_length,
+        "chain_size": chain_size,
+        "created_at": now,
+    }
+
+
+async def prune_versions(project_id: str, oldest_kept: int):
+    """
+    Drops every version before `oldest_kept`, turning that version into a
+    snapshot first if it is a delta.
+    """
+    object_id = ObjectId(project_id)
+    document = await requirements_versions_collection.find_one(
+        {"project_id": object_id, "version": oldest_kept}, projection={"kind": 1}
+    )
+    if not document:
+        return
+    if document["kind"] != "snapshot":
+        content = await get_version_content(project_id, oldest_kept)
+        if content is None:
+            return
+        await requirements_versions_collection.update_one(
+            {"_id": document["_id"]},
+            {"$set": {"kind": "snapshot", "content": content, "size": len(content)}, "$unset": {"delta": ""}},
+        )
+    await requirements_versions_collection.delete_many({"project_id": object_id, "version": {"$lt": oldest_kept}})
+
+
+async def list_versions(project_id: str, limit: int = 50, before: int | None = None) -> List[RequirementsVersionSummary]:
+    """
+    Lists a project's requirements versions, newest first.
+    """
+    query = {"project_id": ObjectId(project_id)}
+    if before is not None:
+        query["version"] = {"$lt": before}
+    cursor = requirements_versions_collection.find(
+        query, projection={"version": 1, "kind": 1, "size": 1, "created_at": 1}
+    ).sort("version", DESCENDING).limit(max(1, min(limit, MAX_VERSION_PAGE_SIZE)))
+    return [RequirementsVersionSummary(**document) async for document in cursor]
+
+
+async def get_version(project_id: str, version: int) -> RequirementsVersion | None:
+    document = await requirements_versions_collection.find_one(
+        {"project_id": ObjectId(project_id), "version": version}, projection={"created_at": 1}
+    )
+    if not document:
+        return None
+    content = await get_version_content(project_id, version)
+    if content is None:
+        return None
+    return RequirementsVersion(version=version, content=content, created_at=document["created_at"])
+
+
+async def diff_versions(project_id: str, from_version: int, to_version: int) -> str | None:
+    """
+    Returns a unified diff between two versions, or None if either is missing.
+    """
+    old = await get_version_content(project_id, from_version)
+    new = await get_version_content(project_id, to_version)
+    if old is None or new is None:
+        return None
+    return "".join(difflib.unified_diff(
+        old.splitlines(keepends=True),
+        new.splitlines(keepends=True),
+        fromfile=f"v{from_version}",
+        tofile=f"v{to_version}",
+    ))
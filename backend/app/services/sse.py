@@ -0,0 +1,277 @@
+import asyncio
+import bisect
+import itertools
+import json
+import os
+import time
+from typing import AsyncGenerator, AsyncIterator, Dict, List
+from ..metrics import sse_stream_bytes, sse_stream_events, sse_streams_in_flight
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Consecutive text (or thought) parts are merged into one event until they
+# reach this many characters...
+SSE_COALESCE_MAX_CHARS = int(os.getenv("SSE_COALESCE_MAX_CHARS", "2048"))
+# ...or the oldest of them has waited this many seconds.
+SSE_COALESCE_MAX_DELAY = float(os.getenv("SSE_COALESCE_MAX_DELAY", "0.025"))
+# Encoded bytes buffered for a slow client before the producer is paused.
+SSE_BUFFER_HIGH_WATER = int(os.getenv("SSE_BUFFER_HIGH_WATER", str(1024 * 1024)))
+# Bytes of sent events kept per stream for clients that reconnect.
+SSE_RETAIN_BYTES = int(os.getenv("SSE_RETAIN_BYTES", str(2 * 1024 * 1024)))
+
+
+def _dumps(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value).encode("utf-8")
+
+
+def encode_event(data: dict) -> bytes:
+    """
+    Encodes one server-sent event carrying `data` as JSON.
+    """
+    return b"data: " + _dumps(data) + b"\n\n"
+
+
+# Part events are by far the most frequent, so only their content is encoded.
+_PART_PREFIX = {
+    part_type: b'data: {"type": "' + part_type.encode() + b'", "content": '
+    for part_type in ("text", "thought")
+}
+_PART_SUFFIX = b"}\n\n"
+
+
+def encode_part(part_type: str, content: str) -> bytes:
+    """
+    Encodes a `{"type": part_type, "content": content}` event.
+    """
+    return _PART_PREFIX[part_type] + _dumps(content) + _PART_SUFFIX
+
+
+class ResumeUnavailable(Exception):
+    """
+    The events after a client's Last-Event-ID can no longer be replayed.
+    """
+
+
+class EventBuffer:
+    """
+    Sits between the task producing a stream's events and the HTTP response.
+
+    Text and thought parts of the same type are coalesced into one event
+    within a size and time window. Events are sent as soon as the client can
+    take them; while it cannot, they accumulate and go out in one write. If
+    a reader falls more than `high_water` bytes behind, `send_part` and
+    `send_event` wait until it catches up, which in turn pauses reading from
+    the model.
+
+    Every event carries an id, `<stream_id>.<n>`, and sent events are kept
+    (the oldest dropped beyond `retain` bytes) so that a client reconnecting
+    with Last-Event-ID can resume with `frames(last_event_id)`. Each reader
+    has its own position; with no reader attached the producer is never
+    paused.
+    """
+
+    def __init__(
+        self,
+        stream_id: str = "",
+        max_chars: int = SSE_COALESCE_MAX_CHARS,
+        max_delay: float = SSE_COALESCE_MAX_DELAY,
+        high_water: int = SSE_BUFFER_HIGH_WATER,
+        retain: int = SSE_RETAIN_BYTES,
+    ):
+        self.stream_id = stream_id
+        self.max_chars = max_chars
+        self.max_delay = max_delay
+        self.high_water = high_water
+        self.retain = max(retain, high_water)
+        # Retained events from `_head` on, with the stream offset each ends at.
+        self._frames: List[bytes] = []
+        self._ends: List[int] = []
+        self._head = 0
+        self._head_number = 1
+        self._retained_size = 0
+        # Stream offsets: where the retained events start, and where they end.
+        self._start = 0
+        self._end = 0
+        self._readers: Dict[int, int] = {}
+        self._reader_ids = itertools.count()
+        self._part_type: str | None = None
+        self._parts: List[str] = []
+        self._parts_size = 0
+        self._parts_since = 0.0
+        self._closed = False
+        self._error: BaseException | None = None
+        self._changed = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _flush_parts(self):
+        if self._parts:
+            self._append(encode_part(self._part_type, "".join(self._parts)))
+            self._parts.clear()
+            self._parts_size = 0
+
+    def _append(self, frame: bytes):
+        number = self._head_number + len(self._frames) - self._head
+        frame = b"id: " + f"{self.stream_id}.{number}".encode() + b"\n" + frame
+        self._end += len(frame)
+        self._frames.append(frame)
+        self._ends.append(self._end)
+        self._retained_size += len(frame)
+        self._trim()
+        self._update_writable()
+        self._notify()
+
+    def _trim(self):
+        """
+        Drops the oldest events beyond `retain` bytes, if every reader has
+        read them.
+        """
+        read_by_all = min(self._readers.values(), default=self._end)
+        while self._retained_size > self.retain and self._head < len(self._frames) and self._ends[self._head] <= read_by_all:
+            self._retained_size -= len(self._frames[self._head])
+            self._start = self._ends[self._head]
+            self._head += 1
+            self._head_number += 1
+        if self._head > 1024 and self._head * 2 > len(self._frames):
+            del self._frames[:self._head]
+            del self._ends[:self._head]
+            self._head = 0
+
+    def _update_writable(self):
+        slowest = min(self._readers.values(), default=self._end)
+        if self._end - slowest >= self.high_water:
+            self._writable.clear()
+        else:
+            self._writable.set()
+
+    def _resume_offset(self, last_event_id: str | None) -> int:
+        if last_event_id is None:
+            if self._start > 0:
+                raise ResumeUnavailable("The start of this stream is no longer available.")
+            return 0
+        stream_id, _, number = last_event_id.rpartition(".")
+        if stream_id != self.stream_id or not number.isdigit():
+            raise ResumeUnavailable(f"Event {last_event_id} is not part of this stream.")
+        if int(number) == self._head_number - 1:
+            return self._start
+        index = int(number) - self._head_number + self._head
+        if index < self._head or index >= len(self._frames):
+            raise ResumeUnavailable(f"Event {last_event_id} is no longer available.")
+        return self._ends[index]
+
+    def check_resume(self, last_event_id: str | None):
+        """
+        Raises ResumeUnavailable unless the stream can be resumed after
+        `last_event_id` (or from its start, if None).
+        """
+        self._resume_offset(last_event_id)
+
+    async def send_part(self, part_type: str, content: str):
+        """
+        Queues a "text" or "thought" part for coalescing.
+        """
+        if part_type != self._part_type:
+            self._flush_parts()
+            self._part_type = part_type
+        if not self._parts:
+            self._parts_since = time.monotonic()
+            # Wake the readers so they can time the coalescing window.
+            self._notify()
+        self._parts.append(content)
+        self._parts_size += len(content)
+        if self._parts_size >= self.max_chars:
+            self._flush_parts()
+        if not self._writable.is_set():
+            await self._writable.wait()
+
+    async def send_event(self, data: dict):
+        """
+        Queues any other event, after the parts sent before it.
+        """
+        self._flush_parts()
+        self._append(encode_event(data))
+        if not self._writable.is_set():
+            await self._writable.wait()
+
+    def close(self, error: BaseException | None = None):
+        """
+        Marks the end of the stream. Buffered events are still delivered;
+        `error`, if given, is raised to the readers after them.
+        """
+        self._flush_parts()
+        self._closed = True
+        self._error = error
+        self._notify()
+
+    async def frames(self, last_event_id: str | None = None) -> AsyncGenerator[bytes, None]:
+        """
+        Yields the stream's events, from its start or from after
+        `last_event_id`, joining whatever is buffered into one chunk
+        whenever the client is ready for more.
+        """
+        offset = self._resume_offset(last_event_id)
+        reader = next(self._reader_ids)
+        self._readers[reader] = offset
+        try:
+            while True:
+                if self._parts and time.monotonic() - self._parts_since >= self.max_delay:
+                    self._flush_parts()
+                if offset < self._end:
+                    if offset < self._start:
+                        raise ResumeUnavailable("The events this reader needs are no longer available.")
+                    index = bisect.bisect_right(self._ends, offset, self._head)
+                    data = b"".join(self._frames[index:])
+                    offset = self._end
+                    self._readers[reader] = offset
+                    self._update_writable()
+                    self._trim()
+                    yield data
+                    continue
+                if self._closed:
+                    if self._error is not None:
+                        raise self._error
+                    return
+
+                changed = self._changed
+                timeout = None
+                if self._parts:
+                    timeout = max(0.0, self._parts_since + self.max_delay - time.monotonic())
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            del self._readers[reader]
+            self._update_writable()
+            self._trim()
+
+
+async def metered(stream: str, frames: AsyncIterator[bytes]) -> AsyncGenerator[bytes, None]:
+    """
+    Passes `frames` through, recording the stream's bytes and events and
+    counting it as in flight while it is open.
+    """
+    sent_bytes = 0
+    sent_events = 0
+    with sse_streams_in_flight.track(stream=stream):
+        try:
+            async for data in frames:
+                sent_bytes += len(data)
+                sent_events += data.count(b"\n\n")
+                yield data
+        finally:
+            sse_stream_bytes.observe(sent_bytes, stream=stream)
+            sse_stream_events.observe(sent_events, stream=stream)
@@ -0,0 +1,178 @@
+import asyncio
+import hashlib
+import os
+import uuid
+from collections import OrderedDict
+
+# Memory budget for cached speech audio.
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Optional directory for a second, persistent cache tier. Unset disables it.
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR")
+# Disk budget for that tier; the least recently used files are deleted beyond it.
+TTS_CACHE_DISK_MAX_BYTES = int(os.getenv("TTS_CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+
+class TTSCache:
+    """
+    Content-addressed cache for synthesized speech (raw PCM).
+
+    Entries are keyed by a hash of (text, voice, model). The first tier is an
+    in-memory LRU bounded by total size in bytes; the optional second tier
+    stores one file per entry in `directory` and survives restarts. It is an
+    LRU too, bounded by `disk_max_bytes`: recency is the file's modification
+    time, which hits refresh, so the order carries over restarts. Processes
+    sharing a directory each enforce the bound on their own view of it.
+    """
+
+    def __init__(self, max_bytes: int, directory: str | None = None, disk_max_bytes: int = TTS_CACHE_DISK_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        # Sizes of the files in `directory`, least recently used first;
+        # loaded on first use so that import does no disk I/O.
+        self._disk_entries: "OrderedDict[str, int] | None" = None
+        self._disk_size = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(text: str, voice: str, model: str) -> str:
+        digest = hashlib.sha256()
+        for value in (model, voice, text):
+            digest.update(value.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pcm")
+
+    async def _disk_index(self) -> "OrderedDict[str, int]":
+        if self._disk_entries is None:
+            entries = await asyncio.to_thread(_scan_directory, self.directory)
+            if self._disk_entries is None:
+                self._disk_entries = OrderedDict(entries)
+                self._disk_size = sum(self._disk_entries.values())
+        return self._disk_entries
+
+    async def _remember_on_disk(self, key: str, size: int):
+        index = await self._disk_index()
+        if key in index:
+            self._disk_size -= index.pop(key)
+        index[key] = size
+        self._disk_size += size
+        evicted = []
+        while self._disk_size > self.disk_max_bytes and index:
+            evicted_key, evicted_size = index.popitem(last=False)
+            self._disk_size -= evicted_size
+            evicted.append(self._path(evicted_key))
+        if evicted:
+            await asyncio.to_thread(_remove_files, evicted)
+
+    def _remember(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._size -= len(self._entries.pop(key))
+        self._entries[key] = data
+        self._size += len(data)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    async def get(self, key: str) -> bytes | None:
+        data = self._entries.get(key)
+        if data is not None:
+            self._entries.move_to_end(key)
+            self.memory_hits += 1
+            return data
+
+        if self.directory:
+            data = await asyncio.to_thread(_read_file, self._path(key))
+            if data is not None:
+                self._remember(key, data)
+                await self._remember_on_disk(key, len(data))
+                self.disk_hits += 1
+                return data
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, data: bytes):
+        self._remember(key, data)
+        if self.directory:
+            try:
+                await asyncio.to_thread(_write_file, self._path(key), data)
+                await self._remember_on_disk(key, len(data))
+            except OSError as e:
+                print(f"Error writing TTS cache file: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "disk_enabled": bool(self.directory),
+            "disk_entries": len(self._disk_entries or ()),
+            "disk_bytes": self._disk_size,
+            "disk_max_bytes": self.disk_max_bytes,
+        }
+
+
+def _read_file(path: str) -> bytes | None:
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        # Marks the file as recently used for eviction.
+        os.utime(path)
+        return data
+    except FileNotFoundError:
+        return None
+
+
+def _write_file(path: str, data: bytes):
+    # Write to a unique temporary name first so readers never see a partial
+    # file, even when the same entry is written concurrently.
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _scan_directory(directory: str) -> list[tuple[str, int]]:
+    """
+    Returns (key, size) for each cache file, least recently used first.
+    """
+    files = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith(".pcm") and entry.is_file():
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name[:-len(".pcm")], stat.st_size))
+    files.sort()
+    return [(key, size) for _, key, size in files]
+
+
+def _remove_files(paths: list[str]):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+tts_cache = TTSCache(TTS_CACHE_MAX_BYTES, TTS_CACHE_DIR)
@@ -0,0 +1,142 @@
+from datetime import datetime
+from typing import List
+from bson import ObjectId
+from pymongo import ReturnDocument
+from ..database import projects_collection, conversation_entries_collection
+from ..models import Project, ConversationEntry, SpecPhase
+from .project_service import entry_document, project_version
+
+# Sequence numbers reserved per chat turn: the user's message and the reply.
+CHAT_TURN_ENTRIES = 2
+
+
+class ChatTurn:
+    """
+    Unit of work for one chat turn.
+
+    The project is loaded once, while atomically reserving sequence numbers
+    for the entries the turn will add. Changes made during the turn (new
+    entries, a phase advance, a rename) are kept in memory and written by
+    `commit`. A turn touches the database three times: once in `begin`, once
+    to insert its entries, and once to bump the project's revision (with
+    any phase or name change), so that its version tag moves past the one
+    clients saw while the turn ran.
+    """
+
+    def __init__(self, project: Project, first_seq: int, reserved: int):
+        self.project = project
+        # Entries written during this turn belong to the phase it started in.
+        self.phase = project.current_phase
+        # Entries with a lower sequence number made up the history before this turn.
+        self.history_length = first_seq
+        self._next_seq = first_seq
+        self.end_seq = first_seq + reserved
+        self.entries: List[ConversationEntry] = []
+        self._phase_changed = False
+        self._new_name: str | None = None
+        self._committed = False
+
+    @property
+    def project_id(self) -> str:
+        return str(self.project.id)
+
+    @classmethod
+    async def begin(cls, project_id: str, reserved: int = CHAT_TURN_ENTRIES) -> "ChatTurn | None":
+        """
+        Loads the project and reserves `reserved` sequence numbers. Returns
+        None if the project does not exist.
+        """
+        now = datetime.now()
+        document = await projects_collection.find_one_and_update(
+            {"_id": ObjectId(project_id)},
+            {"$inc": {"conversation_length": reserved, "revision": 1}, "$set": {"updatedAt": now}},
+            return_document=ReturnDocument.BEFORE,
+        )
+        if not document:
+            return None
+        project = Project(**document)
+        first_seq = project.conversation_length
+        project.conversation_length += reserved
+        project.revision += 1
+        project.updatedAt = now
+        return cls(project, first_seq, reserved)
+
+    def add_entry(self, entry: ConversationEntry) -> int:
+        """
+        Queues an entry to be persisted on commit and returns its sequence number.
+        """
+        if self._next_seq >= self.end_seq:
+            raise ValueError("No reserved sequence numbers left for this chat turn.")
+        entry.seq = self._next_seq
+        entry.phase = self.phase
+        self._next_seq += 1
+        self.entries.append(entry)
+        return entry.seq
+
+    def advance_phase(self) -> SpecPhase | None:
+        """
+        Moves the project to the next specification phase. Returns the new
+        phase, or None if the project is already in the last one.
+        """
+        phases = list(SpecPhase)
+        current_index = phases.index(self.project.current_phase)
+        if current_index >= len(phases) - 1:
+            return None
+        previous_phase = self.project.current_phase
+        self.project.current_phase = phases[current_index + 1]
+        self._phase_changed = True
+        print(f"Advanced project {self.project_id} from {previous_phase.value} to {self.project.current_phase.value}")
+        return self.project.current_phase
+
+    def rename(self, name: str):
+        """
+        Renames the project.
+        """
+        self._new_name = name
+        self.project.name = name
+
+    def delta(self) -> dict:
+        """
+        Describes what this turn changed, for clients that already hold the
+        rest of the project state.
+        """
+        delta = {
+            "project_id": self.project_id,
+            "version": project_version(self.project.updatedAt, self.project.conversation_length, self.project.revision),
+            "updatedAt": self.project.updatedAt.isoformat(),
+            "entries": [{"seq": entry.seq, "role": entry.role} for entry in self.entries],
+        }
+        if self._phase_changed:
+            delta["current_phase"] = self.project.current_phase.value
+        if self._new_name is not None:
+            delta["name"] = self._new_name
+        return delta
+
+    async def commit(self) -> Project:
+        """
+        Persists the queued entries and project changes and returns the
+        resulting project state. Calling it again is a no-op.
+        """
+        if self._committed:
+            return self.project
+        self._committed = True
+
+        project_id = ObjectId(self.project_id)
+        if self.entries:
+            await conversation_entries_collection.insert_many(
+                [entry_document(project_id, entry.seq, entry) for entry in self.entries]
+            )
+
+        updates = {}
+        if self._phase_changed:
+            updates["current_phase"] = self.project.current_phase.value
+        if self._new_name is not None:
+            updates["name"] = self._new_name
+        document = await projects_collection.find_one_and_update(
+            {"_id": project_id},
+            {"$set": {**updates, "updatedAt": datetime.now()}, "$inc": {"revision": 1}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if document:
+            self.project = Project(**document)
+        return self.project
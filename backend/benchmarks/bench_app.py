@@ -0,0 +1,124 @@
+"""
+In-process benchmarks for the main request flows and hot paths.
+
+Runs the app against the fake model backend and the in-memory database, so
+no credentials, network or MongoDB are needed and results are repeatable.
+Model latency is zero by default to measure the backend's own overhead;
+set FAKE_MODEL_* variables to change that.
+
+Usage (from backend/):
+    pytest benchmarks/bench_app.py --benchmark-json=benchmark.json
+    pytest benchmarks/bench_app.py --benchmark-compare   # against the last saved run
+"""
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("MODEL_BACKEND", "fake")
+os.environ.setdefault("MONGO_BACKEND", "memory")
+os.environ.setdefault("BLOB_STORE_DIR", tempfile.mkdtemp(prefix="specdrafter-bench-blobs-"))
+os.environ.setdefault("FAKE_MODEL_FIRST_CHUNK_LATENCY", "0")
+os.environ.setdefault("FAKE_MODEL_CHUNK_LATENCY", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from app.services import sse  # noqa: E402
+from app.services.control_tokens import ControlTokenScanner  # noqa: E402
+from app.services.requirements_editor import split_sections  # noqa: E402
+from samples import silent_wav  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(scope="module")
+def project_id(client):
+    response = client.post("/projects/")
+    response.raise_for_status()
+    return response.json()["_id"]
+
+
+def test_list_projects(benchmark, client):
+    for _ in range(50):
+        client.post("/projects/")
+    benchmark(lambda: client.get("/projects/?limit=50").raise_for_status())
+
+
+def test_get_project(benchmark, client, project_id):
+    benchmark(lambda: client.get(f"/projects/{project_id}").raise_for_status())
+
+
+def test_chat_turn(benchmark, client, project_id):
+    def chat():
+        response = client.post(f"/projects/{project_id}/chat", json={"content": "We need offline support."})
+        response.raise_for_status()
+        assert b"project_update" in response.content
+
+    benchmark(chat)
+
+
+def test_transcribe_upload(benchmark, client):
+    audio = silent_wav()
+    headers = {"Content-Type": "audio/wav"}
+    benchmark(lambda: client.post("/audio/transcribe/upload", content=audio, headers=headers).raise_for_status())
+
+
+def test_generate_prd(benchmark, client):
+    def setup():
+        project = client.post("/projects/").json()["_id"]
+        client.post(f"/projects/{project}/chat", json={"content": "A todo app for small teams."})
+        return (project,), {}
+
+    def generate(project):
+        client.post(f"/projects/{project}/generate-prd", json={"target": "Cursor"}).raise_for_status()
+
+    benchmark.pedantic(generate, setup=setup, rounds=20)
+
+
+def test_generate_prd_cached(benchmark, client, project_id):
+    client.post(f"/projects/{project_id}/generate-prd", json={"target": "Cursor"}).raise_for_status()
+    benchmark(lambda: client.post(f"/projects/{project_id}/generate-prd", json={"target": "Cursor"}).raise_for_status())
+
+
+def test_prd_job(benchmark, client):
+    def setup():
+        project = client.post("/projects/").json()["_id"]
+        client.post(f"/projects/{project}/chat", json={"content": "A todo app for small teams."})
+        return (project,), {}
+
+    def run_job(project):
+        job = client.post(f"/projects/{project}/jobs/prd", json={"target": "Cursor"}).json()
+        while job["status"] not in ("succeeded", "failed"):
+            time.sleep(0.001)
+            job = client.get(f"/projects/{project}/jobs/{job['_id']}?offset={job['output_length']}").json()
+        assert job["status"] == "succeeded"
+
+    benchmark.pedantic(run_job, setup=setup, rounds=20)
+
+
+def test_sse_part_encoding(benchmark):
+    benchmark(lambda: [sse.encode_part("text", "some streamed words ") for _ in range(1000)])
+
+
+def test_control_token_scanner(benchmark):
+    chunks = ["Here is the plan for the ", "next phase [PHASE_", "COMPLETE] and more text "] * 300
+
+    def scan():
+        scanner = ControlTokenScanner()
+        for chunk in chunks:
+            scanner.feed(chunk)
+        scanner.finish()
+
+    benchmark(scan)
+
+
+def test_split_sections(benchmark):
+    document = "".join(f"## Section {i}\n" + "Requirement text.\n" * 20 for i in range(200))
+    benchmark(lambda: split_sections(document))
@@ -0,0 +1,106 @@
+"""
+Load test for the chat streaming path.
+
+Opens a number of concurrent /projects/{id}/chat streams against a running
+backend and, while they are in flight, repeatedly times an unrelated request
+(GET /projects/). If streaming blocks the event loop, the p99 latency of the
+unrelated request climbs with the number of open streams.
+
+Usage:
+    python benchmarks/chat_load.py --base-url http://localhost:8000 --streams 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(label: str, samples: list[float]):
+    if not samples:
+        print(f"{label}: no samples")
+        return
+    print(
+        f"{label}: n={len(samples)} "
+        f"p50={percentile(samples, 50) * 1000:.1f}ms "
+        f"p99={percentile(samples, 99) * 1000:.1f}ms "
+        f"mean={statistics.mean(samples) * 1000:.1f}ms"
+    )
+
+
+async def sample_listing(client: httpx.AsyncClient, stop: asyncio.Event, interval: float) -> list[float]:
+    samples = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.get("/projects/")
+        response.raise_for_status()
+        samples.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+    return samples
+
+
+async def run_chat(client: httpx.AsyncClient, project_id: str, prompt: str) -> float:
+    started = time.perf_counter()
+    body = {"content": prompt}
+    async with client.stream("POST", f"/projects/{project_id}/chat", json=body) as response:
+        response.raise_for_status()
+        async for _ in response.aiter_bytes():
+            pass
+    return time.perf_counter() - started
+
+
+async def main(args):
+    timeout = httpx.Timeout(args.timeout)
+    limits = httpx.Limits(max_connections=args.streams + 10)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=timeout, limits=limits) as client:
+        # Baseline: listing latency with no streams open.
+        stop = asyncio.Event()
+        baseline_task = asyncio.create_task(sample_listing(client, stop, args.interval))
+        await asyncio.sleep(args.baseline_seconds)
+        stop.set()
+        report("GET /projects/ (idle)", await baseline_task)
+
+        project_ids = []
+        for _ in range(args.streams):
+            response = await client.post("/projects/")
+            response.raise_for_status()
+            project_ids.append(response.json()["_id"])
+
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_listing(client, stop, args.interval))
+        chat_durations = await asyncio.gather(
+            *(run_chat(client, project_id, args.prompt) for project_id in project_ids),
+            return_exceptions=True,
+        )
+        stop.set()
+        report(f"GET /projects/ ({args.streams} chats streaming)", await sampler)
+
+        failures = [d for d in chat_durations if isinstance(d, Exception)]
+        report("chat stream duration", [d for d in chat_durations if not isinstance(d, Exception)])
+        if failures:
+            print(f"{len(failures)} chat streams failed, first error: {failures[0]!r}")
+
+        if not args.keep_projects:
+            for project_id in project_ids:
+                await client.delete(f"/projects/{project_id}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--streams", type=int, default=50)
+    parser.add_argument("--prompt", default="Let's build a todo app for small teams.")
+    parser.add_argument("--interval", type=float, default=0.05, help="Seconds between listing samples.")
+    parser.add_argument("--baseline-seconds", type=float, default=3.0)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--keep-projects", action="store_true")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,144 @@
+"""
+Load test for the main request flows against a running backend.
+
+Runs each scenario with a number of concurrent workers for a fixed duration
+and reports throughput and p50/p99 latency (for streams, also time to first
+byte). Start the backend with the fake model and in-memory database for
+repeatable numbers:
+
+    MODEL_BACKEND=fake MONGO_BACKEND=memory python run.py
+
+Usage:
+    python benchmarks/load_suite.py --base-url http://localhost:8000 --concurrency 20 --duration 15
+    python benchmarks/load_suite.py --scenarios chat,listing --json results.json
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from chat_load import percentile
+from samples import silent_wav
+
+SCENARIOS = ["listing", "chat", "transcribe", "prd"]
+
+
+async def timed_stream(client: httpx.AsyncClient, method: str, url: str, **kwargs) -> tuple[float, float]:
+    """
+    Returns (time to first byte, total time) for a streamed request.
+    """
+    started = time.perf_counter()
+    first_byte = None
+    async with client.stream(method, url, **kwargs) as response:
+        response.raise_for_status()
+        async for _ in response.aiter_bytes():
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+    total = time.perf_counter() - started
+    return (first_byte if first_byte is not None else total), total
+
+
+async def new_project(client: httpx.AsyncClient) -> str:
+    response = await client.post("/projects/")
+    response.raise_for_status()
+    return response.json()["_id"]
+
+
+async def run_request(client: httpx.AsyncClient, scenario: str, project_id: str, audio: bytes, counter: int) -> tuple[float, float]:
+    if scenario == "listing":
+        started = time.perf_counter()
+        response = await client.get("/projects/?limit=50")
+        response.raise_for_status()
+        elapsed = time.perf_counter() - started
+        return elapsed, elapsed
+    if scenario == "chat":
+        return await timed_stream(
+            client, "POST", f"/projects/{project_id}/chat",
+            json={"content": f"Requirement number {counter} for this project."},
+        )
+    if scenario == "transcribe":
+        started = time.perf_counter()
+        response = await client.post("/audio/transcribe/upload", content=audio, headers={"Content-Type": "audio/wav"})
+        response.raise_for_status()
+        elapsed = time.perf_counter() - started
+        return elapsed, elapsed
+    if scenario == "prd":
+        # A new chat turn first, so the PRD is generated rather than served from cache.
+        await timed_stream(client, "POST", f"/projects/{project_id}/chat", json={"content": f"Detail {counter}."})
+        return await timed_stream(client, "POST", f"/projects/{project_id}/generate-prd", json={"target": "Cursor"})
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+async def worker(client: httpx.AsyncClient, scenario: str, deadline: float, audio: bytes, results: dict):
+    project_id = await new_project(client)
+    counter = 0
+    while time.perf_counter() < deadline:
+        counter += 1
+        try:
+            first_byte, total = await run_request(client, scenario, project_id, audio, counter)
+        except Exception as e:
+            results["errors"].append(repr(e))
+            continue
+        results["first_byte"].append(first_byte)
+        results["total"].append(total)
+    await client.delete(f"/projects/{project_id}")
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: str, concurrency: int, duration: float, audio: bytes) -> dict:
+    results = {"first_byte": [], "total": [], "errors": []}
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(worker(client, scenario, deadline, audio, results) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    total = results["total"]
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(total),
+        "errors": len(results["errors"]),
+        "first_error": results["errors"][0] if results["errors"] else None,
+        "throughput_rps": len(total) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(total, 50) * 1000,
+        "p99_ms": percentile(total, 99) * 1000,
+        "ttfb_p50_ms": percentile(results["first_byte"], 50) * 1000,
+        "ttfb_p99_ms": percentile(results["first_byte"], 99) * 1000,
+    }
+
+
+def print_result(result: dict):
+    print(
+        f"{result['scenario']:>10}: {result['requests']:>6} req  {result['throughput_rps']:>8.1f} req/s  "
+        f"p50={result['p50_ms']:.1f}ms p99={result['p99_ms']:.1f}ms  "
+        f"ttfb p50={result['ttfb_p50_ms']:.1f}ms p99={result['ttfb_p99_ms']:.1f}ms  errors={result['errors']}"
+    )
+    if result["first_error"]:
+        print(f"{'':>12}first error: {result['first_error']}")
+
+
+async def main(args):
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    audio = silent_wav()
+    timeout = httpx.Timeout(args.timeout)
+    limits = httpx.Limits(max_connections=args.concurrency + 10)
+    results = []
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=timeout, limits=limits) as client:
+        for scenario in scenarios:
+            result = await run_scenario(client, scenario, args.concurrency, args.duration, audio)
+            print_result(result)
+            results.append(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"base_url": args.base_url, "duration": args.duration, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated, from: {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds per scenario.")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--json", help="Also write the results to this file.")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,123 @@
+"""
+Microbenchmark for the chat stream's SSE framing path.
+
+Feeds a synthetic stream of small model parts (mostly thoughts, then text)
+through three framings and reports parts/s, frames produced and MB/s:
+
+  legacy    json.dumps of a new dict per part, one frame per part, plus the
+            old 10 ms sleep per model chunk (only with --with-sleep)
+  encoded   app.services.sse.encode_part per part, one frame per part
+  buffered  app.services.sse.EventBuffer with coalescing, read by a consumer
+            that is always ready
+
+Runs in-process; no backend or model is needed.
+
+Usage:
+    python benchmarks/sse_framing.py --parts 200000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import sse  # noqa: E402
+
+
+def make_parts(count: int, seed: int) -> list[tuple[str, str]]:
+    rng = random.Random(seed)
+    words = ["requirement", "user", "should", "the", "system", "login", "é", "“quoted”", "\n", "data"]
+    parts = []
+    for i in range(count):
+        part_type = "thought" if i < count // 3 else "text"
+        parts.append((part_type, " ".join(rng.choice(words) for _ in range(rng.randint(1, 8)))))
+    return parts
+
+
+async def legacy(parts, parts_per_chunk: int, with_sleep: bool):
+    frames = 0
+    size = 0
+    full_text = ""
+    for i, (part_type, text) in enumerate(parts):
+        frame = f'data: {json.dumps({"type": part_type, "content": text})}\n\n'
+        full_text += text
+        frames += 1
+        size += len(frame.encode("utf-8"))
+        if with_sleep and i % parts_per_chunk == parts_per_chunk - 1:
+            await asyncio.sleep(0.01)
+    return frames, size
+
+
+async def encoded(parts):
+    frames = 0
+    size = 0
+    buffer = []
+    for part_type, text in parts:
+        frame = sse.encode_part(part_type, text)
+        buffer.append(text)
+        frames += 1
+        size += len(frame)
+    "".join(buffer)
+    return frames, size
+
+
+async def buffered(parts, parts_per_chunk: int):
+    events = sse.EventBuffer()
+
+    async def produce():
+        for i, (part_type, text) in enumerate(parts):
+            await events.send_part(part_type, text)
+            if i % parts_per_chunk == parts_per_chunk - 1:
+                # A model chunk boundary: let the consumer run.
+                await asyncio.sleep(0)
+        events.close()
+
+    producer = asyncio.create_task(produce())
+    frames = 0
+    size = 0
+    async for data in events.frames():
+        frames += data.count(b"\n\n")
+        size += len(data)
+    await producer
+    return frames, size
+
+
+def report(label: str, parts: int, elapsed: float, frames: int, size: int):
+    print(
+        f"{label:>8}: {parts / elapsed:>12,.0f} parts/s  "
+        f"{frames:>9,} frames  {size / elapsed / 1e6:>8.1f} MB/s  ({elapsed:.3f}s)"
+    )
+
+
+async def main(args):
+    parts = make_parts(args.parts, args.seed)
+    print(f"{args.parts:,} parts, {args.parts_per_chunk} per model chunk, orjson={'yes' if sse.orjson else 'no'}")
+
+    runs = [
+        ("legacy", lambda: legacy(parts, args.parts_per_chunk, args.with_sleep)),
+        ("encoded", lambda: encoded(parts)),
+        ("buffered", lambda: buffered(parts, args.parts_per_chunk)),
+    ]
+    for label, run in runs:
+        best = None
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            frames, size = await run()
+            elapsed = time.perf_counter() - started
+            if best is None or elapsed < best[0]:
+                best = (elapsed, frames, size)
+        report(label, args.parts, *best)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--parts", type=int, default=200_000)
+    parser.add_argument("--parts-per-chunk", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--with-sleep", action="store_true", help="Include the old 10 ms sleep per model chunk in the legacy run.")
+    asyncio.run(main(parser.parse_args()))
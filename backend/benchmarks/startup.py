@@ -0,0 +1,94 @@
+"""
+Cold start benchmark: time from launching the server process to its first
+successful response, and to readiness.
+
+Each run starts `uvicorn main:app` in a fresh process, polls `--path` until
+it answers 200, then `--ready-path` (skipped if the server has no such
+route), and stops the server. The environment is passed through, so
+compare configurations by setting MODEL_BACKEND, MONGO_BACKEND and so on.
+Point `--app-dir` at another checkout's backend/ to compare revisions.
+
+Usage (from backend/):
+    python benchmarks/startup.py --runs 5
+    MODEL_BACKEND=fake MONGO_BACKEND=memory python benchmarks/startup.py --app-dir /tmp/old/backend
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(client: httpx.Client, url: str, started: float, timeout: float) -> float | None:
+    """
+    Seconds from `started` until `url` answers 200, or None if it answers
+    404 (no such route) or the timeout passes.
+    """
+    while time.perf_counter() - started < timeout:
+        try:
+            response = client.get(url)
+            if response.status_code == 200:
+                return time.perf_counter() - started
+            if response.status_code == 404:
+                return None
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+    return None
+
+
+def run_once(app_dir: str, path: str, ready_path: str, timeout: float) -> dict:
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=app_dir,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1.0) as client:
+            first_response = wait_for(client, path, started, timeout)
+            ready = wait_for(client, ready_path, started, timeout) if first_response is not None else None
+    finally:
+        server.terminate()
+        server.wait()
+    return {"first_response": first_response, "ready": ready}
+
+
+def summarize(values: list) -> str:
+    values = [v for v in values if v is not None]
+    if not values:
+        return "n/a"
+    return f"median={statistics.median(values) * 1000:.0f}ms min={min(values) * 1000:.0f}ms max={max(values) * 1000:.0f}ms"
+
+
+def main(args):
+    runs = [run_once(args.app_dir, args.path, args.ready_path, args.timeout) for _ in range(args.runs)]
+    print(f"first response ({args.path}): {summarize([r['first_response'] for r in runs])}")
+    print(f"ready ({args.ready_path}): {summarize([r['ready'] for r in runs])}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"app_dir": args.app_dir, "runs": runs}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app-dir", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default="/")
+    parser.add_argument("--ready-path", default="/health/ready")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--json", help="Also write the results to this file.")
+    main(parser.parse_args())
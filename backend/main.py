@@ -1,15 +1,42 @@
+import asyncio
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import projects, audio
+from app.routers import projects, audio, metrics, profiles, health
+from app.profiling import PROFILING_ENABLED, ProfilingMiddleware
+from app.client import MODEL_CLIENT_RETRY_INTERVAL, is_client_ready, warm_up_client
 from app.database import connect_to_mongo, close_mongo_connection
+from app.services import jobs
+from app.services.audio import shutdown_audio_pool
+from app.services.project_service import run_migrations
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # The model client warms up in the background; /health/ready reports
+    # when it is done, and the first model call waits for it if need be.
+    warm_up = asyncio.create_task(_warm_up_model_client())
     await connect_to_mongo()
+    try:
+        await run_migrations()
+    except Exception as e:
+        print(f"Error migrating data: {e}")
+    jobs.start_workers()
     yield
+    warm_up.cancel()
+    await jobs.stop_workers()
+    shutdown_audio_pool()
     await close_mongo_connection()
 
+async def _warm_up_model_client():
+    # Retried until it succeeds, so the backend becomes ready once the
+    # credentials problem is fixed, without a restart.
+    while not is_client_ready():
+        try:
+            await warm_up_client()
+        except Exception as e:
+            print(f"Error warming up the model client: {e}")
+            await asyncio.sleep(MODEL_CLIENT_RETRY_INTERVAL)
+
 app = FastAPI(lifespan=lifespan)
 
 # CORS middleware
@@ -25,8 +52,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
 app.include_router(projects.router)
 app.include_router(audio.router)
+app.include_router(metrics.router)
+app.include_router(profiles.router)
+app.include_router(health.router)
 
 @app.get("/")
 def read_root():
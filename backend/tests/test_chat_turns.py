@@ -0,0 +1,125 @@
+"""
+Chat turns against the fake model backend and the in-memory database.
+
+Usage (from backend/):
+    pytest tests
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("MODEL_BACKEND", "fake")
+os.environ.setdefault("MONGO_BACKEND", "memory")
+os.environ.setdefault("BLOB_STORE_DIR", tempfile.mkdtemp(prefix="specdrafter-test-blobs-"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models import ChatRequest, ConversationEntry, Project  # noqa: E402
+from app.services import assistant, chat_streams, project_service  # noqa: E402
+from app.services.unit_of_work import ChatTurn  # noqa: E402
+
+
+async def _start_audio_turn(project_id: str):
+    turn = await ChatTurn.begin(project_id)
+    turn.add_entry(ConversationEntry(role="user", content="[audio input]", data={"mimeType": "audio/wav"}))
+    return assistant.stream_chat_response(turn, ChatRequest(), audio_bytes=b"RIFF", audio_mime_type="audio/wav")
+
+
+async def _wait_for_entries(project_id: str, count: int):
+    for _ in range(200):
+        entries = await project_service.get_conversation_entries(project_id)
+        if len(entries) >= count:
+            return entries
+        await asyncio.sleep(0.01)
+    return await project_service.get_conversation_entries(project_id)
+
+
+def test_cancel_during_transcription_saves_user_entry(monkeypatch):
+    monkeypatch.setattr(chat_streams, "CHAT_DISCONNECT_MODE", "cancel")
+
+    async def scenario():
+        transcribing = asyncio.Event()
+
+        async def slow_transcription(audio_bytes, mime_type):
+            transcribing.set()
+            await asyncio.sleep(60)
+
+        monkeypatch.setattr(assistant, "transcribe_audio_bytes", slow_transcription)
+        project = await project_service.create_project(Project())
+        project_id = str(project.id)
+
+        stream = await _start_audio_turn(project_id)
+        reader = asyncio.create_task(stream.__anext__())
+        await asyncio.wait_for(transcribing.wait(), 5)
+        # The client disconnects while the recording is being transcribed.
+        reader.cancel()
+        await asyncio.gather(reader, return_exceptions=True)
+
+        entries = await _wait_for_entries(project_id, 1)
+        assert [(entry.seq, entry.role, entry.content) for entry in entries] == [(0, "user", "[audio input]")]
+
+        # The next turn follows on directly.
+        turn = await ChatTurn.begin(project_id)
+        assert turn.history_length == 2
+
+    asyncio.run(scenario())
+
+
+def test_cancel_at_once_saves_user_entry(monkeypatch):
+    monkeypatch.setattr(chat_streams, "CHAT_DISCONNECT_MODE", "cancel")
+
+    async def scenario():
+        project = await project_service.create_project(Project())
+        project_id = str(project.id)
+
+        stream = await _start_audio_turn(project_id)
+        reader = asyncio.create_task(stream.__anext__())
+        await asyncio.sleep(0)
+        reader.cancel()
+        await asyncio.gather(reader, return_exceptions=True)
+
+        entries = await _wait_for_entries(project_id, 1)
+        assert entries[0].role == "user"
+        # Whatever reply was under way when the turn was cancelled is marked as cut off.
+        assert all(entry.data.get("interrupted") for entry in entries[1:])
+
+    asyncio.run(scenario())
+
+
+def test_failed_transcription_reports_error_and_saves_user_entry(monkeypatch):
+    async def failing_transcription(audio_bytes, mime_type):
+        raise RuntimeError("transcription failed")
+
+    monkeypatch.setattr(assistant, "transcribe_audio_bytes", failing_transcription)
+
+    async def scenario():
+        project = await project_service.create_project(Project())
+        project_id = str(project.id)
+
+        stream = await _start_audio_turn(project_id)
+        body = b"".join([data async for data in stream])
+        assert b'"type":"error"' in body.replace(b" ", b"")
+
+        entries = await project_service.get_conversation_entries(project_id)
+        assert [entry.role for entry in entries] == ["user"]
+
+    asyncio.run(scenario())
+
+
+def test_plain_turn_changes_project_version():
+    async def scenario():
+        project = await project_service.create_project(Project())
+        project_id = str(project.id)
+
+        turn = await ChatTurn.begin(project_id)
+        turn.add_entry(ConversationEntry(role="user", content="We need offline support."))
+        # What a client refreshing while the reply streams is told.
+        during = await project_service.get_project_version(project_id)
+        body = b"".join([data async for data in assistant.stream_chat_response(turn, ChatRequest(content="We need offline support."))])
+
+        after = await project_service.get_project_version(project_id)
+        assert after != during
+        # The turn's final event carries the version it left behind.
+        assert f'"version":"{after}"'.encode() in body.replace(b" ", b"")
+
+    asyncio.run(scenario())
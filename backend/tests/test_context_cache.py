@@ -0,0 +1,45 @@
+"""
+Chat context compaction against the fake model backend and the in-memory database.
+
+Usage (from backend/):
+    pytest tests
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("MODEL_BACKEND", "fake")
+os.environ.setdefault("MONGO_BACKEND", "memory")
+os.environ.setdefault("BLOB_STORE_DIR", tempfile.mkdtemp(prefix="specdrafter-test-blobs-"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models import ConversationEntry, Project, SpecPhase  # noqa: E402
+from app.services import context_cache, project_service  # noqa: E402
+
+
+def test_entries_without_a_phase_are_summarized(monkeypatch):
+    monkeypatch.setattr(context_cache, "CHAT_CONTEXT_MAX_TOKENS", 100)
+    monkeypatch.setattr(context_cache, "CHAT_CONTEXT_RECENT_TURNS", 2)
+
+    async def scenario():
+        # Migrated history carries no phase; only the last turns were written since.
+        history = [
+            ConversationEntry(role="user" if seq % 2 == 0 else "assistant", content=f"old message {seq} " * 20)
+            for seq in range(10)
+        ]
+        history += [
+            ConversationEntry(role="user" if seq % 2 == 0 else "assistant", content=f"new message {seq}", phase=SpecPhase.FEATURES)
+            for seq in range(4)
+        ]
+        project = await project_service.create_project(
+            Project(conversation_history=history, current_phase=SpecPhase.FEATURES)
+        )
+
+        contents = await context_cache.get_history_contents(project.id, len(history), SpecPhase.FEATURES)
+
+        assert len(contents) == 5
+        assert contents[0].parts[0].text.startswith("[Summary of the start of the conversation]")
+        assert [content.parts[0].text for content in contents[1:]] == [entry.content for entry in history[10:]]
+
+    asyncio.run(scenario())
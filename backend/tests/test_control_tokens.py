@@ -0,0 +1,91 @@
+"""
+The control token scanner, fed replies in every possible pair of chunks.
+
+Usage (from backend/):
+    pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.control_tokens import MAX_PROJECT_NAME_CHARS, ControlToken, ControlTokenScanner  # noqa: E402
+
+LONG_NAME = "x" * (MAX_PROJECT_NAME_CHARS + 1)
+
+# (reply text, segments expected once adjacent text segments are joined)
+CASES = [
+    ("plain text", ["plain text"]),
+    ("done [PHASE_COMPLETE]", ["done ", ControlToken("phase_complete")]),
+    ("[PHASE_COMPLETE] next", [ControlToken("phase_complete"), " next"]),
+    ('a [RENAME_PROJECT: "Todo App"] b', ["a ", ControlToken("rename", "Todo App"), " b"]),
+    ('[RENAME_PROJECT:"  Padded  " ]', [ControlToken("rename", "Padded")]),
+    (
+        '[RENAME_PROJECT: "One"][PHASE_COMPLETE]',
+        [ControlToken("rename", "One"), ControlToken("phase_complete")],
+    ),
+    ("a [link](url) and [PHASE] b", ["a [link](url) and [PHASE] b"]),
+    ("[[PHASE_COMPLETE]", ["[", ControlToken("phase_complete")]),
+    # A blank name is dropped along with its token.
+    ('a [RENAME_PROJECT: "   "] b', ["a  b"]),
+    # A name that is too long is not a token.
+    (f'[RENAME_PROJECT: "{LONG_NAME}"]', [f'[RENAME_PROJECT: "{LONG_NAME}"]']),
+    ('[RENAME_PROJECT: "split\nline"]', ['[RENAME_PROJECT: "split\nline"]']),
+    # Unfinished tokens at the end of the reply are flushed as text.
+    ("ends with [PHASE_COMP", ["ends with [PHASE_COMP"]),
+    ('ends with [RENAME_PROJECT: "Half', ['ends with [RENAME_PROJECT: "Half']),
+    ("ends with [", ["ends with ["]),
+]
+
+
+def _scan(chunks):
+    scanner = ControlTokenScanner()
+    segments = []
+    for chunk in chunks:
+        segments.extend(scanner.feed(chunk))
+    segments.extend(scanner.finish())
+    return segments
+
+
+def _joined(segments):
+    joined = []
+    for segment in segments:
+        if isinstance(segment, str) and joined and isinstance(joined[-1], str):
+            joined[-1] += segment
+        else:
+            joined.append(segment)
+    return joined
+
+
+@pytest.mark.parametrize("text,expected", CASES)
+def test_every_chunk_boundary(text, expected):
+    for split in range(len(text) + 1):
+        assert _joined(_scan([text[:split], text[split:]])) == expected, f"split at {split}"
+
+
+@pytest.mark.parametrize("text,expected", CASES)
+def test_one_character_at_a_time(text, expected):
+    assert _joined(_scan(list(text))) == expected
+
+
+@pytest.mark.parametrize("chunk,passed,held", [
+    ("hello [PHASE_COMP", ["hello "], "[PHASE_COMP"),
+    ("hello [RENAME_PROJECT:", ["hello "], "[RENAME_PROJECT:"),
+    ('hello [RENAME_PROJECT: "Na', ["hello "], '[RENAME_PROJECT: "Na'),
+    ("hello [", ["hello "], "["),
+    ("hello [not a token", ["hello [not a token"], ""),
+])
+def test_only_a_possible_token_is_held_back(chunk, passed, held):
+    scanner = ControlTokenScanner()
+    assert scanner.feed(chunk) == passed
+    assert scanner.finish() == ([held] if held else [])
+    assert scanner.finish() == []
+
+
+def test_held_text_is_completed_by_the_next_chunk():
+    scanner = ControlTokenScanner()
+    assert scanner.feed("a [PHASE_") == ["a "]
+    assert scanner.feed("COMPLETE] b") == [ControlToken("phase_complete"), " b"]
+    assert scanner.finish() == []
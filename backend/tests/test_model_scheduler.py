@@ -0,0 +1,182 @@
+"""
+Deduplication, prioritisation and retries in the model scheduler, against a
+scripted client.
+
+Usage (from backend/):
+    pytest tests
+"""
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.genai import errors  # noqa: E402
+from app.services import model_scheduler  # noqa: E402
+from app.services.model_scheduler import ModelScheduler  # noqa: E402
+
+
+class ScriptedModels:
+    """
+    Stands in for `client.aio.models`. Each call records its contents and
+    takes its behaviour from `script`, which is called with the call number.
+    """
+
+    def __init__(self, script=None):
+        self.calls = []
+        self.script = script or (lambda number: None)
+
+    async def generate_content(self, *, model, contents, config=None):
+        self.calls.append(contents)
+        outcome = self.script(len(self.calls))
+        if isinstance(outcome, Exception):
+            raise outcome
+        if outcome is not None:
+            await outcome
+        return f"reply to {contents}"
+
+    async def generate_content_stream(self, *, model, contents, config=None):
+        self.calls.append(contents)
+        outcome = self.script(len(self.calls))
+
+        async def stream():
+            yield "first"
+            if isinstance(outcome, Exception):
+                raise outcome
+            yield "second"
+
+        return stream()
+
+
+def _scheduler(models: ScriptedModels, max_concurrency: int = 8) -> ModelScheduler:
+    return ModelScheduler(SimpleNamespace(aio=SimpleNamespace(models=models)), max_concurrency=max_concurrency)
+
+
+def _unavailable() -> errors.APIError:
+    return errors.APIError(503, {"error": {"message": "busy", "status": "UNAVAILABLE"}})
+
+
+@pytest.fixture
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(model_scheduler, "MODEL_RETRY_BASE_DELAY", 0.0)
+    monkeypatch.setattr(model_scheduler, "MODEL_RETRY_ATTEMPTS", 3)
+
+
+def test_identical_calls_share_one_flight():
+    async def scenario():
+        release = asyncio.Event()
+        models = ScriptedModels(lambda number: release.wait())
+        scheduler = _scheduler(models)
+
+        shared = [
+            asyncio.create_task(scheduler.generate_content("summary", model="m", contents="a", dedupe=True))
+            for _ in range(3)
+        ]
+        other = asyncio.create_task(scheduler.generate_content("summary", model="m", contents="b", dedupe=True))
+        separate = asyncio.create_task(scheduler.generate_content("summary", model="m", contents="a"))
+        await asyncio.sleep(0.01)
+        release.set()
+
+        assert await asyncio.gather(*shared) == ["reply to a"] * 3
+        assert await other == "reply to b"
+        assert await separate == "reply to a"
+        assert sorted(models.calls) == ["a", "a", "b"]
+
+        # Once the flight has landed, the same call goes upstream again.
+        assert await scheduler.generate_content("summary", model="m", contents="a", dedupe=True) == "reply to a"
+        assert len(models.calls) == 4
+
+    asyncio.run(scenario())
+
+
+def test_a_cancelled_subscriber_does_not_cancel_the_others():
+    async def scenario():
+        release = asyncio.Event()
+        models = ScriptedModels(lambda number: release.wait())
+        scheduler = _scheduler(models)
+
+        first = asyncio.create_task(scheduler.generate_content("summary", model="m", contents="a", dedupe=True))
+        second = asyncio.create_task(scheduler.generate_content("summary", model="m", contents="a", dedupe=True))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.sleep(0.01)
+        release.set()
+
+        assert await second == "reply to a"
+        assert models.calls == ["a"]
+
+    asyncio.run(scenario())
+
+
+def test_interactive_calls_are_served_first():
+    async def scenario():
+        release = asyncio.Event()
+        models = ScriptedModels(lambda number: release.wait() if number == 1 else None)
+        scheduler = _scheduler(models, max_concurrency=1)
+
+        # Holds the only slot while the others queue.
+        holder = asyncio.create_task(scheduler.generate_content("prd", model="m", contents="holder"))
+        await asyncio.sleep(0.01)
+        queued = []
+        for endpoint, contents in [("prd", "batch 1"), ("review", "batch 2"), ("chat", "chat"), ("tts", "tts")]:
+            queued.append(asyncio.create_task(scheduler.generate_content(endpoint, model="m", contents=contents)))
+            await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(holder, *queued)
+
+        assert models.calls == ["holder", "chat", "tts", "batch 1", "batch 2"]
+
+    asyncio.run(scenario())
+
+
+def test_retryable_errors_are_retried_until_the_cutoff(no_retry_delay):
+    async def scenario():
+        models = ScriptedModels(lambda number: _unavailable())
+        scheduler = _scheduler(models)
+
+        with pytest.raises(errors.APIError):
+            await scheduler.generate_content("chat", model="m", contents="a")
+        assert len(models.calls) == 3
+
+    asyncio.run(scenario())
+
+
+def test_a_retry_that_succeeds_returns_its_result(no_retry_delay):
+    async def scenario():
+        models = ScriptedModels(lambda number: _unavailable() if number < 3 else None)
+        scheduler = _scheduler(models)
+
+        assert await scheduler.generate_content("chat", model="m", contents="a") == "reply to a"
+        assert len(models.calls) == 3
+
+    asyncio.run(scenario())
+
+
+def test_other_errors_are_not_retried(no_retry_delay):
+    async def scenario():
+        models = ScriptedModels(lambda number: errors.APIError(400, {"error": {"message": "bad", "status": "INVALID_ARGUMENT"}}))
+        scheduler = _scheduler(models)
+
+        with pytest.raises(errors.APIError):
+            await scheduler.generate_content("chat", model="m", contents="a")
+        assert len(models.calls) == 1
+
+    asyncio.run(scenario())
+
+
+def test_a_stream_is_not_retried_after_its_first_chunk(no_retry_delay):
+    async def scenario():
+        models = ScriptedModels(lambda number: _unavailable())
+        scheduler = _scheduler(models)
+
+        chunks = []
+        with pytest.raises(errors.APIError):
+            async for chunk in scheduler.generate_content_stream("chat", model="m", contents="a"):
+                chunks.append(chunk)
+        assert chunks == ["first"]
+        assert len(models.calls) == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,48 @@
+"""
+Stored request profiles against the in-memory database and a local blob store.
+
+Usage (from backend/):
+    pytest tests
+"""
+import asyncio
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("MODEL_BACKEND", "fake")
+os.environ.setdefault("MONGO_BACKEND", "memory")
+os.environ.setdefault("BLOB_STORE_DIR", tempfile.mkdtemp(prefix="specdrafter-test-blobs-"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import profiles  # noqa: E402
+from app.services.blob_store import blob_store, profile_blob_store  # noqa: E402
+
+
+def _stats(name: str) -> bytes:
+    return marshal.dumps({("app.py", 1, name): (1, 1, 0.1, 0.1, {})})
+
+
+def test_saving_a_profile_again_releases_the_old_blob():
+    async def scenario():
+        first, second = _stats("first"), _stats("second")
+        await profiles.save_profile("request-1", "GET", "/", 200, 0.1, "cprofile", first)
+        await profiles.save_profile("request-1", "GET", "/", 200, 0.2, "cprofile", second)
+
+        assert await profile_blob_store.get(hashlib.sha256(first).hexdigest()) is None
+        data, _, _ = await profiles.get_profile("request-1", "pstats")
+        assert data == second
+
+    asyncio.run(scenario())
+
+
+def test_profiles_are_not_in_the_recordings_store():
+    async def scenario():
+        data = _stats("private")
+        await profiles.save_profile("request-2", "GET", "/", 200, 0.1, "cprofile", data)
+
+        assert await blob_store.get(hashlib.sha256(data).hexdigest()) is None
+        assert await profile_blob_store.get(hashlib.sha256(data).hexdigest()) is not None
+
+    asyncio.run(scenario())
@@ -0,0 +1,154 @@
+"""
+Section-by-section requirements editing against the in-memory database, with
+the model's edit blocks scripted.
+
+Usage (from backend/):
+    pytest tests
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("MODEL_BACKEND", "fake")
+os.environ.setdefault("MONGO_BACKEND", "memory")
+os.environ.setdefault("BLOB_STORE_DIR", tempfile.mkdtemp(prefix="specdrafter-test-blobs-"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models import Project  # noqa: E402
+from app.services import assistant, project_service, requirements_editor  # noqa: E402
+from app.services.requirements_editor import SectionEdit, apply_edits, parse_edits, split_sections  # noqa: E402
+
+DOCUMENT = (
+    "Intro text.\n"
+    "# Overview\n"
+    "An app.\n"
+    "```\n"
+    "# not a heading\n"
+    "```\n"
+    "## Users\n"
+    "Admins.\n"
+    "## Scope\n"
+    "Everything.\n"
+)
+
+EDIT_OUTPUT = (
+    "<<<REPLACE 2>>>\n"
+    "## Users\n"
+    "Admins and guests.\n"
+    "<<<END>>>\n"
+    "<<<DELETE 3>>>\n"
+    "<<<INSERT AFTER -1>>>\n"
+    "# Title\n"
+    "<<<END>>>\n"
+    "<<<INSERT AFTER 3>>>\n"
+    "## Risks\n"
+    "None yet.\n"
+    "<<<END>>>\n"
+)
+
+EDITED = (
+    "# Title\n"
+    "Intro text.\n"
+    "# Overview\n"
+    "An app.\n"
+    "```\n"
+    "# not a heading\n"
+    "```\n"
+    "## Users\n"
+    "Admins and guests.\n"
+    "## Risks\n"
+    "None yet.\n"
+)
+
+
+def _events(chunks):
+    return [json.loads(chunk.decode()[len("data: "):]) for chunk in chunks]
+
+
+def _script_model(monkeypatch, output: str):
+    async def get_section_edit_stream(document_outline, sections, edit_instruction):
+        # Cut into small pieces so that blocks straddle chunks.
+        for start in range(0, len(output), 7):
+            yield output[start:start + 7]
+
+    monkeypatch.setattr(assistant, "get_section_edit_stream", get_section_edit_stream)
+
+
+def test_split_sections_round_trips():
+    sections = split_sections(DOCUMENT)
+    assert [(section.level, section.title) for section in sections] == [
+        (0, ""), (1, "Overview"), (2, "Users"), (2, "Scope"),
+    ]
+    assert "".join(section.text for section in sections) == DOCUMENT
+    assert apply_edits(sections, []) == DOCUMENT
+
+
+def test_parse_and_apply_edits():
+    edits, rest = parse_edits(EDIT_OUTPUT)
+    assert [(edit.op, edit.index) for edit in edits] == [
+        ("replace", 2), ("delete", 3), ("insert", -1), ("insert", 3),
+    ]
+    assert rest == "\n"
+    assert apply_edits(split_sections(DOCUMENT), edits) == EDITED
+
+
+def test_parse_edits_keeps_an_unfinished_block():
+    edits, rest = parse_edits("<<<DELETE 1>>>\n<<<REPLACE 2>>>\n## Users\nAdm")
+    assert edits == [SectionEdit("delete", 1)]
+    assert rest == "<<<REPLACE 2>>>\n## Users\nAdm"
+
+    edits, rest = parse_edits(rest + "ins.\n<<<END>>>")
+    assert edits == [SectionEdit("replace", 2, "## Users\nAdmins.\n")]
+    assert rest == ""
+
+
+def test_edit_stream_saves_the_edited_document(monkeypatch):
+    _script_model(monkeypatch, EDIT_OUTPUT)
+
+    async def scenario():
+        project = await project_service.create_project(Project(requirements={"content": DOCUMENT}))
+        events = _events([
+            chunk async for chunk in requirements_editor.edit_requirements_stream(project.id, DOCUMENT, "edit")
+        ])
+        assert [event["type"] for event in events] == ["section"] * 4 + ["done"]
+        assert events[-1]["changed"] == 4
+        saved = await project_service.get_project(project.id)
+        assert saved.requirements["content"] == EDITED
+
+    asyncio.run(scenario())
+
+
+def test_edits_to_missing_sections_are_ignored(monkeypatch):
+    _script_model(monkeypatch, "<<<REPLACE 9>>>\nNew.\n<<<END>>>\n<<<DELETE 4>>>\n<<<INSERT AFTER 7>>>\nNew.\n<<<END>>>\n")
+
+    async def scenario():
+        project = await project_service.create_project(Project(requirements={"content": DOCUMENT}))
+        events = _events([
+            chunk async for chunk in requirements_editor.edit_requirements_stream(project.id, DOCUMENT, "edit")
+        ])
+        assert events == [{"type": "done", "changed": 0}]
+        saved = await project_service.get_project(project.id)
+        assert saved.requirements["content"] == DOCUMENT
+
+    asyncio.run(scenario())
+
+
+def test_edit_is_not_saved_over_a_concurrent_change(monkeypatch):
+    _script_model(monkeypatch, EDIT_OUTPUT)
+
+    async def scenario():
+        project = await project_service.create_project(Project(requirements={"content": DOCUMENT}))
+        stream = requirements_editor.edit_requirements_stream(project.id, DOCUMENT, "edit")
+        events = [await stream.__anext__()]
+        # Someone else saves the document while the model is still writing.
+        await project_service.update_project(project.id, {"requirements": {"content": "Rewritten.\n"}})
+        events += [chunk async for chunk in stream]
+
+        events = _events(events)
+        assert events[-1]["type"] == "error"
+        saved = await project_service.get_project(project.id)
+        assert saved.requirements["content"] == "Rewritten.\n"
+
+    asyncio.run(scenario())
@@ -0,0 +1,92 @@
+"""
+The delta-compressed requirements history against the in-memory database.
+
+Usage (from backend/):
+    pytest tests
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+os.environ.setdefault("MODEL_BACKEND", "fake")
+os.environ.setdefault("MONGO_BACKEND", "memory")
+os.environ.setdefault("BLOB_STORE_DIR", tempfile.mkdtemp(prefix="specdrafter-test-blobs-"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId  # noqa: E402
+from app.services import requirements_versions  # noqa: E402
+from app.services.requirements_versions import apply_delta, compute_delta  # noqa: E402
+
+BASE = "".join(f"Requirement {n}.\n" for n in range(40))
+
+
+def _revision(n: int) -> str:
+    """
+    The document after `n` small edits, each touching a different line.
+    """
+    lines = BASE.splitlines(keepends=True)
+    for edit in range(n):
+        lines[edit % len(lines)] = f"Requirement {edit % len(lines)}, revised {edit}.\n"
+    return "".join(lines)
+
+
+@pytest.mark.parametrize("old,new", [
+    ("", ""),
+    ("", "a\nb\n"),
+    ("a\nb\n", ""),
+    ("a\nb\nc\n", "a\nB\nc\n"),
+    ("a\nb\nc\n", "x\na\nc\nd\n"),
+    ("no newline", "no newline\nnow two"),
+    ("a\r\nb\r\n", "a\r\nc\r\n"),
+    (BASE, _revision(7)),
+])
+def test_apply_delta_rebuilds_the_new_text(old, new):
+    assert apply_delta(old, compute_delta(old, new)) == new
+
+
+def test_identical_texts_have_an_empty_delta():
+    assert compute_delta(BASE, BASE) == []
+
+
+def test_every_version_is_rebuilt(monkeypatch):
+    monkeypatch.setattr(requirements_versions, "REQUIREMENTS_MAX_DELTA_CHAIN", 4)
+    monkeypatch.setattr(requirements_versions, "REQUIREMENTS_MAX_VERSIONS", 0)
+
+    async def scenario():
+        project_id = str(ObjectId())
+        for n in range(12):
+            assert await requirements_versions.record_version(project_id, _revision(n)) == n + 1
+        # Unchanged content is not a new version.
+        assert await requirements_versions.record_version(project_id, _revision(11)) is None
+
+        summaries = await requirements_versions.list_versions(project_id, limit=100)
+        kinds = [summary.kind for summary in reversed(summaries)]
+        assert kinds == ["snapshot", "delta", "delta", "delta", "delta", "snapshot"] + ["delta"] * 4 + ["snapshot", "delta"]
+        for n in range(12):
+            assert await requirements_versions.get_version_content(project_id, n + 1) == _revision(n)
+        assert await requirements_versions.get_version_content(project_id, 13) is None
+
+    asyncio.run(scenario())
+
+
+def test_pruned_history_still_rebuilds(monkeypatch):
+    monkeypatch.setattr(requirements_versions, "REQUIREMENTS_MAX_DELTA_CHAIN", 32)
+    monkeypatch.setattr(requirements_versions, "REQUIREMENTS_MAX_VERSIONS", 5)
+
+    async def scenario():
+        project_id = str(ObjectId())
+        for n in range(12):
+            await requirements_versions.record_version(project_id, _revision(n))
+
+        summaries = await requirements_versions.list_versions(project_id, limit=100)
+        assert [summary.version for summary in summaries] == [12, 11, 10, 9, 8]
+        # The oldest kept version was a delta against a dropped one.
+        assert summaries[-1].kind == "snapshot"
+        for n in range(7, 12):
+            assert await requirements_versions.get_version_content(project_id, n + 1) == _revision(n)
+        assert await requirements_versions.get_version_content(project_id, 7) is None
+
+    asyncio.run(scenario())
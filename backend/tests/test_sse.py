@@ -0,0 +1,135 @@
+"""
+Coalescing, backpressure and resumption in the SSE event buffer.
+
+Usage (from backend/):
+    pytest tests
+"""
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.sse import EventBuffer, ResumeUnavailable  # noqa: E402
+
+
+def _parse(data: bytes) -> list[tuple[str, dict]]:
+    """
+    Splits frames into (event id, payload) pairs.
+    """
+    events = []
+    for frame in data.decode().split("\n\n"):
+        if frame:
+            id_line, data_line = frame.split("\n")
+            events.append((id_line[len("id: "):], json.loads(data_line[len("data: "):])))
+    return events
+
+
+async def _read_all(buffer: EventBuffer, last_event_id: str | None = None) -> list[tuple[str, dict]]:
+    return _parse(b"".join([data async for data in buffer.frames(last_event_id)]))
+
+
+def test_parts_are_coalesced_until_another_event():
+    async def scenario():
+        buffer = EventBuffer("s", max_chars=100, max_delay=60)
+        await buffer.send_part("text", "Hel")
+        await buffer.send_part("text", "lo")
+        await buffer.send_part("thought", "hmm")
+        await buffer.send_part("text", "!")
+        await buffer.send_event({"type": "done"})
+        buffer.close()
+
+        assert await _read_all(buffer) == [
+            ("s.1", {"type": "text", "content": "Hello"}),
+            ("s.2", {"type": "thought", "content": "hmm"}),
+            ("s.3", {"type": "text", "content": "!"}),
+            ("s.4", {"type": "done"}),
+        ]
+
+    asyncio.run(scenario())
+
+
+def test_parts_are_flushed_at_the_size_limit():
+    async def scenario():
+        buffer = EventBuffer("s", max_chars=4, max_delay=60)
+        for text in ["ab", "cd", "ef", "g"]:
+            await buffer.send_part("text", text)
+        buffer.close()
+
+        assert [payload["content"] for _, payload in await _read_all(buffer)] == ["abcd", "efg"]
+
+    asyncio.run(scenario())
+
+
+def test_parts_are_flushed_after_the_delay():
+    async def scenario():
+        buffer = EventBuffer("s", max_chars=100, max_delay=0.01)
+        frames = buffer.frames()
+        await buffer.send_part("text", "slow")
+        # Nothing else is sent, and the stream stays open.
+        data = await asyncio.wait_for(frames.__anext__(), 1)
+        assert _parse(data) == [("s.1", {"type": "text", "content": "slow"})]
+        await frames.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_a_slow_reader_pauses_the_producer():
+    async def scenario():
+        buffer = EventBuffer("s", max_chars=1, high_water=100)
+        frames = buffer.frames()
+        await buffer.send_event({"n": 0})
+        await frames.__anext__()
+
+        # More than `high_water` bytes the reader has not taken yet.
+        send = asyncio.create_task(buffer.send_event({"n": 1, "padding": "x" * 200}))
+        for _ in range(5):
+            await asyncio.sleep(0)
+        assert not send.done()
+
+        assert [payload["n"] for _, payload in _parse(await frames.__anext__())] == [1]
+        await asyncio.wait_for(send, 1)
+        await frames.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_the_producer_is_not_paused_without_a_reader():
+    async def scenario():
+        buffer = EventBuffer("s", high_water=100)
+        for n in range(10):
+            await asyncio.wait_for(buffer.send_event({"n": n, "padding": "x" * 200}), 1)
+
+    asyncio.run(scenario())
+
+
+def test_resume_after_a_retained_event():
+    async def scenario():
+        buffer = EventBuffer("s", high_water=10, retain=40)
+        for n in range(3):
+            await buffer.send_event({"n": n})
+        buffer.close()
+
+        # Only the last event is retained.
+        assert await _read_all(buffer, "s.2") == [("s.3", {"n": 2})]
+        assert await _read_all(buffer, "s.3") == []
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("last_event_id", [None, "s.1", "other.2", "s.x", "s.9"])
+def test_resume_past_retain_is_refused(last_event_id):
+    async def scenario():
+        buffer = EventBuffer("s", high_water=10, retain=40)
+        for n in range(3):
+            await buffer.send_event({"n": n})
+
+        with pytest.raises(ResumeUnavailable):
+            buffer.check_resume(last_event_id)
+        with pytest.raises(ResumeUnavailable):
+            await buffer.frames(last_event_id).__anext__()
+
+    asyncio.run(scenario())
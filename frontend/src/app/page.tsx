@@ -5,7 +5,7 @@ import { AppSidebar } from "@/components/app-sidebar"
 import { Chat } from "@/components/chat"
 import { ProgressTracker } from "@/components/progress-tracker"
 import { getProjects, createProject, getProject, streamPrd } from "@/lib/api"
-import { Project } from "@/lib/types"
+import { ProjectSummary } from "@/lib/types"
 import { PHASE_UPDATE_EVENT } from "@/lib/events"
 import { ModeToggle } from "@/components/mode-toggle"
 import { SidebarProvider, SidebarInset, SidebarTrigger } from "@/components/ui/sidebar"
@@ -14,8 +14,8 @@ import { Button } from "@/components/ui/button"
 import { PrdViewer } from "@/components/prd-viewer"
 
 export default function Home() {
-  const [projects, setProjects] = React.useState<Project[]>([]);
-  const [activeProject, setActiveProject] = React.useState<Project | null>(null);
+  const [projects, setProjects] = React.useState<ProjectSummary[]>([]);
+  const [activeProject, setActiveProject] = React.useState<ProjectSummary | null>(null);
   const [isCreatingProject, setIsCreatingProject] = React.useState(false);
   const [isPrdViewerOpen, setIsPrdViewerOpen] = React.useState(false);
   const [generatedPrdContent, setGeneratedPrdContent] = React.useState("");
@@ -4,7 +4,7 @@ import * as React from "react"
 import { Sidebar, SidebarHeader, SidebarContent, SidebarFooter } from "./ui/sidebar"
 import { Button } from "./ui/button"
 import { Plus, Trash2, Edit } from "lucide-react"
-import { Project } from "@/lib/types"
+import { ProjectSummary } from "@/lib/types"
 import { getProjects, createProject, deleteProject, updateProject } from "@/lib/api"
 import {
   Dialog,
@@ -19,9 +19,9 @@ import { Label } from "@/components/ui/label"
 import { PHASE_UPDATE_EVENT } from "@/lib/events";
 
 interface AppSidebarProps extends React.ComponentProps<typeof Sidebar> {
-    projects: Project[];
-    activeProject: Project | null;
-    setActiveProject: (project: Project | null) => void;
+    projects: ProjectSummary[];
+    activeProject: ProjectSummary | null;
+    setActiveProject: (project: ProjectSummary | null) => void;
     onCreateProject: () => void;
     onProjectsUpdate: (newProjectId?: string) => void;
     isCreatingProject: boolean;
@@ -30,7 +30,7 @@ interface AppSidebarProps extends React.ComponentProps<typeof Sidebar> {
 export function AppSidebar({ projects, activeProject, setActiveProject, onCreateProject, onProjectsUpdate, isCreatingProject, ...props }: AppSidebarProps) {
     const [isDeleteDialogOpen, setIsDeleteDialogOpen] = React.useState(false);
     const [isRenameDialogOpen, setIsRenameDialogOpen] = React.useState(false);
-    const [projectToEdit, setProjectToEdit] = React.useState<Project | null>(null);
+    const [projectToEdit, setProjectToEdit] = React.useState<ProjectSummary | null>(null);
     const [newProjectName, setNewProjectName] = React.useState("");
 
     const handleProjectsUpdate = React.useCallback(() => {
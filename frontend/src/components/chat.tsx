@@ -5,10 +5,12 @@ import { Button } from "@/components/ui/button"
 import { Textarea } from "@/components/ui/textarea"
 import { ScrollArea, ScrollBar } from "@/components/ui/scroll-area"
 import { Bot, Mic, Send, User, Volume2, Square } from "lucide-react"
-import { Project } from "@/lib/types"
+import { ConversationPage, ProjectSummary } from "@/lib/types"
 import {
+  getConversation,
   streamChat,
-  textToSpeech,
+  playSpeech,
+  SpeechPlayback,
   transcribeAudio,
   Message as ApiMessage,
   StreamChunk,
@@ -22,7 +24,7 @@ import { ChevronsUpDown } from "lucide-react";
 type Message = ApiMessage;
 
 interface ChatProps {
-    activeProject: Project | null;
+    activeProject: ProjectSummary | null;
     onProjectsUpdate: (newProjectId?: string) => void;
 }
 
@@ -37,19 +39,57 @@ export function Chat({ activeProject, onProjectsUpdate }: ChatProps) {
   const mediaRecorderRef = React.useRef<MediaRecorder | null>(null);
   const audioChunksRef = React.useRef<Blob[]>([]);
   const audioPlayerRef = React.useRef<HTMLAudioElement>(null);
+  const speechRef = React.useRef<SpeechPlayback | null>(null);
   const viewportRef = React.useRef<HTMLDivElement>(null);
+  // Cursor for the page of messages before the oldest one shown, if any.
+  const [earlierCursor, setEarlierCursor] = React.useState<number | null>(null);
+  const [isLoadingEarlier, setIsLoadingEarlier] = React.useState(false);
+  // Set while older messages are prepended, so the view is not scrolled to the bottom.
+  const keepScrollRef = React.useRef(false);
+
+  const toMessages = (page: ConversationPage): Message[] =>
+      page.entries.map(entry => ({
+          role: entry.role === 'assistant' ? 'assistant' : 'user',
+          content: entry.content,
+          data: entry.data
+      }));
 
   React.useEffect(() => {
-      if (activeProject) {
-          setMessages(activeProject.conversation_history.map(entry => ({
-              role: entry.role === 'assistant' ? 'assistant' : 'user',
-              content: entry.content,
-              data: entry.data
-          })));
+      if (!activeProject) return;
+      let cancelled = false;
+      setEarlierCursor(null);
+      getConversation(activeProject._id)
+          .then(page => {
+              if (cancelled) return;
+              setMessages(toMessages(page));
+              setEarlierCursor(page.has_more ? page.next_cursor : null);
+          })
+          .catch(error => console.error("Failed to load conversation:", error));
+      return () => {
+          cancelled = true;
+      };
+  }, [activeProject?._id]);
+
+  const loadEarlierMessages = async () => {
+      if (!activeProject || earlierCursor === null || isLoadingEarlier) return;
+      setIsLoadingEarlier(true);
+      try {
+          const page = await getConversation(activeProject._id, earlierCursor);
+          keepScrollRef.current = true;
+          setMessages(prev => [...toMessages(page), ...prev]);
+          setEarlierCursor(page.has_more ? page.next_cursor : null);
+      } catch (error) {
+          console.error("Failed to load earlier messages:", error);
+      } finally {
+          setIsLoadingEarlier(false);
       }
-  }, [activeProject]);
+  };
 
   React.useEffect(() => {
+    if (keepScrollRef.current) {
+        keepScrollRef.current = false;
+        return;
+    }
     if (viewportRef.current) {
         viewportRef.current.scrollTop = viewportRef.current.scrollHeight;
     }
@@ -69,62 +109,40 @@ export function Chat({ activeProject, onProjectsUpdate }: ChatProps) {
     }
   };
   
-  const handlePlayText = (message: Message): Promise<void> => {
-    return new Promise(async (resolve, reject) => {
-      if (currentPlayingMessage === message.content) {
-        if (audioPlayerRef.current) {
-          audioPlayerRef.current.pause();
-          audioPlayerRef.current.currentTime = 0;
-        }
-        setIsPlaying(false);
-        setCurrentPlayingMessage(null);
-        setIsLoading(false);
-        resolve();
-        return;
-      }
-
-      setCurrentPlayingMessage(message.content);
-      setIsLoading(true);
-
-      try {
-        const audioBase64 = await textToSpeech(message.content);
-        const audioBytes = Uint8Array.from(atob(audioBase64), c => c.charCodeAt(0));
-        const audioBlob = new Blob([audioBytes], { type: 'audio/wav' });
-
-        if (audioPlayerRef.current) {
-          const url = URL.createObjectURL(audioBlob);
-          audioPlayerRef.current.src = url;
-          audioPlayerRef.current.play();
-          setIsPlaying(true);
-          
-          audioPlayerRef.current.onended = () => {
-            setIsPlaying(false);
-            setCurrentPlayingMessage(null);
-            URL.revokeObjectURL(url);
-            setIsLoading(false);
-            resolve();
-          };
+  const handlePlayText = async (message: Message): Promise<void> => {
+    if (currentPlayingMessage === message.content) {
+      speechRef.current?.stop();
+      speechRef.current = null;
+      setIsPlaying(false);
+      setCurrentPlayingMessage(null);
+      setIsLoading(false);
+      return;
+    }
 
-          audioPlayerRef.current.onerror = (e) => {
-            setIsPlaying(false);
-            setCurrentPlayingMessage(null);
-            URL.revokeObjectURL(url);
-            setIsLoading(false);
-            console.error("Audio playback error:", e);
-            reject(e);
-          };
+    speechRef.current?.stop();
+    speechRef.current = null;
+    setCurrentPlayingMessage(message.content);
+    setIsLoading(true);
 
-        } else {
-          setIsLoading(false);
-          reject(new Error("Audio player is not available."));
-        }
-      } catch (error) {
-        console.error("Failed to play audio:", error);
+    let speech: SpeechPlayback | null = null;
+    try {
+      // Playback starts with the first synthesized sentence.
+      speech = await playSpeech(message.content);
+      speechRef.current = speech;
+      setIsPlaying(true);
+      await speech.finished;
+    } catch (error) {
+      console.error("Failed to play audio:", error);
+      throw error;
+    } finally {
+      // Reset, unless another message has started playing since.
+      if (speechRef.current === speech) {
+        speechRef.current = null;
+        setIsPlaying(false);
         setCurrentPlayingMessage(null);
         setIsLoading(false);
-        reject(error);
       }
-    });
+    }
   };
 
   const startRecording = async () => {
@@ -147,33 +165,27 @@ export function Chat({ activeProject, onProjectsUpdate }: ChatProps) {
     if (mediaRecorderRef.current) {
       mediaRecorderRef.current.onstop = async () => {
         const audioBlob = new Blob(audioChunksRef.current, { type: 'audio/webm' });
-        const reader = new FileReader();
-        reader.readAsDataURL(audioBlob);
-        reader.onloadend = async () => {
-          const base64data = reader.result as string;
-          const audioBase64 = base64data.split(',')[1];
-          
-          const tempUserMessage: Message = { role: "user", content: "[Transcribing...]" };
-          const messagesWithTemp = [...messages, tempUserMessage];
-          setMessages(messagesWithTemp);
-          
-          try {
-            const transcript = await transcribeAudio(audioBase64, 'audio/webm');
-            
-            const finalMessages = messagesWithTemp.map(msg => 
-                msg.content === "[Transcribing...]" ? { ...msg, content: transcript } : msg
-            );
-            setMessages(finalMessages);
-            handleSendMessage(finalMessages, true);
-
-          } catch (error) {
-              console.error("Transcription failed:", error);
-              setMessages(prev => prev.map(msg => 
-                  msg.content === "[Transcribing...]" ? { ...msg, content: "[Transcription Failed]" } : msg
-              ));
-          }
-        };
         mediaRecorderRef.current?.stream.getTracks().forEach(track => track.stop());
+
+        const tempUserMessage: Message = { role: "user", content: "[Transcribing...]" };
+        const messagesWithTemp = [...messages, tempUserMessage];
+        setMessages(messagesWithTemp);
+
+        try {
+          const transcript = await transcribeAudio(audioBlob);
+
+          const finalMessages = messagesWithTemp.map(msg =>
+              msg.content === "[Transcribing...]" ? { ...msg, content: transcript } : msg
+          );
+          setMessages(finalMessages);
+          handleSendMessage(finalMessages, true);
+
+        } catch (error) {
+            console.error("Transcription failed:", error);
+            setMessages(prev => prev.map(msg =>
+                msg.content === "[Transcribing...]" ? { ...msg, content: "[Transcription Failed]" } : msg
+            ));
+        }
       };
       mediaRecorderRef.current.stop();
       setIsRecording(false);
@@ -202,19 +214,14 @@ export function Chat({ activeProject, onProjectsUpdate }: ChatProps) {
 
     await streamChat(
       activeProject._id,
-      messagesToSubmit, // Send the clean history to the backend
+      messagesToSubmit[messagesToSubmit.length - 1], // Only the new turn; history lives on the server
       (chunk: StreamChunk) => {
         const event = chunk as any; // Bypass type-checking for the new event
-        if (event.type === 'project_update' && event.project) {
-            // The stream is complete, and we have the final, persisted project state.
-            // Update the messages with the definitive conversation history from the server.
-            setMessages(event.project.conversation_history.map((entry: any) => ({
-                role: entry.role === 'assistant' ? 'assistant' : 'user',
-                content: entry.content,
-                data: entry.data
-            })));
-            // Also trigger a refresh for other components that depend on project data.
-            onProjectsUpdate(event.project._id);
+        if (event.type === 'project_update' && event.project_id) {
+            // The stream is complete and the turn has been persisted. The
+            // streamed messages are already on screen, so only refresh the
+            // components that depend on project metadata.
+            onProjectsUpdate(event.project_id);
             return; // End of this response stream
         }
 
@@ -296,6 +303,17 @@ export function Chat({ activeProject, onProjectsUpdate }: ChatProps) {
         <ScrollArea className="flex-1" viewportRef={viewportRef}>
             <div className="p-4">
                 <div className="flex flex-col gap-6 w-full">
+                {earlierCursor !== null && (
+                    <Button
+                        variant="ghost"
+                        size="sm"
+                        className="self-center"
+                        onClick={loadEarlierMessages}
+                        disabled={isLoadingEarlier}
+                    >
+                        {isLoadingEarlier ? "Loading..." : "Load earlier messages"}
+                    </Button>
+                )}
                 {messages.map((message, index) => (
                     <div
                     key={index}
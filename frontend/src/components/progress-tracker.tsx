@@ -1,7 +1,7 @@
 "use client"
 
 import * as React from "react"
-import { Project } from "@/lib/types";
+import { ProjectSummary } from "@/lib/types";
 import { CheckCircle2, CircleDot, Circle, ChevronRight } from "lucide-react";
 
 const phases = [
@@ -14,7 +14,7 @@ const phases = [
 ];
 
 interface ProgressTrackerProps {
-  activeProject: Project | null;
+  activeProject: ProjectSummary | null;
 }
 
 export function ProgressTracker({ activeProject }: ProgressTrackerProps) {
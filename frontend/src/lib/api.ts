@@ -1,4 +1,4 @@
-import { Project } from "./types";
+import { Project, ProjectSummary, ConversationPage, ProjectUpdate } from "./types";
 import { dispatchPhaseUpdate } from "./events";
 
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
@@ -11,7 +11,19 @@ export async function getProject(projectId: string): Promise<Project> {
   return response.json();
 }
 
-export async function getProjects(): Promise<Project[]> {
+export async function getConversation(projectId: string, before?: number, limit: number = 200): Promise<ConversationPage> {
+  const params = new URLSearchParams({ limit: String(limit) });
+  if (before !== undefined) {
+    params.set("before", String(before));
+  }
+  const response = await fetch(`${API_BASE_URL}/projects/${projectId}/conversation?${params}`);
+  if (!response.ok) {
+    throw new Error("Failed to fetch conversation.");
+  }
+  return response.json();
+}
+
+export async function getProjects(): Promise<ProjectSummary[]> {
     const response = await fetch(`${API_BASE_URL}/projects/`);
     if (!response.ok) {
         throw new Error("Failed to fetch projects");
@@ -123,22 +135,30 @@ export interface Message {
 }
 
 export type StreamChunk = {
-    type: 'thought' | 'text' | 'phase_complete';
+    type: 'thought' | 'text' | 'phase_complete' | 'error';
     content?: string;
+    detail?: string;
 }
 
+// A failure the server reported in the stream; resuming would not help.
+class ChatStreamError extends Error {}
+
+// Times a chat stream is resumed after its connection drops mid-turn.
+const CHAT_RESUME_ATTEMPTS = 3;
+
 export async function streamChat(
   projectId: string,
-  messages: { role: "user" | "assistant"; content: string; data?: any }[],
+  message: { content: string; data?: any },
   onChunk: (chunk: StreamChunk) => void,
-  onDone?: (project: Project) => void,
+  onDone?: (update: ProjectUpdate | null) => void,
   onError?: (error: string) => void
 ) {
   try {
-    const response = await fetch(`${API_BASE_URL}/projects/${projectId}/chat`, {
+    let response = await fetch(`${API_BASE_URL}/projects/${projectId}/chat`, {
       method: "POST",
       headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ messages }),
+      // Only the new turn is sent; the server keeps the conversation history.
+      body: JSON.stringify({ content: message.content, data: message.data }),
     });
 
     if (!response.ok || !response.body) {
@@ -146,43 +166,35 @@ export async function streamChat(
       throw new Error(errorData.detail || "Failed to start chat stream.");
     }
 
-    const reader = response.body.getReader();
-    const decoder = new TextDecoder();
-    let buffer = "";
+    // The id of the last event received, sent as Last-Event-ID to resume
+    // the turn where it left off if the connection drops.
+    let lastEventId = null as string | null;
+    let attempts = 0;
+    // The turn's final event describes what changed, so the project does
+    // not have to be fetched again.
+    let update = null as ProjectUpdate | null;
+    const onEvent = (chunk: StreamChunk) => {
+      if ((chunk as any).type === 'project_update') update = chunk as unknown as ProjectUpdate;
+      onChunk(chunk);
+    };
 
     while (true) {
-      const { done, value } = await reader.read();
-      if (done) {
+      try {
+        await readChatEvents(response, onEvent, (id) => { lastEventId = id; });
         break;
-      }
-
-      buffer += decoder.decode(value, { stream: true });
-      const lines = buffer.split('\n\n');
-      buffer = lines.pop() || ''; // Keep the last partial line
-
-      for (const line of lines) {
-        if (line.startsWith('data: ')) {
-          try {
-            const json = JSON.parse(line.substring(6));
-            onChunk(json as StreamChunk);
-            if (json.type === 'phase_complete') {
-                dispatchPhaseUpdate();
-            }
-          } catch (e) {
-            console.error("Failed to parse stream chunk:", line);
-          }
-        }
+      } catch (error) {
+        if (error instanceof ChatStreamError || !lastEventId || attempts >= CHAT_RESUME_ATTEMPTS) throw error;
+        attempts += 1;
+        await new Promise((resolve) => setTimeout(resolve, 500 * attempts));
+        const resumed = await fetch(`${API_BASE_URL}/projects/${projectId}/chat/stream`, {
+          headers: { "Last-Event-ID": lastEventId },
+        }).catch(() => null);
+        if (!resumed || !resumed.ok || !resumed.body) throw error;
+        response = resumed;
       }
     }
 
-    if (onDone) {
-      try {
-        const finalProject = await getProject(projectId);
-        onDone(finalProject);
-      } catch (e) {
-        if (onError) onError("Failed to get final project state.");
-      }
-    }
+    if (onDone) onDone(update);
   } catch (error: any) {
     if (onError) {
       onError(error.message || "An unknown error occurred.");
@@ -192,11 +204,59 @@ export async function streamChat(
   }
 }
 
-export async function transcribeAudio(audioBase64: string, mimeType: string): Promise<string> {
-    const response = await fetch(`${API_BASE_URL}/audio/transcribe`, {
+async function readChatEvents(
+  response: Response,
+  onChunk: (chunk: StreamChunk) => void,
+  onEventId: (id: string) => void
+) {
+  const reader = response.body!.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) {
+      break;
+    }
+
+    buffer += decoder.decode(value, { stream: true });
+    const events = buffer.split('\n\n');
+    buffer = events.pop() || ''; // Keep the last partial event
+
+    for (const event of events) {
+      let id: string | null = null;
+      let data: string | null = null;
+      for (const line of event.split('\n')) {
+        if (line.startsWith('id: ')) id = line.substring(4);
+        else if (line.startsWith('data: ')) data = line.substring(6);
+      }
+      if (id !== null) onEventId(id);
+      if (data !== null) {
+        let json: any;
+        try {
+          json = JSON.parse(data);
+        } catch (e) {
+          console.error("Failed to parse stream chunk:", event);
+          continue;
+        }
+        if (json.type === 'error') {
+          throw new ChatStreamError(json.detail || "The chat turn failed.");
+        }
+        onChunk(json as StreamChunk);
+        if (json.type === 'phase_complete') {
+            dispatchPhaseUpdate();
+        }
+      }
+    }
+  }
+}
+
+export async function transcribeAudio(audio: Blob): Promise<string> {
+    // The recording is sent as the raw request body; no base64 round-trip.
+    const response = await fetch(`${API_BASE_URL}/audio/transcribe/upload`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ audio: audioBase64, mime_type: mimeType }),
+        headers: { 'Content-Type': audio.type || 'audio/webm' },
+        body: audio,
     });
 
     if (!response.ok) {
@@ -208,18 +268,105 @@ export async function transcribeAudio(audioBase64: string, mimeType: string): Pr
     return data.transcript;
 }
 
-export async function textToSpeech(text: string): Promise<string> {
-  const response = await fetch(`${API_BASE_URL}/audio/text-to-speech`, {
+// Size of the WAV header the speech stream starts with; 16-bit mono PCM follows.
+const WAV_HEADER_BYTES = 44;
+// Seconds of lead time given to the first scheduled chunk.
+const SPEECH_START_DELAY = 0.05;
+
+export interface SpeechPlayback {
+  // Resolves when playback ends or is stopped; rejects if synthesis fails.
+  finished: Promise<void>;
+  stop: () => void;
+}
+
+export async function playSpeech(text: string): Promise<SpeechPlayback> {
+  // Binary WAV response, played as it arrives: each chunk of PCM is
+  // scheduled on an AudioContext, so the first sentence plays while the
+  // rest is still being synthesized.
+  const response = await fetch(`${API_BASE_URL}/audio/text-to-speech/stream`, {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify({ text }),
   });
 
-  if (!response.ok) {
+  if (!response.ok || !response.body) {
     const errorText = await response.text();
     throw new Error(`Text-to-speech failed: ${errorText}`);
   }
 
-  const data = await response.json();
-  return data.audio_content;
-} 
\ No newline at end of file
+  const reader = response.body.getReader();
+  let context: AudioContext | null = null;
+  let stopped = false;
+  // Ends the wait for the last chunk to finish playing.
+  let onStop = () => {};
+
+  const stop = () => {
+    stopped = true;
+    onStop();
+    reader.cancel().catch(() => {});
+    context?.close().catch(() => {});
+  };
+
+  const play = async () => {
+    let pending = new Uint8Array(0);
+    let headerRead = false;
+    let nextStart = 0;
+    let lastSource: AudioBufferSourceNode | null = null;
+
+    while (!stopped) {
+      const { done, value } = await reader.read();
+      if (done || stopped) break;
+
+      const joined = new Uint8Array(pending.length + value.length);
+      joined.set(pending);
+      joined.set(value, pending.length);
+      pending = joined;
+
+      if (!headerRead) {
+        if (pending.length < WAV_HEADER_BYTES) continue;
+        const sampleRate = new DataView(pending.buffer, pending.byteOffset).getUint32(24, true);
+        context = new AudioContext({ sampleRate });
+        await context.resume();
+        nextStart = context.currentTime + SPEECH_START_DELAY;
+        pending = pending.slice(WAV_HEADER_BYTES);
+        headerRead = true;
+      }
+
+      // Whole 16-bit samples only; an odd trailing byte waits for the next read.
+      const sampleCount = Math.floor(pending.length / 2);
+      if (sampleCount === 0 || !context) continue;
+      const pcm = new DataView(pending.buffer, pending.byteOffset, sampleCount * 2);
+      const buffer = context.createBuffer(1, sampleCount, context.sampleRate);
+      const channel = buffer.getChannelData(0);
+      for (let i = 0; i < sampleCount; i++) {
+        channel[i] = pcm.getInt16(i * 2, true) / 32768;
+      }
+      pending = pending.slice(sampleCount * 2);
+
+      const source = context.createBufferSource();
+      source.buffer = buffer;
+      source.connect(context.destination);
+      nextStart = Math.max(nextStart, context.currentTime);
+      source.start(nextStart);
+      nextStart += buffer.duration;
+      lastSource = source;
+    }
+
+    if (lastSource && !stopped) {
+      const source = lastSource;
+      await new Promise<void>((resolve) => {
+        source.onended = () => resolve();
+        onStop = resolve;
+      });
+    }
+    context?.close().catch(() => {});
+  };
+
+  const finished = play().catch((error) => {
+    // A stream that was stopped on purpose is not a failure.
+    const wasStopped = stopped;
+    stop();
+    if (!wasStopped) throw error;
+  });
+  return { finished, stop };
+}
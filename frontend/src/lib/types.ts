@@ -1,4 +1,5 @@
 export interface ConversationEntry {
+  seq?: number;
   role: string;
   content: string;
   data?: {
@@ -8,6 +9,12 @@ export interface ConversationEntry {
   timestamp: string;
 }
 
+export interface ConversationPage {
+  entries: ConversationEntry[];
+  has_more: boolean;
+  next_cursor: number | null;
+}
+
 export interface RequirementsVersion {
   version: string;
   content: string;
@@ -22,17 +29,31 @@ export type SpecPhase =
   | "Technical Context"
   | "Completed";
 
-export interface Project {
+// What a chat turn changed, sent as its final "project_update" event.
+export interface ProjectUpdate {
+  project_id: string;
+  version: string;
+  updatedAt: string;
+  entries: { seq: number; role: string }[];
+  current_phase?: string;
+  name?: string;
+}
+
+export interface ProjectSummary {
   _id: string;
   name: string;
+  current_phase: string;
+  createdAt: string;
+  updatedAt: string;
+}
+
+export interface Project extends ProjectSummary {
   description: string;
   conversation_history: {
     role: "user" | "assistant";
     content: string;
     data?: any;
   }[];
-  current_phase: string;
+  conversation_length: number;
   requirements: any;
-  createdAt: string;
-  updatedAt: string;
 } 
\ No newline at end of file